@@ -0,0 +1,28 @@
+"""Add total_logs counter to habits
+
+Revision ID: 3b7f1c9d2a41
+Revises: e96330355a2d
+Create Date: 2026-10-18 09:12:04.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '3b7f1c9d2a41'
+down_revision = 'e96330355a2d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('habits', sa.Column('total_logs', sa.Integer(), nullable=True, server_default='0'))
+    # Backfill so incremental stats start from the real log count
+    op.execute(
+        "UPDATE habits SET total_logs = "
+        "(SELECT COUNT(*) FROM habit_logs WHERE habit_logs.habit_id = habits.id)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('habits', 'total_logs')
@@ -0,0 +1,49 @@
+"""Add user_daily_rollups
+
+Revision ID: 7c4e2a9f5b13
+Revises: 3b7f1c9d2a41
+Create Date: 2026-10-18 11:40:27.905113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = '7c4e2a9f5b13'
+down_revision = '3b7f1c9d2a41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'user_daily_rollups',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('done_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('skipped_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('missed_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('xp_earned', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('total_habits', sa.Integer(), nullable=True),
+        sa.Column('active_habits', sa.Integer(), nullable=True),
+        sa.Column('at_risk_habits', sa.Integer(), nullable=True),
+        sa.Column('total_streak', sa.Integer(), nullable=True),
+        sa.Column('consistency_total', sa.Float(), nullable=True),
+        sa.Column('snapshot_at', sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('user_id', 'day')
+    )
+    # Backfill log counts; habit snapshots are filled in on first read
+    op.execute(
+        "INSERT INTO user_daily_rollups (user_id, day, done_count, skipped_count, missed_count) "
+        "SELECT habits.user_id, habit_logs.log_date, "
+        "COUNT(*) FILTER (WHERE habit_logs.status = 'DONE'), "
+        "COUNT(*) FILTER (WHERE habit_logs.status = 'SKIPPED'), "
+        "COUNT(*) FILTER (WHERE habit_logs.status = 'MISSED') "
+        "FROM habit_logs JOIN habits ON habits.id = habit_logs.habit_id "
+        "GROUP BY habits.user_id, habit_logs.log_date"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('user_daily_rollups')
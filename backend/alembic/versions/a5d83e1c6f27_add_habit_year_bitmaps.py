@@ -0,0 +1,34 @@
+"""Add habit_year_bitmaps
+
+Revision ID: a5d83e1c6f27
+Revises: 7c4e2a9f5b13
+Create Date: 2026-10-18 14:05:51.226418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'a5d83e1c6f27'
+down_revision = '7c4e2a9f5b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Rows are built lazily from habit_logs on first write, or up front by
+    # the rebuild_habit_bitmaps Celery task
+    op.create_table(
+        'habit_year_bitmaps',
+        sa.Column('habit_id', sa.Integer(), nullable=False),
+        sa.Column('year', sa.Integer(), nullable=False),
+        sa.Column('done_bits', sa.LargeBinary(length=46), nullable=False),
+        sa.Column('skipped_bits', sa.LargeBinary(length=46), nullable=False),
+        sa.Column('missed_bits', sa.LargeBinary(length=46), nullable=False),
+        sa.ForeignKeyConstraint(['habit_id'], ['habits.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('habit_id', 'year')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('habit_year_bitmaps')
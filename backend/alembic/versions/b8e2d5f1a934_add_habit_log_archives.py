@@ -0,0 +1,147 @@
+"""Add habit_log archive tables, optionally partition habit_logs
+
+Revision ID: b8e2d5f1a934
+Revises: d2b6f0e4c815
+Create Date: 2026-10-18 16:48:31.602715
+
+Partitioning is opt-in:
+
+    alembic -x habit_logs_partitioning=month upgrade head   (or =year)
+
+Without it only the archive bookkeeping tables are created; habit_logs can
+be converted later with `python -m app.tools.habit_log_partitions convert`.
+
+"""
+from datetime import date
+from alembic import context, op
+import sqlalchemy as sa
+from dateutil.relativedelta import relativedelta
+
+
+revision = 'b8e2d5f1a934'
+down_revision = 'd2b6f0e4c815'
+branch_labels = None
+depends_on = None
+
+
+# habit_logs as of this revision; the conversion below is frozen here
+# rather than calling HabitLogPartitionService, which follows the current models
+INDEXES = [
+    ('ix_habit_logs_id', '(id)'),
+    ('ix_habit_logs_log_date', '(log_date)'),
+    ('ix_habit_logs_habit_date_status', '(habit_id, log_date) INCLUDE (status)'),
+    ('ix_habit_logs_done', "(habit_id, log_date) WHERE status = 'DONE'"),
+]
+
+INTERVALS = {'month': relativedelta(months=1), 'year': relativedelta(years=1)}
+
+# Partitions created past the current one; ensure_future_partitions keeps extending them
+PARTITIONS_AHEAD = 3
+
+
+def upgrade() -> None:
+    op.create_table(
+        'habit_log_archives',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('partition_name', sa.String(), nullable=False),
+        sa.Column('range_start', sa.Date(), nullable=False),
+        sa.Column('range_end', sa.Date(), nullable=False),
+        sa.Column('row_count', sa.Integer(), nullable=False),
+        sa.Column('file_path', sa.String(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('partition_name')
+    )
+    op.create_index(op.f('ix_habit_log_archives_id'), 'habit_log_archives', ['id'], unique=False)
+    op.create_table(
+        'habit_log_archive_totals',
+        sa.Column('habit_id', sa.Integer(), nullable=False),
+        sa.Column('done_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('skipped_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('missed_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.ForeignKeyConstraint(['habit_id'], ['habits.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('habit_id')
+    )
+
+    interval = context.get_x_argument(as_dictionary=True).get('habit_logs_partitioning')
+    if interval:
+        _partition(interval)
+
+
+def downgrade() -> None:
+    # Offline SQL assumes habit_logs was left unpartitioned
+    if not context.is_offline_mode() and op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('habit_logs')")
+    ).scalar():
+        _unpartition()
+    op.drop_table('habit_log_archive_totals')
+    op.drop_index(op.f('ix_habit_log_archives_id'), table_name='habit_log_archives')
+    op.drop_table('habit_log_archives')
+
+
+def _partition(interval: str) -> None:
+    """Turn habit_logs into a table partitioned by range of log_date, plus a DEFAULT partition"""
+    if interval not in INTERVALS:
+        raise ValueError(f"Unknown partition interval: {interval}")
+    step = INTERVALS[interval]
+
+    old = _swap_out('unpartitioned')
+    _create_table(old, 'PRIMARY KEY (id, log_date)', 'PARTITION BY RANGE (log_date)')
+    op.execute('CREATE TABLE habit_logs_default PARTITION OF habit_logs DEFAULT')
+
+    # Offline SQL starts at the current range; older logs go to the default partition
+    first_day = None
+    if not context.is_offline_mode():
+        first_day = op.get_bind().execute(sa.text(f'SELECT min(log_date) FROM {old}')).scalar()
+    first_day = first_day or date.today()
+    start = first_day.replace(day=1) if interval == 'month' else first_day.replace(month=1, day=1)
+    last = date.today() + step * PARTITIONS_AHEAD
+    while start <= last:
+        suffix = f'{start:%Y}' if interval == 'year' else f'{start:%Y_%m}'
+        op.execute(
+            f"CREATE TABLE habit_logs_p{suffix} PARTITION OF habit_logs "
+            f"FOR VALUES FROM ('{start}') TO ('{start + step}')"
+        )
+        start += step
+
+    _swap_in(old)
+
+
+def _unpartition() -> None:
+    """Turn a partitioned habit_logs back into a plain table"""
+    old = _swap_out('partitioned')
+    _create_table(old, 'PRIMARY KEY (id)', '')
+    _swap_in(old)
+
+
+def _swap_out(suffix: str) -> str:
+    """Rename habit_logs and its constraints out of the way and drop its indexes; returns the new name"""
+    old = f'habit_logs_{suffix}'
+    op.execute('LOCK TABLE habit_logs IN ACCESS EXCLUSIVE MODE')
+    op.execute(f'ALTER TABLE habit_logs RENAME TO {old}')
+    op.execute(f'ALTER TABLE {old} RENAME CONSTRAINT habit_logs_pkey TO {old}_pkey')
+    op.execute(f'ALTER TABLE {old} RENAME CONSTRAINT unique_habit_date TO unique_habit_date_{suffix}')
+    for name, _ in INDEXES:
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+    return old
+
+
+def _create_table(old: str, primary_key: str, partitioning: str) -> None:
+    op.execute(f"""
+        CREATE TABLE habit_logs (
+            LIKE {old} INCLUDING DEFAULTS,
+            {primary_key},
+            CONSTRAINT unique_habit_date UNIQUE (habit_id, log_date),
+            FOREIGN KEY (habit_id) REFERENCES habits (id)
+        ) {partitioning}
+    """)
+
+
+def _swap_in(old: str) -> None:
+    """Move the rows and id sequence of `old` to the new habit_logs, index it and drop `old`"""
+    op.execute('ALTER SEQUENCE habit_logs_id_seq OWNED BY habit_logs.id')
+    op.execute(f'INSERT INTO habit_logs SELECT * FROM {old}')
+    for name, definition in INDEXES:
+        op.execute(f'CREATE INDEX {name} ON habit_logs {definition}')
+    op.execute(f'DROP TABLE {old}')
+    op.execute('ANALYZE habit_logs')
@@ -0,0 +1,70 @@
+"""Add change sequences and sync_tombstones for delta sync
+
+Revision ID: c7d4e8a2f519
+Revises: f3a9c2e7d164
+Create Date: 2026-10-18 21:05:37.204118
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+revision = 'c7d4e8a2f519'
+down_revision = 'f3a9c2e7d164'
+branch_labels = None
+depends_on = None
+
+
+STAMPED_TABLES = ['habits', 'habit_logs', 'goals', 'user_achievements']
+
+INDEXES = [
+    # (name, table, columns)
+    ('ix_habits_user_id_change_seq', 'habits', ['user_id', 'change_seq']),
+    ('ix_habit_logs_habit_id_change_seq', 'habit_logs', ['habit_id', 'change_seq']),
+    ('ix_goals_user_id_change_seq', 'goals', ['user_id', 'change_seq']),
+    ('ix_user_achievements_user_id_change_seq', 'user_achievements', ['user_id', 'change_seq']),
+]
+
+
+def upgrade() -> None:
+    # Existing rows start at 0: clients begin with a full snapshot anyway
+    op.add_column('users', sa.Column('change_seq', sa.BigInteger(), nullable=False, server_default='0'))
+    op.add_column('users', sa.Column('sync_floor', sa.BigInteger(), nullable=False, server_default='0'))
+    for table in STAMPED_TABLES:
+        op.add_column(table, sa.Column('change_seq', sa.BigInteger(), nullable=False, server_default='0'))
+
+    op.create_table(
+        'sync_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('entity', sa.String(length=32), nullable=False),
+        sa.Column('entity_id', sa.Integer(), nullable=False),
+        sa.Column('change_seq', sa.BigInteger(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sync_tombstones_user_id_change_seq', 'sync_tombstones', ['user_id', 'change_seq'], unique=False)
+    op.create_index('ix_sync_tombstones_deleted_at', 'sync_tombstones', ['deleted_at'], unique=False)
+
+    # A partitioned habit_logs cannot be indexed concurrently (offline SQL assumes a plain table)
+    partitioned = not context.is_offline_mode() and op.get_bind().execute(
+        sa.text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('habit_logs')")
+    ).scalar()
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            concurrently = not (partitioned and table == 'habit_logs')
+            op.create_index(name, table, columns, postgresql_concurrently=concurrently, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True)
+    op.drop_index('ix_sync_tombstones_deleted_at', table_name='sync_tombstones')
+    op.drop_index('ix_sync_tombstones_user_id_change_seq', table_name='sync_tombstones')
+    op.drop_table('sync_tombstones')
+    for table in reversed(STAMPED_TABLES):
+        op.drop_column(table, 'change_seq')
+    op.drop_column('users', 'sync_floor')
+    op.drop_column('users', 'change_seq')
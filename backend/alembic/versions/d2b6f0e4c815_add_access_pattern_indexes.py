@@ -0,0 +1,50 @@
+"""Add indexes for the habit_logs, habits, goals and achievements access patterns
+
+Revision ID: d2b6f0e4c815
+Revises: a5d83e1c6f27
+Create Date: 2026-10-18 15:22:08.417593
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'd2b6f0e4c815'
+down_revision = 'a5d83e1c6f27'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = [
+    # (name, table, columns, options)
+    ('ix_habit_logs_habit_date_status', 'habit_logs', ['habit_id', 'log_date'], {'postgresql_include': ['status']}),
+    ('ix_habit_logs_done', 'habit_logs', ['habit_id', 'log_date'], {'postgresql_where': sa.text("status = 'DONE'")}),
+    ('ix_habits_user_id_status', 'habits', ['user_id', 'status'], {}),
+    ('ix_goals_user_id_created_at', 'goals', ['user_id', 'created_at'], {}),
+    ('ix_goals_open', 'goals', ['id'], {'postgresql_where': sa.text('is_completed = false')}),
+    ('ix_goal_habits_habit_id_goal_id', 'goal_habits', ['habit_id', 'goal_id'], {}),
+    ('ix_goal_habits_goal_id', 'goal_habits', ['goal_id'], {}),
+    ('ix_user_achievements_user_id_achievement_id', 'user_achievements', ['user_id', 'achievement_id'], {'unique': True}),
+]
+
+
+def upgrade() -> None:
+    # The unique index needs duplicate unlocks gone; keep the earliest
+    op.execute("""
+        DELETE FROM user_achievements a
+        USING user_achievements b
+        WHERE a.user_id = b.user_id
+          AND a.achievement_id = b.achievement_id
+          AND a.id > b.id
+    """)
+
+    # Built concurrently so writes to these tables aren't blocked meanwhile
+    with op.get_context().autocommit_block():
+        for name, table, columns, options in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True, **options)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
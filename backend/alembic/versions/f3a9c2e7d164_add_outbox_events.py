@@ -0,0 +1,38 @@
+"""Add outbox_events
+
+Revision ID: f3a9c2e7d164
+Revises: b8e2d5f1a934
+Create Date: 2026-10-18 19:12:40.318552
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = 'f3a9c2e7d164'
+down_revision = 'b8e2d5f1a934'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'outbox_events',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('event_id', sa.String(length=36), nullable=False),
+        sa.Column('channel', sa.String(), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('published_at', sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('event_id')
+    )
+    op.create_index(
+        'ix_outbox_events_pending', 'outbox_events', ['id'], unique=False,
+        postgresql_where=sa.text('published_at IS NULL')
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_outbox_events_pending', table_name='outbox_events')
+    op.drop_table('outbox_events')
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from typing import List, Optional
+from app.database import get_async_db
 from app.models.user import User
 from app.schemas.goal import GoalCreate, GoalUpdate, GoalResponse
 from app.services.goal_service import GoalService
@@ -10,24 +11,37 @@ from app.core.security import get_current_user
 router = APIRouter(prefix="/api/goals", tags=["goals"])
 
 
+def _to_response(goal) -> Optional[GoalResponse]:
+    """Serialize inside run_sync so habit_contributions can lazy-load"""
+    if goal is None:
+        return None
+    return GoalResponse.model_validate(goal)
+
+
 @router.post("", response_model=GoalResponse, status_code=status.HTTP_201_CREATED)
 async def create_goal(
     goal_data: GoalCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new goal"""
-    goal = GoalService.create_goal(db, current_user.id, goal_data)
+    def create(session: Session) -> GoalResponse:
+        return _to_response(GoalService.create_goal(session, current_user.id, goal_data))
+    
+    goal = await db.run_sync(create)
     return goal
 
 
 @router.get("", response_model=List[GoalResponse])
 async def get_goals(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all goals for the current user"""
-    goals = GoalService.get_goals(db, current_user.id)
+    def fetch(session: Session) -> List[GoalResponse]:
+        return [_to_response(goal) for goal in GoalService.get_goals(session, current_user.id)]
+    
+    goals = await db.run_sync(fetch)
     return goals
 
 
@@ -35,10 +49,13 @@ async def get_goals(
 async def get_goal(
     goal_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific goal"""
-    goal = GoalService.get_goal(db, goal_id, current_user.id)
+    def fetch(session: Session) -> Optional[GoalResponse]:
+        return _to_response(GoalService.get_goal(session, goal_id, current_user.id))
+    
+    goal = await db.run_sync(fetch)
     if not goal:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Goal not found")
     return goal
@@ -49,10 +66,13 @@ async def update_goal(
     goal_id: int,
     goal_data: GoalUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a goal"""
-    goal = GoalService.update_goal(db, goal_id, current_user.id, goal_data, goal_data.habit_ids)
+    def update(session: Session) -> Optional[GoalResponse]:
+        return _to_response(GoalService.update_goal(session, goal_id, current_user.id, goal_data, goal_data.habit_ids))
+    
+    goal = await db.run_sync(update)
     if not goal:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Goal not found")
     return goal
@@ -62,10 +82,9 @@ async def update_goal(
 async def delete_goal(
     goal_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a goal"""
-    success = GoalService.delete_goal(db, goal_id, current_user.id)
+    success = await db.run_sync(GoalService.delete_goal, goal_id, current_user.id)
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Goal not found")
-
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.models.habit import HabitStatus
-from app.schemas.habit import HabitCreate, HabitUpdate, HabitResponse
+from app.schemas.habit import HabitCreate, HabitUpdate, HabitResponse, TodayChecklist
 from app.services.habit_service import HabitService
 from app.core.security import get_current_user
 
@@ -15,10 +15,10 @@ router = APIRouter(prefix="/api/habits", tags=["habits"])
 async def create_habit(
     habit_data: HabitCreate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new habit"""
-    habit = HabitService.create_habit(db, current_user.id, habit_data)
+    habit = await db.run_sync(HabitService.create_habit, current_user.id, habit_data)
     return habit
 
 
@@ -26,21 +26,31 @@ async def create_habit(
 async def get_habits(
     status_filter: HabitStatus = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get all habits for the current user"""
-    habits = HabitService.get_habits(db, current_user.id, status_filter)
+    habits = await db.run_sync(HabitService.get_habits, current_user.id, status_filter)
     return habits
 
 
+@router.get("/today", response_model=TodayChecklist)
+async def get_today(
+    days: int = Query(1, ge=1, le=HabitService.TODAY_MAX_DAYS),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get every habit with its log status today (and on the previous `days - 1` days)"""
+    return await db.run_sync(HabitService.get_today, current_user.id, days)
+
+
 @router.get("/{habit_id}", response_model=HabitResponse)
 async def get_habit(
     habit_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get a specific habit"""
-    habit = HabitService.get_habit(db, habit_id, current_user.id)
+    habit = await db.run_sync(HabitService.get_habit, habit_id, current_user.id)
     if not habit:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Habit not found")
     return habit
@@ -51,10 +61,10 @@ async def update_habit(
     habit_id: int,
     habit_data: HabitUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update a habit"""
-    habit = HabitService.update_habit(db, habit_id, current_user.id, habit_data)
+    habit = await db.run_sync(HabitService.update_habit, habit_id, current_user.id, habit_data)
     if not habit:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Habit not found")
     return habit
@@ -64,10 +74,9 @@ async def update_habit(
 async def delete_habit(
     habit_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a habit"""
-    success = HabitService.delete_habit(db, habit_id, current_user.id)
+    success = await db.run_sync(HabitService.delete_habit, habit_id, current_user.id)
     if not success:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Habit not found")
-
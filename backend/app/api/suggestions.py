@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
 from app.services.risk_detection_service import RiskDetectionService
 from app.services.habit_service import HabitService
@@ -14,14 +14,14 @@ router = APIRouter(prefix="/api/suggestions", tags=["suggestions"])
 async def get_adaptive_suggestions(
     habit_id: int,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Dict:
     """Get adaptive suggestions for a habit"""
-    habit = HabitService.get_habit(db, habit_id, current_user.id)
+    habit = await db.run_sync(HabitService.get_habit, habit_id, current_user.id)
     if not habit:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Habit not found")
     
-    suggestions = RiskDetectionService.generate_adaptive_suggestions(db, habit)
+    suggestions = await db.run_sync(RiskDetectionService.generate_adaptive_suggestions, habit)
     return {
         "habit_id": habit_id,
         "suggestions": suggestions
@@ -31,10 +31,10 @@ async def get_adaptive_suggestions(
 @router.post("/detect-risks")
 async def detect_risks(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> Dict:
     """Manually trigger risk detection for all user habits"""
-    at_risk = RiskDetectionService.detect_at_risk_habits(db, current_user.id)
+    at_risk = await db.run_sync(RiskDetectionService.detect_at_risk_habits, current_user.id)
     return {
         "at_risk_count": len(at_risk),
         "habits": [{"id": h.id, "name": h.name} for h in at_risk]
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from typing import Optional
+from app.database import get_async_db
+from app.models.user import User
+from app.schemas.sync import SyncResponse
+from app.services.sync_service import SyncService
+from app.core.security import get_current_user
+
+router = APIRouter(prefix="/api/sync", tags=["sync"])
+
+
+@router.get("", response_model=SyncResponse)
+async def sync(
+    since: Optional[int] = Query(None, ge=0, description="`cursor` of the previous sync; omit for a full snapshot"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Habits, logs, goals and achievements changed since the cursor, plus the ids of deleted ones"""
+    def fetch(session: Session) -> SyncResponse:
+        return SyncResponse.model_validate(SyncService.get_changes(session, current_user.id, since), from_attributes=True)
+    
+    return await db.run_sync(fetch)
@@ -16,12 +16,62 @@ class Settings(BaseSettings):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
+    # Pooled client (see app.core.redis_client): connections per process, seconds
+    # before a command or a wait for a free connection fails, and the circuit
+    # breaker that skips Redis for REDIS_BREAKER_RESET_SECONDS after
+    # REDIS_BREAKER_FAILURES consecutive connection errors or timeouts
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 1.0
+    REDIS_BREAKER_FAILURES: int = 5
+    REDIS_BREAKER_RESET_SECONDS: float = 10.0
+    
+    # WebSocket fan-out: "channel" subscribes per connected user, "pattern" uses PSUBSCRIBE user:*
+    WS_FANOUT_MODE: str = "channel"
+    WS_REGISTRY_HEARTBEAT_SECONDS: int = 15
+    
+    # Per-connection delivery: the server pings every WS_PING_INTERVAL_SECONDS and
+    # closes sockets it has not heard from for WS_IDLE_TIMEOUT_SECONDS (0 = never);
+    # events queued within WS_COALESCE_MS are sent as one "batch" frame, and a
+    # send that takes longer than WS_SEND_TIMEOUT_SECONDS drops the connection
+    WS_PING_INTERVAL_SECONDS: int = 25
+    WS_IDLE_TIMEOUT_SECONDS: int = 60
+    WS_COALESCE_MS: int = 25
+    WS_SEND_TIMEOUT_SECONDS: float = 5.0
+    
+    # Replayable events: every published event is also appended to a per-channel
+    # Redis Stream capped at about EVENT_STREAM_MAXLEN entries, which expires
+    # EVENT_STREAM_TTL_SECONDS after its last event
+    EVENT_STREAM_MAXLEN: int = 500
+    EVENT_STREAM_TTL_SECONDS: int = 86400
+    
+    # Transactional outbox (see OutboxService): the API process relays events
+    # right after the commits that add them and polls for stragglers
+    OUTBOX_RELAY_IN_API: bool = True
+    OUTBOX_POLL_SECONDS: float = 1.0
+    OUTBOX_BATCH_SIZE: int = 500
+    OUTBOX_RETENTION_HOURS: int = 24
+    
+    # Delta sync: tombstones of deleted rows are kept this long; older cursors get a full snapshot
+    SYNC_TOMBSTONE_RETENTION_DAYS: int = 30
+    
+    # Add X-DB-Queries / X-DB-Commits headers to every response (for profiling)
+    DB_STATS_HEADERS: bool = False
     
     # JWT
     SECRET_KEY: str = "dev-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # Gamification: level curve name from app.services.leveling.LEVEL_CURVES
+    LEVEL_CURVE: str = "linear"
+    
+    # habit_logs partitioning (opt-in, see HabitLogPartitionService): partitions
+    # created ahead of today, and age in months after which partitions are
+    # exported to HABIT_LOGS_ARCHIVE_DIR and dropped (0 disables archival)
+    HABIT_LOGS_PARTITIONS_AHEAD: int = 3
+    HABIT_LOGS_ARCHIVE_AFTER_MONTHS: int = 0
+    HABIT_LOGS_ARCHIVE_DIR: str = "archive/habit_logs"
+    
     # Celery
     CELERY_BROKER_URL: str = "redis://localhost:6379/0"
     CELERY_RESULT_BACKEND: str = "redis://localhost:6379/0"
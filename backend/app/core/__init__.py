@@ -1,8 +1,11 @@
 from app.core.security import verify_password, get_password_hash, create_access_token, get_current_user
-from app.core.redis_client import get_redis_client, publish_event
+from app.core.redis_client import (
+    get_redis_client, get_async_redis_client, publish_event, publish_events, redis_batch, async_redis_batch, redis_call
+)
 
 __all__ = [
     "verify_password", "get_password_hash", "create_access_token", "get_current_user",
-    "get_redis_client", "publish_event"
+    "get_redis_client", "get_async_redis_client", "publish_event", "publish_events",
+    "redis_batch", "async_redis_batch", "redis_call"
 ]
 
@@ -0,0 +1,124 @@
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional
+import redis
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.core.redis_client import cache_delete, get_async_redis_client
+from app.models.user import User
+
+
+class PrincipalCache:
+    """
+    Two-tier cache of authenticated users keyed by user id.
+    
+    Tier 1 is a small in-process LRU with a short TTL, tier 2 is Redis with a
+    longer TTL. Cached users are detached `User` instances carrying only the
+    identity columns below; anything else (XP, level, ...) must be read from
+    the database.
+    """
+    
+    FIELDS = ("id", "email", "full_name", "is_active", "created_at")
+    KEY = "auth:principal:{user_id}"
+    
+    def __init__(self, maxsize: int = 10000, local_ttl: int = 30, redis_ttl: int = 300):
+        self.maxsize = maxsize
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local: "OrderedDict[int, tuple]" = OrderedDict()
+    
+    async def get(self, user_id: int) -> Optional[User]:
+        """Get a cached user, checking the local LRU first and then Redis"""
+        entry = self._local.get(user_id)
+        if entry:
+            expires_at, fields = entry
+            if expires_at > time.monotonic():
+                self._local.move_to_end(user_id)
+                return self._to_user(fields)
+            del self._local[user_id]
+        
+        try:
+            value = await get_async_redis_client().get(self.KEY.format(user_id=user_id))
+        except redis.RedisError:
+            return None
+        if not value:
+            return None
+        
+        fields = json.loads(value)
+        self._store_local(user_id, fields)
+        return self._to_user(fields)
+    
+    async def set(self, user: User):
+        """Cache a user's identity columns in both tiers"""
+        fields = {
+            "id": user.id,
+            "email": user.email,
+            "full_name": user.full_name,
+            "is_active": user.is_active,
+            "created_at": user.created_at.isoformat() if user.created_at else None
+        }
+        self._store_local(user.id, fields)
+        
+        try:
+            await get_async_redis_client().setex(self.KEY.format(user_id=user.id), self.redis_ttl, json.dumps(fields))
+        except redis.RedisError:
+            pass
+    
+    def invalidate(self, user_id: int):
+        """
+        Drop a user from the local tier and Redis. Other processes keep their
+        local copy for at most local_ttl seconds.
+        """
+        self._local.pop(user_id, None)
+        cache_delete(self.KEY.format(user_id=user_id))
+    
+    def _store_local(self, user_id: int, fields: dict):
+        self._local[user_id] = (time.monotonic() + self.local_ttl, fields)
+        self._local.move_to_end(user_id)
+        while len(self._local) > self.maxsize:
+            self._local.popitem(last=False)
+    
+    @staticmethod
+    def _to_user(fields: dict) -> User:
+        created_at = fields.get("created_at")
+        return User(
+            id=fields["id"],
+            email=fields["email"],
+            full_name=fields.get("full_name"),
+            is_active=fields.get("is_active", True),
+            created_at=datetime.fromisoformat(created_at) if created_at else None
+        )
+
+
+principal_cache = PrincipalCache()
+
+
+PENDING_INVALIDATIONS = "principal_invalidations"
+
+
+@event.listens_for(User, "after_update")
+def _user_updated(mapper, connection, target):
+    """Queue a cache invalidation when a cached column of a user changes"""
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in PrincipalCache.FIELDS):
+        state.session.info.setdefault(PENDING_INVALIDATIONS, set()).add(target.id)
+
+
+@event.listens_for(User, "after_delete")
+def _user_deleted(mapper, connection, target):
+    inspect(target).session.info.setdefault(PENDING_INVALIDATIONS, set()).add(target.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    # Invalidate only once the change is visible, so a concurrent request
+    # cannot re-cache the old row between flush and commit
+    for user_id in session.info.pop(PENDING_INVALIDATIONS, ()):
+        principal_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(PENDING_INVALIDATIONS, None)
@@ -1,29 +1,291 @@
+import asyncio
 import json
+import threading
+import time
 import redis
+import redis.asyncio as aioredis
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Any, Dict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from greenlet import getcurrent
+from redis.asyncio.client import Pipeline as AsyncPipeline
+from redis.client import Pipeline
+from sqlalchemy.util import await_only
+# The greenlet AsyncSession.run_sync runs sync code on (SQLAlchemy 2.0.23 has no public check for it)
+from sqlalchemy.util._concurrency_py3k import _AsyncIoGreenlet
 from app.config import settings
 
+
+class CircuitBreaker:
+    """
+    Fails Redis calls fast during an outage. After `failure_threshold`
+    consecutive connection errors or timeouts the circuit opens and calls
+    raise `redis.ConnectionError` immediately for `reset_timeout` seconds;
+    then a single call is let through to probe whether Redis is back.
+    Callers already treat `redis.RedisError` as "no cache / no event".
+    """
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+    
+    def before_call(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise redis.ConnectionError("Redis circuit breaker is open")
+            # Half-open: this call probes, the others keep failing fast
+            self._opened_at = time.monotonic()
+    
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+    
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(settings.REDIS_BREAKER_FAILURES, settings.REDIS_BREAKER_RESET_SECONDS)
+
+OUTAGE_ERRORS = (redis.ConnectionError, redis.TimeoutError)
+
+
+class _Redis(redis.Redis):
+    def execute_command(self, *args, **options):
+        breaker.before_call()
+        try:
+            result = super().execute_command(*args, **options)
+        except OUTAGE_ERRORS:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+    
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> "_Pipeline":
+        return _Pipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _Pipeline(Pipeline):
+    def execute(self, raise_on_error: bool = True) -> List[Any]:
+        breaker.before_call()
+        try:
+            result = super().execute(raise_on_error)
+        except OUTAGE_ERRORS:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+
+class _AsyncRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        breaker.before_call()
+        try:
+            result = await super().execute_command(*args, **options)
+        except OUTAGE_ERRORS:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+    
+    def pipeline(self, transaction: bool = True, shard_hint: Any = None) -> "_AsyncPipeline":
+        return _AsyncPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+class _AsyncPipeline(AsyncPipeline):
+    async def execute(self, raise_on_error: bool = True) -> List[Any]:
+        breaker.before_call()
+        try:
+            result = await super().execute(raise_on_error)
+        except OUTAGE_ERRORS:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        return result
+
+
+def _pool_options() -> Dict[str, Any]:
+    return {
+        "decode_responses": True,
+        "max_connections": settings.REDIS_MAX_CONNECTIONS,
+        "timeout": settings.REDIS_SOCKET_TIMEOUT,  # Wait for a free pooled connection
+        "socket_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "socket_connect_timeout": settings.REDIS_SOCKET_TIMEOUT,
+        "health_check_interval": 30,
+    }
+
+
 # Redis connection pool
 redis_client = None
+async_redis_client = None
+_async_loop = None
 
 
 def get_redis_client() -> redis.Redis:
-    """Get Redis client instance"""
+    """Get the Redis client, backed by a blocking connection pool on settings.redis_url"""
     global redis_client
     if redis_client is None:
-        redis_client = redis.Redis(
-            host=settings.REDIS_HOST,
-            port=settings.REDIS_PORT,
-            db=settings.REDIS_DB,
-            decode_responses=True
-        )
+        redis_client = _Redis(connection_pool=redis.BlockingConnectionPool.from_url(
+            settings.redis_url, **_pool_options()
+        ))
     return redis_client
 
 
+def get_async_redis_client() -> aioredis.Redis:
+    """asyncio twin of get_redis_client, one pool per event loop"""
+    global async_redis_client, _async_loop
+    loop = asyncio.get_running_loop()
+    if async_redis_client is None or _async_loop is not loop:
+        async_redis_client = _AsyncRedis(connection_pool=aioredis.BlockingConnectionPool.from_url(
+            settings.redis_url, **_pool_options()
+        ))
+        _async_loop = loop
+    return async_redis_client
+
+
+def redis_call(op: Callable[[Any], Any]) -> Any:
+    """
+    Run a Redis command `op(client)` and return its result. Sync service
+    code run by AsyncSession.run_sync goes through the asyncio client and
+    is awaited via SQLAlchemy's greenlet, so the loop keeps serving other
+    requests; off the loop (Celery, scripts) the blocking client is used.
+    Coroutines must await the asyncio client themselves: from one this
+    raises RuntimeError instead of blocking the loop. Redis errors are
+    raised.
+    """
+    if _in_run_sync():
+        return await_only(op(get_async_redis_client()))
+    if _loop_running():
+        raise RuntimeError("redis_call would block the event loop; await get_async_redis_client() instead")
+    return op(get_redis_client())
+
+
+def _in_run_sync() -> bool:
+    return isinstance(getcurrent(), _AsyncIoGreenlet)
+
+
+def _loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+# Background writes started from coroutines, referenced until done
+_tasks: Set[asyncio.Task] = set()
+
+
+def _send(call: Callable[[], None], async_call: Callable[[], Awaitable[None]]):
+    """
+    Send fire-and-forget Redis writes without blocking an event loop:
+    awaited via SQLAlchemy's greenlet inside run_sync, started as a task
+    from other code on the loop, and called directly off the loop
+    """
+    if _in_run_sync():
+        await_only(async_call())
+    elif _loop_running():
+        task = asyncio.get_running_loop().create_task(async_call())
+        _tasks.add(task)
+        task.add_done_callback(_tasks.discard)
+    else:
+        call()
+
+
+# Writes buffered for the current request (see redis_batch); None outside one
+_batch: ContextVar[Optional[List[Callable[[Any], Any]]]] = ContextVar("redis_batch", default=None)
+
+
+def pipelined(op: Callable[[Any], Any]):
+    """
+    Run `op(pipe)` on a pipeline: queued on the current request's batch if
+    there is one, otherwise sent right away. `op` only queues commands, so
+    it works with both the sync and the asyncio pipeline. Redis errors are
+    logged, not raised.
+    """
+    batch = _batch.get()
+    if batch is not None:
+        batch.append(op)
+        return
+    _flush([op])
+
+
+@contextmanager
+def redis_batch():
+    """Buffer publishes and cache writes made in the block and send them in one pipeline at the end"""
+    if _batch.get() is not None:
+        yield
+        return
+    ops: List[Callable[[Any], Any]] = []
+    token = _batch.set(ops)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+        _flush(ops)
+
+
+@asynccontextmanager
+async def async_redis_batch():
+    """redis_batch for async code (e.g. around an HTTP request), flushed with the asyncio client"""
+    if _batch.get() is not None:
+        yield
+        return
+    ops: List[Callable[[Any], Any]] = []
+    token = _batch.set(ops)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+        if ops:
+            await _flush_async(ops)
+
+
+def _flush(ops: List[Callable[[Any], Any]]):
+    if ops:
+        _send(lambda: _flush_sync(ops), lambda: _flush_async(ops))
+
+
+def _flush_sync(ops: List[Callable[[Any], Any]]):
+    try:
+        pipe = get_redis_client().pipeline(transaction=False)
+        for op in ops:
+            op(pipe)
+        pipe.execute()
+    except redis.RedisError as e:
+        print(f"Error sending Redis writes: {e}")
+
+
+async def _flush_async(ops: List[Callable[[Any], Any]]):
+    try:
+        pipe = get_async_redis_client().pipeline(transaction=False)
+        for op in ops:
+            op(pipe)
+        await pipe.execute()
+    except redis.RedisError as e:
+        print(f"Error sending Redis writes: {e}")
+
+
 def publish_event(channel: str, event_type: str, data: Dict[str, Any], user_id: int = None):
     """
-    Publish an event to Redis pub/sub
+    Publish an event to Redis pub/sub (and the channel's replay stream)
     
     Args:
         channel: Redis channel name (e.g., 'user:123' for user-specific, 'global' for all)
@@ -31,14 +293,75 @@ def publish_event(channel: str, event_type: str, data: Dict[str, Any], user_id:
         data: Event payload
         user_id: Optional user ID for user-specific channels
     """
-    client = get_redis_client()
-    event = {
+    publish_events([{"channel": channel, "event_type": event_type, "data": data, "user_id": user_id}])
+
+
+def publish_events(events: List[Dict[str, Any]]):
+    """
+    Publish many events with two pipelined round trips (see stream_and_publish).
+    On an event loop they are sent from a worker thread. Redis errors are
+    logged, not raised.
+    
+    Args:
+        events: Dicts with the same keys as publish_event's arguments
+                (channel, event_type, data and optional user_id)
+    """
+    if not events:
+        return
+    
+    messages = [
+        (event["channel"], build_event(event["event_type"], event["data"], event.get("user_id")))
+        for event in events
+    ]
+    
+    def publish():
+        try:
+            stream_and_publish(get_redis_client(), messages)
+        except redis.RedisError as e:
+            print(f"Error publishing events: {e}")
+    _send(publish, lambda: asyncio.to_thread(publish))
+
+
+def stream_key(channel: str) -> str:
+    """Redis Stream holding the recent events of a pub/sub channel"""
+    return f"stream:{channel}"
+
+
+def stream_and_publish(client: redis.Redis, messages: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+    """
+    Append each (channel, message) to the channel's capped stream, then
+    publish it with its stream entry id as `cursor`, the position clients
+    resume from after a reconnect. Returns the entry ids; Redis errors are
+    raised.
+    """
+    if not messages:
+        return []
+    
+    pipe = client.pipeline(transaction=False)
+    for channel, message in messages:
+        pipe.xadd(
+            stream_key(channel), {"event": json.dumps(message)},
+            maxlen=settings.EVENT_STREAM_MAXLEN, approximate=True
+        )
+    for key in {stream_key(channel) for channel, _ in messages}:
+        pipe.expire(key, settings.EVENT_STREAM_TTL_SECONDS)
+    cursors = pipe.execute()[:len(messages)]
+    
+    pipe = client.pipeline(transaction=False)
+    for (channel, message), cursor in zip(messages, cursors):
+        pipe.publish(channel, json.dumps({**message, "cursor": cursor}))
+    pipe.execute()
+    return cursors
+
+
+def build_event(event_type: str, data: Dict[str, Any], user_id: int = None) -> Dict[str, Any]:
+    """The JSON message published for an event"""
+    return {
         "type": event_type,
         "data": data,
         "user_id": user_id,
         "timestamp": str(datetime.utcnow().isoformat())
     }
-    client.publish(channel, json.dumps(event))
 
 
 def get_cache_key(key: str, user_id: int = None) -> str:
@@ -49,16 +372,74 @@ def get_cache_key(key: str, user_id: int = None) -> str:
 
 
 def cache_get(key: str) -> Any:
-    """Get value from cache"""
-    client = get_redis_client()
-    value = client.get(key)
+    """Get value from cache (awaited on the asyncio client inside run_sync, see redis_call)"""
+    value = redis_call(lambda client: client.get(key))
     if value:
         return json.loads(value)
     return None
 
 
-def cache_set(key: str, value: Any, expire: int = 3600):
-    """Set value in cache with expiration"""
-    client = get_redis_client()
-    client.setex(key, expire, json.dumps(value))
+def cache_set(key: str, value: Any, expire: int = 3600, on_store: Callable[[Any], None] = None, immediate: bool = False):
+    """
+    Set value in cache with expiration, batched within a request;
+    `on_store(pipe)` queues more writes alongside. `immediate` sends it
+    right away instead, for fills that must not land after a later
+    invalidation. Redis errors are logged, not raised.
+    """
+    payload = json.dumps(value)
+    
+    def store(pipe):
+        pipe.setex(key, expire, payload)
+        if on_store:
+            on_store(pipe)
+    
+    if not immediate:
+        pipelined(store)
+        return
+    
+    def send(client):
+        pipe = client.pipeline(transaction=False)
+        store(pipe)
+        return pipe.execute()
+    try:
+        redis_call(send)
+    except redis.RedisError as e:
+        print(f"Error writing cache key {key}: {e}")
+
+
+def cache_read_through(
+    key: str,
+    loader: Callable[[], Any],
+    expire: int = 3600,
+    counters: Optional[Dict[str, int]] = None,
+    on_store: Callable[[Any], None] = None
+) -> Any:
+    """
+    Serve a key from the cache, or compute it with `loader()` and store it.
+    When Redis can't be read the value is computed and not stored. Hits,
+    misses and errors are counted in `counters` when given.
+    """
+    try:
+        cached = cache_get(key)
+    except redis.RedisError as e:
+        print(f"Error reading cache key {key}: {e}")
+        if counters is not None:
+            counters["errors"] += 1
+        return loader()
+    
+    if cached is not None:
+        if counters is not None:
+            counters["hits"] += 1
+        return cached
+    
+    if counters is not None:
+        counters["misses"] += 1
+    value = loader()
+    cache_set(key, value, expire=expire, on_store=on_store)
+    return value
+
 
+def cache_delete(*keys: str):
+    """Delete cache keys (batched within a request, after any earlier writes)"""
+    if keys:
+        pipelined(lambda pipe: pipe.delete(*keys))
@@ -4,10 +4,12 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.config import settings
-from app.database import get_db
+from app.database import get_async_db
 from app.models.user import User
+from app.core.principal_cache import principal_cache
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
@@ -38,7 +40,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Get the current authenticated user from JWT token"""
     credentials_exception = HTTPException(
@@ -47,20 +49,48 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    user = await authenticate_token(token, db)
+    if user is None:
+        raise credentials_exception
+    
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    
+    return user
+
+
+
+async def authenticate_token(token: str, db: AsyncSession) -> Optional[User]:
+    """
+    Resolve a JWT to its user, or None if the token is invalid.
+    
+    Tokens carrying a `uid` claim are resolved by primary key through the
+    principal cache; the returned user is then a detached instance holding
+    only the cached identity columns. Older tokens without `uid` fall back
+    to a lookup by email.
+    """
     try:
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         email: str = payload.get("sub")
+        user_id: Optional[int] = payload.get("uid")
         if email is None:
-            raise credentials_exception
+            return None
     except JWTError:
-        raise credentials_exception
+        return None
+    
+    if user_id is None:
+        result = await db.execute(select(User).where(User.email == email))
+        return result.scalar_one_or_none()
     
-    user = db.query(User).filter(User.email == email).first()
+    user = await principal_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        user = await db.get(User, user_id)
+        if user is None:
+            return None
+        await principal_cache.set(user)
     
-    if not user.is_active:
-        raise HTTPException(status_code=400, detail="Inactive user")
+    # Tokens stay bound to the email they were issued for
+    if user.email != email:
+        return None
     
     return user
-
@@ -1,18 +1,50 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from app.config import settings
 
+requires_ssl = "railway" in settings.database_url.lower() or "render" in settings.database_url.lower()
+
+# Sync engine: Celery tasks, Alembic and startup table creation
 engine = create_engine(
     settings.database_url,
     pool_pre_ping=True,
     pool_size=10,
     max_overflow=20,
-    connect_args={"sslmode": "require"} if "railway" in settings.database_url.lower() or "render" in settings.database_url.lower() else {}
+    connect_args={"sslmode": "require"} if requires_ssl else {}
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def _async_database_url() -> str:
+    """asyncpg URL (aiosqlite for a local SQLite database); sslmode is a libpq option asyncpg does not understand"""
+    url = make_url(settings.database_url)
+    if url.drivername in ("postgresql", "postgresql+psycopg2"):
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.drivername in ("sqlite", "sqlite+pysqlite"):
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url.difference_update_query(["sslmode"]).render_as_string(hide_password=False)
+
+
+# Async engine: request path of the API routers
+async_url = _async_database_url()
+async_engine = create_async_engine(
+    async_url,
+    pool_pre_ping=True,
+    # aiosqlite (tests) opens a connection per session instead of pooling
+    **({} if async_url.startswith("sqlite") else {"pool_size": 10, "max_overflow": 20}),
+    connect_args={"ssl": "require"} if requires_ssl or "sslmode=require" in settings.database_url else {}
+)
+
+# Objects stay loaded after commit so responses can be serialized without lazy IO
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -24,3 +56,91 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    """
+    Dependency for getting an async database session.
+    
+    Services are written against the sync Session API; routes run them on this
+    session's connection with `await db.run_sync(Service.method, *args)` so the
+    database IO is awaited instead of blocking the event loop.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """Connection pool usage of this process's sync and async engines"""
+    stats = {}
+    for name, pool in (("sync", engine.pool), ("async", async_engine.pool)):
+        stats[name] = {
+            "size": pool.size() if hasattr(pool, "size") else 0,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else 0,
+            "checked_in": pool.checkedin() if hasattr(pool, "checkedin") else 0,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else 0,
+        }
+    return stats
+
+
+UNIT_OF_WORK = "unit_of_work"
+
+
+@contextmanager
+def unit_of_work(db: Session):
+    """
+    Run a multi-step write as one transaction: service steps that end with
+    `commit_or_flush` only flush inside the block, and the block commits
+    once at the end (or rolls back on error). Nested blocks join the
+    outermost one.
+    """
+    if db.info.get(UNIT_OF_WORK):
+        yield db
+        return
+    db.info[UNIT_OF_WORK] = True
+    try:
+        yield db
+        db.info.pop(UNIT_OF_WORK, None)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.info.pop(UNIT_OF_WORK, None)
+
+
+def commit_or_flush(db: Session) -> bool:
+    """Commit, or only flush inside a unit_of_work; True if it committed (objects were expired)"""
+    if db.info.get(UNIT_OF_WORK):
+        db.flush()
+        return False
+    db.commit()
+    return True
+
+
+# Queries and commits issued in the current request (see count_db_work); None outside one
+_db_work: ContextVar[Optional[Dict[str, int]]] = ContextVar("db_work", default=None)
+
+
+@contextmanager
+def count_db_work():
+    """Count the SQL statements and commits issued in the block, on any engine or session"""
+    counters = {"queries": 0, "commits": 0}
+    token = _db_work.set(counters)
+    try:
+        yield counters
+    finally:
+        _db_work.reset(token)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counters = _db_work.get()
+    if counters is not None:
+        counters["queries"] += 1
+
+
+@event.listens_for(Session, "after_commit")
+def _count_commit(session):
+    counters = _db_work.get()
+    if counters is not None:
+        counters["commits"] += 1
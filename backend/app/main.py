@@ -1,9 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import auth, habits, habit_logs, goals, analytics, suggestions, gamification
-from app.websocket.handlers import websocket_endpoint
-from app.database import Base, engine
+from app.api import auth, habits, habit_logs, goals, analytics, suggestions, gamification, sync
+from app.websocket.handlers import event_stream_endpoint, websocket_endpoint
+from app.websocket.manager import manager
+from app.database import Base, count_db_work, engine, pool_stats
 from app.config import settings
+from app.core.redis_client import async_redis_batch, breaker
+from app.services.analytics_service import AnalyticsService
+from app.services.outbox_service import outbox_relay
 import os
 
 # Create database tables (unconditionally on startup for robust deployment on Render)
@@ -47,6 +51,25 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def batch_redis_writes(request: Request, call_next):
+    """Send the event publishes and cache writes of a request in one Redis pipeline once it is handled"""
+    async with async_redis_batch():
+        return await call_next(request)
+
+
+@app.middleware("http")
+async def report_db_work(request: Request, call_next):
+    """With DB_STATS_HEADERS, report the queries and commits a request issued in X-DB-Queries / X-DB-Commits"""
+    if not settings.DB_STATS_HEADERS:
+        return await call_next(request)
+    with count_db_work() as counters:
+        response = await call_next(request)
+    response.headers["X-DB-Queries"] = str(counters["queries"])
+    response.headers["X-DB-Commits"] = str(counters["commits"])
+    return response
+
 # Include routers
 app.include_router(auth.router)
 app.include_router(habits.router)
@@ -55,10 +78,14 @@ app.include_router(goals.router)
 app.include_router(analytics.router)
 app.include_router(suggestions.router)
 app.include_router(gamification.router)
+app.include_router(sync.router)
 
 # WebSocket endpoint
 app.add_websocket_route("/ws", websocket_endpoint)
 
+# Server-Sent Events alternative to /ws
+app.add_api_route("/events", event_stream_endpoint, methods=["GET"])
+
 
 @app.get("/")
 async def root():
@@ -73,3 +100,44 @@ async def root():
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+
+@app.get("/health/pool")
+async def pool_health():
+    """Database connections in use by this worker (WebSockets hold none)"""
+    return {"pools": pool_stats(), "websocket_connections": len(manager.send_queues)}
+
+
+@app.get("/health/realtime")
+async def realtime_health():
+    """WebSocket connection counts and event delivery latency for this worker"""
+    stats = manager.get_stats()
+    stats["redis_circuit"] = breaker.state
+    stats["outbox_relay"] = outbox_relay.get_stats()
+    try:
+        stats["cluster"] = await manager.get_cluster_stats()
+    except Exception as e:
+        stats["cluster"] = {"error": str(e)}
+    return stats
+
+
+@app.get("/health/cache")
+async def cache_health():
+    """Analytics cache hit/miss counters for this worker"""
+    return AnalyticsService.get_cache_stats()
+
+
+@app.on_event("startup")
+async def start_outbox_relay():
+    if settings.OUTBOX_RELAY_IN_API:
+        outbox_relay.start()
+
+
+@app.on_event("shutdown")
+async def stop_outbox_relay():
+    await outbox_relay.stop()
+
+
+@app.on_event("shutdown")
+async def shutdown_websockets():
+    await manager.shutdown()
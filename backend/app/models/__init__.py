@@ -3,6 +3,11 @@ from app.models.habit import Habit
 from app.models.goal import Goal, GoalHabit
 from app.models.habit_log import HabitLog
 from app.models.achievement import Achievement, UserAchievement
+from app.models.user_daily_rollup import UserDailyRollup
+from app.models.habit_bitmap import HabitYearBitmap
+from app.models.habit_log_archive import HabitLogArchive, HabitLogArchiveTotal
+from app.models.outbox_event import OutboxEvent
+from app.models.sync_tombstone import SyncTombstone
 
-__all__ = ["User", "Habit", "Goal", "GoalHabit", "HabitLog", "Achievement", "UserAchievement"]
+__all__ = ["User", "Habit", "Goal", "GoalHabit", "HabitLog", "Achievement", "UserAchievement", "UserDailyRollup", "HabitYearBitmap", "HabitLogArchive", "HabitLogArchiveTotal", "OutboxEvent", "SyncTombstone"]
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, Text
+from sqlalchemy import Column, Integer, BigInteger, String, Enum, ForeignKey, DateTime, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -37,6 +37,7 @@ class UserAchievement(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     achievement_id = Column(Integer, ForeignKey("achievements.id"), nullable=False)
     unlocked_at = Column(DateTime(timezone=True), server_default=func.now())
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # User's change sequence of the last write
     
     # Relationships
     user = relationship("User", backref="achievements")
@@ -44,6 +45,8 @@ class UserAchievement(Base):
     
     # Unique constraint: user can only unlock achievement once
     __table_args__ = (
+        Index("ix_user_achievements_user_id_achievement_id", "user_id", "achievement_id", unique=True),
+        Index("ix_user_achievements_user_id_change_seq", "user_id", "change_seq"),
         {"sqlite_autoincrement": True},
     )
 
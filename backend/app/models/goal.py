@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Float, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, ForeignKey, DateTime, Float, Boolean, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -20,10 +20,19 @@ class Goal(Base):
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # User's change sequence of the last write
     
     # Relationships
     user = relationship("User", back_populates="goals")
     habit_contributions = relationship("GoalHabit", back_populates="goal", cascade="all, delete-orphan")
+    
+    __table_args__ = (
+        Index("ix_goals_user_id_created_at", "user_id", "created_at"),
+        # Open goals, scanned in id order by the reconcile task
+        Index("ix_goals_open", "id", postgresql_where=text("is_completed = false")),
+        # Rows changed since a sync cursor
+        Index("ix_goals_user_id_change_seq", "user_id", "change_seq"),
+    )
 
 
 class GoalHabit(Base):
@@ -38,4 +47,13 @@ class GoalHabit(Base):
     # Relationships
     goal = relationship("Goal", back_populates="habit_contributions")
     habit = relationship("Habit", back_populates="goal_habits")
+    
+    __table_args__ = (
+        Index("ix_goal_habits_habit_id_goal_id", "habit_id", "goal_id"),
+        Index("ix_goal_habits_goal_id", "goal_id"),
+    )
+    
+    @property
+    def habit_name(self) -> str:
+        return self.habit.name if self.habit else None
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, Boolean, DateTime, Float
+from sqlalchemy import Column, Integer, BigInteger, String, Enum, ForeignKey, Boolean, DateTime, Float, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -47,6 +47,7 @@ class Habit(Base):
     longest_streak = Column(Integer, default=0)
     total_completions = Column(Integer, default=0)
     total_skips = Column(Integer, default=0)
+    total_logs = Column(Integer, default=0)
     consistency_score = Column(Float, default=0.0)  # 0-100
     
     # Risk detection
@@ -60,9 +61,18 @@ class Habit(Base):
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # User's change sequence of the last write
     
     # Relationships
     user = relationship("User", back_populates="habits")
     logs = relationship("HabitLog", back_populates="habit", cascade="all, delete-orphan")
     goal_habits = relationship("GoalHabit", back_populates="habit", cascade="all, delete-orphan")
+    bitmaps = relationship("HabitYearBitmap", cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        # A user's habits, optionally by status (listing, risk detection)
+        Index("ix_habits_user_id_status", "user_id", "status"),
+        # Rows changed since a sync cursor
+        Index("ix_habits_user_id_change_seq", "user_id", "change_seq"),
+    )
 
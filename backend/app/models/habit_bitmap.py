@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, ForeignKey, LargeBinary
+from app.database import Base
+
+
+class HabitYearBitmap(Base):
+    """
+    One year of a habit's log history as bitsets, one per log status.
+    Bit n (least significant bit first) is day n of the year, counting
+    January 1st as day 0; 46 bytes cover 366 days.
+    """
+    __tablename__ = "habit_year_bitmaps"
+    
+    habit_id = Column(Integer, ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    done_bits = Column(LargeBinary(46), nullable=False)
+    skipped_bits = Column(LargeBinary(46), nullable=False)
+    missed_bits = Column(LargeBinary(46), nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime, Date, UniqueConstraint
+from sqlalchemy import Column, Integer, BigInteger, String, Enum, ForeignKey, DateTime, Date, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
@@ -23,6 +23,7 @@ class HabitLog(Base):
     # Metadata
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")  # Habit owner's change sequence of the last write
     
     # Relationships
     habit = relationship("Habit", back_populates="logs")
@@ -30,5 +31,11 @@ class HabitLog(Base):
     # Unique constraint: one log per habit per date
     __table_args__ = (
         UniqueConstraint('habit_id', 'log_date', name='unique_habit_date'),
+        # Per-status counts over a habit's date range, answered from the index alone
+        Index('ix_habit_logs_habit_date_status', 'habit_id', 'log_date', postgresql_include=['status']),
+        # Streaks, completions and goal progress only read done logs
+        Index('ix_habit_logs_done', 'habit_id', 'log_date', postgresql_where=text("status = 'DONE'")),
+        # Logs changed since a sync cursor, per habit of the user
+        Index('ix_habit_logs_habit_id_change_seq', 'habit_id', 'change_seq'),
     )
 
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class HabitLogArchive(Base):
+    """A habit_logs partition that was exported and dropped by the archival job"""
+    __tablename__ = "habit_log_archives"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    partition_name = Column(String, nullable=False, unique=True)
+    range_start = Column(Date, nullable=False)
+    range_end = Column(Date, nullable=False)  # Exclusive
+    row_count = Column(Integer, nullable=False, default=0)
+    file_path = Column(String, nullable=False)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class HabitLogArchiveTotal(Base):
+    """Per-habit log counts of archived partitions, added back when stats are recomputed from logs"""
+    __tablename__ = "habit_log_archive_totals"
+    
+    habit_id = Column(Integer, ForeignKey("habits.id", ondelete="CASCADE"), primary_key=True)
+    done_count = Column(Integer, nullable=False, default=0, server_default="0")
+    skipped_count = Column(Integer, nullable=False, default=0, server_default="0")
+    missed_count = Column(Integer, nullable=False, default=0, server_default="0")
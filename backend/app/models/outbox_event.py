@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, text
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class OutboxEvent(Base):
+    """A real-time event written in the transaction that caused it, published to Redis by the outbox relay"""
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # The relay only ever reads the unpublished tail
+        Index("ix_outbox_events_pending", "id", postgresql_where=text("published_at IS NULL")),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    event_id = Column(String(36), nullable=False, unique=True)  # Sent with the event so consumers can drop redeliveries
+    channel = Column(String, nullable=False)
+    payload = Column(Text, nullable=False)  # The JSON message as published
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    published_at = Column(DateTime(timezone=True), nullable=True)
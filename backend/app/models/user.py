@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -18,6 +18,11 @@ class User(Base):
     level = Column(Integer, default=1)
     total_points = Column(Integer, default=0)
     
+    # Delta sync (see SyncService): bumped by every transaction that changes the
+    # user's synced rows; clients older than sync_floor missed purged tombstones
+    change_seq = Column(BigInteger, nullable=False, default=0, server_default="0")
+    sync_floor = Column(BigInteger, nullable=False, default=0, server_default="0")
+    
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey, Date, DateTime
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class UserDailyRollup(Base):
+    """Per-user, per-day analytics maintained on the write path"""
+    __tablename__ = "user_daily_rollups"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    
+    # Logs dated on this day, by status
+    done_count = Column(Integer, nullable=False, default=0, server_default="0")
+    skipped_count = Column(Integer, nullable=False, default=0, server_default="0")
+    missed_count = Column(Integer, nullable=False, default=0, server_default="0")
+    xp_earned = Column(Integer, nullable=False, default=0, server_default="0")
+    
+    # Snapshot of the user's habits, last refreshed at snapshot_at on this day
+    total_habits = Column(Integer, nullable=True)
+    active_habits = Column(Integer, nullable=True)
+    at_risk_habits = Column(Integer, nullable=True)
+    total_streak = Column(Integer, nullable=True)
+    consistency_total = Column(Float, nullable=True)
+    snapshot_at = Column(DateTime(timezone=True), nullable=True)
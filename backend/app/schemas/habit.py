@@ -1,7 +1,8 @@
 from pydantic import BaseModel
 from datetime import datetime, date
-from typing import Optional
+from typing import List, Optional
 from app.models.habit import HabitFrequency, HabitDifficulty, HabitPriority, HabitStatus
+from app.models.habit_log import LogStatus
 
 
 class HabitBase(BaseModel):
@@ -44,3 +45,17 @@ class HabitResponse(HabitBase):
     class Config:
         from_attributes = True
 
+
+class TodayHabit(BaseModel):
+    id: int
+    name: str
+    frequency: HabitFrequency
+    status: HabitStatus
+    current_streak: int
+    today: Optional[LogStatus] = None  # None: not logged yet
+    recent: List[Optional[LogStatus]] = []  # Previous days, newest first
+
+
+class TodayChecklist(BaseModel):
+    date: date
+    habits: List[TodayHabit]
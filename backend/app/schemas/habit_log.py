@@ -1,6 +1,6 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from datetime import datetime, date
-from typing import Optional
+from typing import List, Optional
 from app.models.habit_log import LogStatus
 
 
@@ -23,3 +23,21 @@ class HabitLogResponse(HabitLogBase):
     class Config:
         from_attributes = True
 
+
+
+class HabitLogBulkCreate(BaseModel):
+    logs: List[HabitLogCreate] = Field(..., min_length=1, max_length=1000)
+
+
+class HabitLogBulkItemResult(BaseModel):
+    habit_id: int
+    log_date: date
+    result: str  # created, updated, duplicate or not_found
+    id: Optional[int] = None
+
+
+class HabitLogBulkResponse(BaseModel):
+    created: int
+    updated: int
+    skipped: int
+    results: List[HabitLogBulkItemResult]
@@ -0,0 +1,42 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+from app.schemas.habit import HabitResponse
+from app.schemas.habit_log import HabitLogResponse
+from app.schemas.goal import GoalResponse
+
+
+class SyncUser(BaseModel):
+    id: int
+    email: str
+    full_name: Optional[str] = None
+    total_xp: Optional[int] = 0
+    level: Optional[int] = 1
+    total_points: Optional[int] = 0
+    xp_to_next_level: int
+
+
+class SyncAchievement(BaseModel):
+    id: int
+    name: str
+    description: Optional[str] = None
+    icon: Optional[str] = None
+    unlocked_at: Optional[datetime] = None
+
+
+class SyncDeleted(BaseModel):
+    habits: List[int] = []
+    habit_logs: List[int] = []
+    goals: List[int] = []
+    achievements: List[int] = []
+
+
+class SyncResponse(BaseModel):
+    cursor: int  # Send as `since` next time
+    full: bool  # True: a complete snapshot that replaces local state
+    user: Optional[SyncUser] = None
+    habits: List[HabitResponse] = []
+    habit_logs: List[HabitLogResponse] = []
+    goals: List[GoalResponse] = []
+    achievements: List[SyncAchievement] = []
+    deleted: SyncDeleted
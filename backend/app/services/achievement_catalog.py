@@ -0,0 +1,118 @@
+import time
+from bisect import bisect_right
+from typing import Dict, List, Optional
+import redis
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from app.core.redis_client import pipelined, redis_call
+from app.models.achievement import Achievement, AchievementType
+
+
+class AchievementCatalog:
+    """
+    In-process copy of the achievements table, indexed per type by
+    requirement value so the thresholds a metric crossed are found with
+    bisects, independent of the catalog size.
+    
+    Writes to achievements bump a version counter in Redis; processes compare
+    their copy against it at most every VERSION_CHECK_SECONDS and reload when
+    it moved. Without Redis the copy is reloaded every RELOAD_SECONDS.
+    """
+    
+    VERSION_KEY = "achievements:catalog_version"
+    VERSION_CHECK_SECONDS = 5
+    RELOAD_SECONDS = 300
+    
+    def __init__(self):
+        self._thresholds: Dict[AchievementType, List[int]] = {}
+        self._entries: Dict[AchievementType, List[dict]] = {}
+        self._version: Optional[str] = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._stale = True
+    
+    def types(self, db: Session) -> List[AchievementType]:
+        """Achievement types that have at least one achievement"""
+        self._refresh(db)
+        return list(self._entries)
+    
+    def crossed(self, db: Session, achievement_type: AchievementType, value: float, previous: float = None) -> List[dict]:
+        """
+        Achievements of a type whose requirement is met by `value`; with
+        `previous`, only those crossed moving from it (requirement in
+        (previous, value])
+        """
+        self._refresh(db)
+        thresholds = self._thresholds.get(achievement_type)
+        if not thresholds:
+            return []
+        start = bisect_right(thresholds, previous) if previous is not None else 0
+        return self._entries[achievement_type][start:bisect_right(thresholds, value)]
+    
+    def invalidate(self):
+        """Drop this process's copy and tell other processes to reload theirs"""
+        self._stale = True
+        pipelined(lambda pipe: pipe.incr(self.VERSION_KEY))
+    
+    def _refresh(self, db: Session):
+        now = time.monotonic()
+        if not self._stale and now - self._checked_at < self.VERSION_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        
+        try:
+            version = redis_call(lambda client: client.get(self.VERSION_KEY))
+        except redis.RedisError:
+            version = self._version
+            if now - self._loaded_at >= self.RELOAD_SECONDS:
+                self._stale = True
+        
+        if self._stale or version != self._version:
+            self._load(db)
+            self._version = version
+            self._loaded_at = now
+            self._stale = False
+    
+    def _load(self, db: Session):
+        rows = db.query(Achievement).order_by(Achievement.requirement_value, Achievement.id).all()
+        
+        entries: Dict[AchievementType, List[dict]] = {}
+        for achievement in rows:
+            entries.setdefault(achievement.achievement_type, []).append({
+                "id": achievement.id,
+                "name": achievement.name,
+                "description": achievement.description,
+                "icon": achievement.icon,
+                "xp_reward": achievement.xp_reward or 0,
+                "requirement_value": achievement.requirement_value
+            })
+        
+        self._entries = entries
+        self._thresholds = {
+            achievement_type: [entry["requirement_value"] for entry in items]
+            for achievement_type, items in entries.items()
+        }
+
+
+achievement_catalog = AchievementCatalog()
+
+
+CATALOG_CHANGED = "achievement_catalog_changed"
+
+
+@event.listens_for(Achievement, "after_insert")
+@event.listens_for(Achievement, "after_update")
+@event.listens_for(Achievement, "after_delete")
+def _achievement_changed(mapper, connection, target):
+    inspect(target).session.info[CATALOG_CHANGED] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    if session.info.pop(CATALOG_CHANGED, False):
+        achievement_catalog.invalidate()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(CATALOG_CHANGED, None)
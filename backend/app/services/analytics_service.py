@@ -1,78 +1,46 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func, and_
 from datetime import date, timedelta
-from typing import Dict, List
+from typing import Any, Callable, Dict, List, Optional
+import redis
 from app.models.habit import Habit
-from app.models.habit_log import HabitLog, LogStatus
+from app.models.habit_log import LogStatus
+from app.core.redis_client import cache_delete, cache_read_through, get_cache_key, pipelined, redis_call
+from app.services.rollup_service import RollupService
+from app.services.habit_bitmap_service import HabitBitmapService
 
 
 class AnalyticsService:
     """Service for analytics and reporting"""
     
+    CACHE_TTL = 3600
+    DASHBOARD_CACHE_TTL = 300
+    
+    # Per-process cache counters, keyed by report name
+    cache_stats: Dict[str, Dict[str, int]] = {}
+    
     @staticmethod
     def get_heatmap_data(db: Session, user_id: int, habit_id: int, year: int = None) -> Dict:
         """Get heatmap data for a habit (GitHub-style contribution graph)"""
         if year is None:
             year = date.today().year
         
-        start_date = date(year, 1, 1)
-        end_date = date(year, 12, 31)
-        
-        # Get all logs for the year
-        logs = db.query(HabitLog).filter(
-            and_(
-                HabitLog.habit_id == habit_id,
-                HabitLog.log_date >= start_date,
-                HabitLog.log_date <= end_date,
-                HabitLog.status == LogStatus.DONE
-            )
-        ).all()
-        
-        # Create a dictionary of dates to counts
-        heatmap_data = {}
-        for log in logs:
-            date_str = log.log_date.isoformat()
-            heatmap_data[date_str] = heatmap_data.get(date_str, 0) + 1
-        
-        return {
-            "year": year,
-            "data": heatmap_data
-        }
+        return AnalyticsService._cached(
+            "heatmap", user_id, habit_id,
+            AnalyticsService._heatmap_key(user_id, habit_id, year),
+            lambda: AnalyticsService._compute_heatmap_data(db, habit_id, year)
+        )
     
     @staticmethod
     def get_weekly_stats(db: Session, user_id: int, habit_id: int) -> Dict:
         """Get weekly statistics for a habit"""
         today = date.today()
         week_start = today - timedelta(days=today.weekday())
-        week_end = week_start + timedelta(days=6)
-        
-        logs = db.query(HabitLog).filter(
-            and_(
-                HabitLog.habit_id == habit_id,
-                HabitLog.log_date >= week_start,
-                HabitLog.log_date <= week_end
-            )
-        ).all()
-        
-        stats = {
-            "done": 0,
-            "skipped": 0,
-            "missed": 0
-        }
         
-        for log in logs:
-            if log.status == LogStatus.DONE:
-                stats["done"] += 1
-            elif log.status == LogStatus.SKIPPED:
-                stats["skipped"] += 1
-            elif log.status == LogStatus.MISSED:
-                stats["missed"] += 1
-        
-        return {
-            "week_start": week_start.isoformat(),
-            "week_end": week_end.isoformat(),
-            "stats": stats
-        }
+        return AnalyticsService._cached(
+            "weekly", user_id, habit_id,
+            AnalyticsService._weekly_key(user_id, habit_id, week_start),
+            lambda: AnalyticsService._compute_weekly_stats(db, habit_id, week_start)
+        )
     
     @staticmethod
     def get_monthly_stats(db: Session, user_id: int, habit_id: int, year: int = None, month: int = None) -> Dict:
@@ -82,97 +50,227 @@ class AnalyticsService:
         if month is None:
             month = date.today().month
         
+        return AnalyticsService._cached(
+            "monthly", user_id, habit_id,
+            AnalyticsService._monthly_key(user_id, habit_id, year, month),
+            lambda: AnalyticsService._compute_monthly_stats(db, habit_id, year, month)
+        )
+    
+    @staticmethod
+    def get_consistency_trend(db: Session, user_id: int, habit_id: int, days: int = 30) -> List[Dict]:
+        """Get consistency trend over time"""
+        end_date = date.today()
+        
+        return AnalyticsService._cached(
+            "trend", user_id, habit_id,
+            AnalyticsService._trend_key(user_id, habit_id, end_date, days),
+            lambda: AnalyticsService._compute_consistency_trend(db, habit_id, end_date, days)
+        )
+    
+    @staticmethod
+    def get_user_dashboard_stats(db: Session, user_id: int) -> Dict:
+        """Get overall dashboard statistics for a user"""
+        return AnalyticsService._cached(
+            "dashboard", user_id, None,
+            AnalyticsService._dashboard_key(user_id),
+            lambda: AnalyticsService._compute_user_dashboard_stats(db, user_id),
+            ttl=AnalyticsService.DASHBOARD_CACHE_TTL
+        )
+    
+    @staticmethod
+    def invalidate_habit(user_id: int, habit_id: int, log_date: Optional[date] = None):
+        """
+        Drop cached analytics affected by a habit change.
+        
+        With a log_date only the heatmap year, week and month containing that
+        date (plus trends, which span a sliding window) are dropped; without one
+        every cached report for the habit is dropped.
+        """
+        try:
+            index_key = AnalyticsService._habit_index_key(user_id, habit_id)
+            tracked = redis_call(lambda client: client.smembers(index_key))
+            
+            if log_date is None:
+                keys = set(tracked) | {index_key}
+            else:
+                week_start = log_date - timedelta(days=log_date.weekday())
+                keys = {key for key in tracked if ":trend:" in key}
+                keys.update([
+                    AnalyticsService._heatmap_key(user_id, habit_id, log_date.year),
+                    AnalyticsService._weekly_key(user_id, habit_id, week_start),
+                    AnalyticsService._monthly_key(user_id, habit_id, log_date.year, log_date.month)
+                ])
+            keys.add(AnalyticsService._dashboard_key(user_id))
+        except redis.RedisError as e:
+            print(f"Error invalidating analytics cache: {e}")
+            return
+        
+        # Queued behind any cache writes of the current request
+        def invalidate(pipe):
+            pipe.delete(*keys)
+            if log_date is not None:
+                pipe.srem(index_key, *keys)
+        pipelined(invalidate)
+    
+    @staticmethod
+    def invalidate_dashboards(user_ids: List[int]):
+        """Drop cached dashboard stats for the given users"""
+        if user_ids:
+            cache_delete(*[AnalyticsService._dashboard_key(user_id) for user_id in user_ids])
+    
+    @staticmethod
+    def get_cache_stats() -> Dict[str, Dict[str, int]]:
+        """Get per-report cache hit/miss counters for this process"""
+        return {name: dict(counters) for name, counters in AnalyticsService.cache_stats.items()}
+    
+    @staticmethod
+    def _cached(name: str, user_id: int, habit_id: Optional[int], key: str, loader: Callable[[], Any], ttl: int = None) -> Any:
+        """Read-through cache (see cache_read_through) that also tracks the key in the habit's key index"""
+        counters = AnalyticsService.cache_stats.setdefault(name, {"hits": 0, "misses": 0, "errors": 0})
+        
+        track = None
+        if habit_id is not None:
+            index_key = AnalyticsService._habit_index_key(user_id, habit_id)
+            
+            def track(pipe):
+                pipe.sadd(index_key, key)
+                pipe.expire(index_key, AnalyticsService.CACHE_TTL)
+        
+        return cache_read_through(key, loader, expire=ttl or AnalyticsService.CACHE_TTL, counters=counters, on_store=track)
+    
+    @staticmethod
+    def _habit_index_key(user_id: int, habit_id: int) -> str:
+        return get_cache_key(f"analytics:habit:{habit_id}:keys", user_id)
+    
+    @staticmethod
+    def _heatmap_key(user_id: int, habit_id: int, year: int) -> str:
+        return get_cache_key(f"analytics:habit:{habit_id}:heatmap:{year}", user_id)
+    
+    @staticmethod
+    def _weekly_key(user_id: int, habit_id: int, week_start: date) -> str:
+        return get_cache_key(f"analytics:habit:{habit_id}:weekly:{week_start.isoformat()}", user_id)
+    
+    @staticmethod
+    def _monthly_key(user_id: int, habit_id: int, year: int, month: int) -> str:
+        return get_cache_key(f"analytics:habit:{habit_id}:monthly:{year}-{month:02d}", user_id)
+    
+    @staticmethod
+    def _trend_key(user_id: int, habit_id: int, end_date: date, days: int) -> str:
+        return get_cache_key(f"analytics:habit:{habit_id}:trend:{end_date.isoformat()}:{days}", user_id)
+    
+    @staticmethod
+    def _dashboard_key(user_id: int) -> str:
+        return get_cache_key(f"analytics:dashboard:{date.today().isoformat()}", user_id)
+    
+    @staticmethod
+    def _compute_heatmap_data(db: Session, habit_id: int, year: int) -> Dict:
+        """Compute heatmap data for a habit from its bitsets"""
+        done = HabitBitmapService.get_year(db, habit_id, year)[LogStatus.DONE]
+        
+        return {
+            "year": year,
+            "data": {day.isoformat(): 1 for day in HabitBitmapService.days_with(done, year)},
+            "bitmap": HabitBitmapService.encode(done)
+        }
+    
+    @staticmethod
+    def _compute_weekly_stats(db: Session, habit_id: int, week_start: date) -> Dict:
+        """Compute statistics for the week starting at week_start"""
+        week_end = week_start + timedelta(days=6)
+        counts = HabitBitmapService.count_range(db, habit_id, week_start, week_end)
+        
+        return {
+            "week_start": week_start.isoformat(),
+            "week_end": week_end.isoformat(),
+            "stats": {status.value: count for status, count in counts.items()}
+        }
+    
+    @staticmethod
+    def _compute_monthly_stats(db: Session, habit_id: int, year: int, month: int) -> Dict:
+        """Compute statistics for a calendar month"""
         month_start = date(year, month, 1)
         if month == 12:
             month_end = date(year + 1, 1, 1) - timedelta(days=1)
         else:
             month_end = date(year, month + 1, 1) - timedelta(days=1)
-        
-        logs = db.query(HabitLog).filter(
-            and_(
-                HabitLog.habit_id == habit_id,
-                HabitLog.log_date >= month_start,
-                HabitLog.log_date <= month_end
-            )
-        ).all()
-        
-        stats = {
-            "done": 0,
-            "skipped": 0,
-            "missed": 0
-        }
-        
-        for log in logs:
-            if log.status == LogStatus.DONE:
-                stats["done"] += 1
-            elif log.status == LogStatus.SKIPPED:
-                stats["skipped"] += 1
-            elif log.status == LogStatus.MISSED:
-                stats["missed"] += 1
+        counts = HabitBitmapService.count_range(db, habit_id, month_start, month_end)
         
         return {
             "year": year,
             "month": month,
             "month_start": month_start.isoformat(),
             "month_end": month_end.isoformat(),
-            "stats": stats
+            "stats": {status.value: count for status, count in counts.items()}
         }
     
     @staticmethod
-    def get_consistency_trend(db: Session, user_id: int, habit_id: int, days: int = 30) -> List[Dict]:
-        """Get consistency trend over time"""
-        end_date = date.today()
+    def _compute_consistency_trend(db: Session, habit_id: int, end_date: date, days: int) -> List[Dict]:
+        """Compute daily completions for the N days up to end_date"""
         start_date = end_date - timedelta(days=days)
         
-        # Group logs by date
-        logs = db.query(
-            func.date(HabitLog.log_date).label('date'),
-            func.count(HabitLog.id).filter(HabitLog.status == LogStatus.DONE).label('done')
-        ).filter(
-            and_(
-                HabitLog.habit_id == habit_id,
-                HabitLog.log_date >= start_date,
-                HabitLog.log_date <= end_date
-            )
-        ).group_by(func.date(HabitLog.log_date)).all()
-        
-        trend = []
-        for log_date, done_count in logs:
-            trend.append({
-                "date": log_date.isoformat(),
-                "completions": done_count
-            })
+        # Every logged day, with 1 completion if it was done
+        done_days = set()
+        logged_days = set()
+        for year in range(start_date.year, end_date.year + 1):
+            bitmaps = HabitBitmapService.get_year(db, habit_id, year)
+            done_days.update(HabitBitmapService.days_with(bitmaps[LogStatus.DONE], year))
+            logged_days.update(HabitBitmapService.days_with(
+                bitmaps[LogStatus.DONE] | bitmaps[LogStatus.SKIPPED] | bitmaps[LogStatus.MISSED], year
+            ))
         
-        return trend
+        return [
+            {
+                "date": log_date.isoformat(),
+                "completions": 1 if log_date in done_days else 0
+            }
+            for log_date in sorted(logged_days)
+            if start_date <= log_date <= end_date
+        ]
     
     @staticmethod
-    def get_user_dashboard_stats(db: Session, user_id: int) -> Dict:
-        """Get overall dashboard statistics for a user"""
-        habits = db.query(Habit).filter(Habit.user_id == user_id).all()
-        
-        total_habits = len(habits)
-        active_habits = len([h for h in habits if h.status.value == "active"])
-        at_risk_habits = len([h for h in habits if h.status.value == "at_risk"])
-        
-        total_streak = sum(h.current_streak for h in habits)
-        avg_consistency = sum(h.consistency_score for h in habits) / total_habits if total_habits > 0 else 0
-        
-        # Get today's completions
-        today = date.today()
-        today_logs = db.query(HabitLog).join(Habit).filter(
-            and_(
-                Habit.user_id == user_id,
-                HabitLog.log_date == today,
-                HabitLog.status == LogStatus.DONE
-            )
-        ).count()
+    def _compute_user_dashboard_stats(db: Session, user_id: int) -> Dict:
+        """Compute overall dashboard statistics for a user from today's rollup row"""
+        rollup = RollupService.get_day(db, user_id)
+        total_habits = rollup.total_habits or 0
         
         return {
             "total_habits": total_habits,
-            "active_habits": active_habits,
-            "at_risk_habits": at_risk_habits,
-            "total_streak": total_streak,
-            "average_consistency": round(avg_consistency, 2),
-            "today_completions": today_logs
+            "active_habits": rollup.active_habits or 0,
+            "at_risk_habits": rollup.at_risk_habits or 0,
+            "total_streak": rollup.total_streak or 0,
+            "average_consistency": round((rollup.consistency_total or 0) / total_habits, 2) if total_habits > 0 else 0,
+            "today_completions": rollup.done_count
         }
-
+    
+    @staticmethod
+    def get_dashboard_history(db: Session, user_id: int, days: int = 30) -> List[Dict]:
+        """Get per-day user statistics for the last `days` days from the rollup table"""
+        rollups = {rollup.day: rollup for rollup in RollupService.get_history(db, user_id, days)}
+        today = date.today()
+        
+        history = []
+        for offset in range(days - 1, -1, -1):
+            day = today - timedelta(days=offset)
+            rollup = rollups.get(day)
+            entry = {
+                "date": day.isoformat(),
+                "done": rollup.done_count if rollup else 0,
+                "skipped": rollup.skipped_count if rollup else 0,
+                "missed": rollup.missed_count if rollup else 0,
+                "xp_earned": rollup.xp_earned if rollup else 0,
+                "total_habits": None,
+                "active_habits": None,
+                "at_risk_habits": None,
+                "total_streak": None
+            }
+            # Habit snapshots only exist for days on which the user's habits changed
+            if rollup and rollup.snapshot_at:
+                entry.update(
+                    total_habits=rollup.total_habits,
+                    active_habits=rollup.active_habits,
+                    at_risk_habits=rollup.at_risk_habits,
+                    total_streak=rollup.total_streak
+                )
+            history.append(entry)
+        
+        return history
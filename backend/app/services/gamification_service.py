@@ -1,11 +1,16 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, update
 from datetime import datetime, date
-from typing import List, Optional
+from typing import Dict, List, Optional
+from app.database import commit_or_flush
 from app.models.user import User
 from app.models.habit import Habit, HabitDifficulty
 from app.models.habit_log import HabitLog, LogStatus
 from app.models.achievement import Achievement, UserAchievement, AchievementType
+from app.services.leveling import get_level_curve
+from app.services.achievement_catalog import achievement_catalog
+from app.services.rollup_service import RollupService
+from app.services.sync_service import SyncService
 
 
 class GamificationService:
@@ -27,44 +32,84 @@ class GamificationService:
         100: 1000 # 100-day streak bonus
     }
     
-    # Level calculation: XP needed for each level
+    # Level calculation: delegated to the curve selected by LEVEL_CURVE
     @staticmethod
     def xp_for_level(level: int) -> int:
-        """Calculate XP needed for a level"""
-        return level * 100  # 100 XP per level
+        """Calculate XP needed to go from the previous level to this one"""
+        return get_level_curve().xp_for_level(level)
     
     @staticmethod
     def calculate_level(total_xp: int) -> int:
         """Calculate user level based on total XP"""
-        level = 1
-        xp_needed = 0
-        while xp_needed <= total_xp:
-            level += 1
-            xp_needed += GamificationService.xp_for_level(level)
-        return max(1, level - 1)
+        return get_level_curve().level_for(total_xp)
     
     @staticmethod
     def xp_to_next_level(total_xp: int, current_level: int) -> int:
         """Calculate XP needed to reach next level"""
-        xp_for_next = GamificationService.xp_for_level(current_level + 1)
-        return max(0, xp_for_next - total_xp)
+        return max(0, get_level_curve().threshold(current_level + 1) - (total_xp or 0))
+    
+    @staticmethod
+    def relevel_all_users(db: Session, chunk_size: int = 1000) -> dict:
+        """
+        Recompute every user's level from total XP, e.g. after LEVEL_CURVE
+        changes. Users are read in id-ordered chunks and only changed levels
+        are written back, with one bulk UPDATE per chunk.
+        """
+        curve = get_level_curve()
+        last_id = 0
+        scanned = 0
+        changed = 0
+        
+        while True:
+            users = db.query(User.id, User.total_xp, User.level).filter(
+                User.id > last_id
+            ).order_by(User.id).limit(chunk_size).all()
+            if not users:
+                break
+            
+            levels = curve.levels_for([user.total_xp or 0 for user in users])
+            rows = [
+                {"id": user.id, "level": level}
+                for user, level in zip(users, levels)
+                if user.level != level
+            ]
+            if rows:
+                SyncService.allocate(db, [row["id"] for row in rows])
+                db.execute(update(User), rows)
+                db.commit()
+            
+            scanned += len(users)
+            changed += len(rows)
+            last_id = users[-1].id
+        
+        return {"users": scanned, "changed": changed}
     
     @staticmethod
     def award_xp_for_habit(db: Session, user_id: int, habit: Habit) -> dict:
         """Award XP for completing a habit"""
-        base_xp = GamificationService.XP_VALUES.get(habit.difficulty, 10)
-        
-        # Streak bonus
+        return GamificationService.award_xp_for_completions(db, user_id, [(habit, 1)])
+    
+    @staticmethod
+    def award_xp_for_completions(db: Session, user_id: int, completions: List[tuple]) -> dict:
+        """
+        Award XP for (habit, completion_count) pairs with one user update.
+        Base XP is paid per completion, the streak bonus once per habit.
+        """
+        base_xp = 0
         streak_bonus = 0
-        for streak_threshold, bonus in sorted(GamificationService.STREAK_BONUSES.items()):
-            if habit.current_streak >= streak_threshold and habit.current_streak % streak_threshold == 0:
-                streak_bonus = bonus
-                break
+        for habit, count in completions:
+            base_xp += GamificationService.XP_VALUES.get(habit.difficulty, 10) * count
+            
+            # Streak bonus
+            for streak_threshold, bonus in sorted(GamificationService.STREAK_BONUSES.items()):
+                if habit.current_streak >= streak_threshold and habit.current_streak % streak_threshold == 0:
+                    streak_bonus += bonus
+                    break
         
         total_xp = base_xp + streak_bonus
         
         # Update user XP
-        user = db.query(User).filter(User.id == user_id).first()
+        user = GamificationService._locked_user(db, user_id)
         if user:
             user.total_xp += total_xp
             user.total_points += total_xp
@@ -74,7 +119,8 @@ class GamificationService:
             user.level = GamificationService.calculate_level(user.total_xp)
             leveled_up = user.level > old_level
             
-            db.commit()
+            RollupService.add_xp(db, user_id, total_xp)
+            commit_or_flush(db)
             
             return {
                 "xp_earned": total_xp,
@@ -89,75 +135,119 @@ class GamificationService:
         return {"xp_earned": 0}
     
     @staticmethod
-    def check_achievements(db: Session, user_id: int, habit: Habit = None) -> List[dict]:
-        """Check and unlock achievements for a user"""
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            return []
+    def habit_metrics(habits: List[Habit]) -> Dict[AchievementType, float]:
+        """Best streak and consistency among `habits` (read them before a change to pass as `previous`)"""
+        if not habits:
+            return {}
+        return {
+            AchievementType.STREAK: max(h.current_streak or 0 for h in habits),
+            AchievementType.CONSISTENCY: max(h.consistency_score or 0 for h in habits),
+        }
+    
+    @staticmethod
+    def check_achievements(
+        db: Session,
+        user_id: int,
+        habit: Habit = None,
+        habits: List[Habit] = None,
+        previous: Dict[AchievementType, float] = None,
+        gained: Dict[AchievementType, int] = None
+    ) -> List[dict]:
+        """
+        Check and unlock achievements for a user. Each metric is computed at
+        most once and matched against the cached catalog; all unlocks and
+        their XP are committed together. Streak and consistency achievements
+        use the best value among `habit`/`habits`.
         
-        unlocked_achievements = []
+        On the write path callers pass the streak and consistency before the
+        change (`previous`, see habit_metrics) and how much the completion
+        and goal counts grew (`gained`): only thresholds crossed by the change
+        are matched, a count that did not grow is not computed, and the
+        unlock lookup runs only when something was crossed. Metrics in
+        neither are matched in full.
+        """
+        habits = ([habit] if habit else []) + list(habits or [])
+        previous = dict(previous or {})
+        gained = gained or {}
+        current = GamificationService.habit_metrics(habits)
+        metrics = {
+            AchievementType.STREAK: lambda: current.get(AchievementType.STREAK),
+            AchievementType.CONSISTENCY: lambda: current.get(AchievementType.CONSISTENCY),
+            AchievementType.COMPLETION: lambda: db.query(func.sum(Habit.total_completions)).filter(
+                Habit.user_id == user_id
+            ).scalar() or 0,
+            AchievementType.GOAL: lambda: GamificationService._completed_goals(db, user_id),
+        }
         
-        # Get all achievements
-        all_achievements = db.query(Achievement).all()
+        candidates = []
+        for achievement_type in achievement_catalog.types(db):
+            metric = metrics.get(achievement_type)
+            if metric is None:
+                continue
+            if achievement_type in gained and gained[achievement_type] <= 0:
+                continue
+            value = metric()
+            if value is None:
+                continue
+            if achievement_type in gained:
+                previous[achievement_type] = value - gained[achievement_type]
+            candidates.extend(achievement_catalog.crossed(db, achievement_type, value, previous.get(achievement_type)))
         
-        # Get user's unlocked achievements
-        unlocked_ids = {ua.achievement_id for ua in db.query(UserAchievement).filter(
-            UserAchievement.user_id == user_id
+        if not candidates:
+            return []
+        
+        unlocked_ids = {row.achievement_id for row in db.query(UserAchievement.achievement_id).filter(
+            and_(
+                UserAchievement.user_id == user_id,
+                UserAchievement.achievement_id.in_([achievement["id"] for achievement in candidates])
+            )
         ).all()}
+        new_achievements = [a for a in candidates if a["id"] not in unlocked_ids]
+        if not new_achievements:
+            return []
         
-        for achievement in all_achievements:
-            if achievement.id in unlocked_ids:
-                continue
-            
-            should_unlock = False
-            
-            if achievement.achievement_type == AchievementType.STREAK:
-                if habit and habit.current_streak >= achievement.requirement_value:
-                    should_unlock = True
-            
-            elif achievement.achievement_type == AchievementType.COMPLETION:
-                total_completions = db.query(func.sum(Habit.total_completions)).filter(
-                    Habit.user_id == user_id
-                ).scalar() or 0
-                if total_completions >= achievement.requirement_value:
-                    should_unlock = True
-            
-            elif achievement.achievement_type == AchievementType.CONSISTENCY:
-                if habit and habit.consistency_score >= achievement.requirement_value:
-                    should_unlock = True
-            
-            elif achievement.achievement_type == AchievementType.GOAL:
-                from app.models.goal import Goal
-                completed_goals = db.query(func.count(Goal.id)).filter(
-                    and_(Goal.user_id == user_id, Goal.is_completed == True)
-                ).scalar() or 0
-                if completed_goals >= achievement.requirement_value:
-                    should_unlock = True
-            
-            if should_unlock:
-                # Unlock achievement
-                user_achievement = UserAchievement(
-                    user_id=user_id,
-                    achievement_id=achievement.id
-                )
-                db.add(user_achievement)
-                
-                # Award XP
-                user.total_xp += achievement.xp_reward
-                user.total_points += achievement.xp_reward
-                user.level = GamificationService.calculate_level(user.total_xp)
-                
-                db.commit()
-                
-                unlocked_achievements.append({
-                    "id": achievement.id,
-                    "name": achievement.name,
-                    "description": achievement.description,
-                    "icon": achievement.icon,
-                    "xp_reward": achievement.xp_reward
-                })
-        
-        return unlocked_achievements
+        user = GamificationService._locked_user(db, user_id)
+        if not user:
+            return []
+        
+        xp_reward = sum(achievement["xp_reward"] for achievement in new_achievements)
+        db.add_all([
+            UserAchievement(user_id=user_id, achievement_id=achievement["id"])
+            for achievement in new_achievements
+        ])
+        user.total_xp += xp_reward
+        user.total_points += xp_reward
+        user.level = GamificationService.calculate_level(user.total_xp)
+        RollupService.add_xp(db, user_id, xp_reward)
+        commit_or_flush(db)
+        
+        return [
+            {
+                "id": achievement["id"],
+                "name": achievement["name"],
+                "description": achievement["description"],
+                "icon": achievement["icon"],
+                "xp_reward": achievement["xp_reward"]
+            }
+            for achievement in new_achievements
+        ]
+    
+    @staticmethod
+    def _locked_user(db: Session, user_id: int) -> Optional[User]:
+        """
+        Load the user row FOR UPDATE, so XP from concurrent requests (e.g.
+        two devices logging at once) is added to the latest total instead of
+        overwriting it. Flushes first: the row is reloaded from the database.
+        """
+        db.flush()
+        return db.query(User).filter(User.id == user_id).with_for_update().populate_existing().first()
+    
+    @staticmethod
+    def _completed_goals(db: Session, user_id: int) -> int:
+        from app.models.goal import Goal
+        return db.query(func.count(Goal.id)).filter(
+            and_(Goal.user_id == user_id, Goal.is_completed == True)
+        ).scalar() or 0
     
     @staticmethod
     def get_user_stats(db: Session, user_id: int) -> dict:
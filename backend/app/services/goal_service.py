@@ -1,10 +1,14 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from typing import List, Optional
+from sqlalchemy import and_, func, case, select, union_all, update
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.database import commit_or_flush
 from app.models.goal import Goal, GoalHabit
-from app.models.habit_log import LogStatus
+from app.models.habit_log import HabitLog, LogStatus
+from app.models.habit_log_archive import HabitLogArchiveTotal
 from app.schemas.goal import GoalCreate, GoalUpdate
-from app.core.redis_client import publish_event
+from app.services.outbox_service import OutboxService
+from app.services.sync_service import SyncService
 
 
 class GoalService:
@@ -35,6 +39,11 @@ class GoalService:
                 db.add(goal_habit)
         
         db.commit()
+        
+        # Progress is maintained incrementally from here on, so start from
+        # the linked habits' existing completions
+        if goal_data.habit_ids:
+            GoalService.recalculate_goals(db, [goal.id])
         db.refresh(goal)
         return goal
     
@@ -60,13 +69,14 @@ class GoalService:
         update_data = goal_data.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(goal, field, value)
-
+        
         # Handle habit linking/unlinking
         if habit_ids is not None:
             # Clear existing habit links for this goal
             db.query(GoalHabit).filter(GoalHabit.goal_id == goal.id).delete()
             db.flush() # Flush to ensure deletions are processed before new insertions
-
+            SyncService.touch(db, goal)
+            
             # Create new habit links
             for habit_id in habit_ids:
                 # You might want to add a check here if the habit_id actually exists and belongs to the user
@@ -78,6 +88,9 @@ class GoalService:
                 db.add(goal_habit)
         
         db.commit()
+        
+        if habit_ids is not None:
+            GoalService.recalculate_goals(db, [goal.id])
         db.refresh(goal)
         return goal
     
@@ -94,51 +107,150 @@ class GoalService:
     
     @staticmethod
     def update_goal_progress(db: Session, habit_id: int):
-        """Update goal progress when a habit is completed"""
-        # Find all goals that include this habit
-        goal_habits = db.query(GoalHabit).filter(GoalHabit.habit_id == habit_id).all()
-        
-        for goal_habit in goal_habits:
-            goal = goal_habit.goal
-            if goal.is_completed:
-                continue
-            
-            # Recalculate current value based on all contributing habits
-            total_contributions = 0.0
-            
-            for gh in goal.habit_contributions:
-                # Count done logs for this habit
-                from app.models.habit_log import HabitLog
-                done_count = db.query(HabitLog).filter(
-                    and_(
-                        HabitLog.habit_id == gh.habit_id,
-                        HabitLog.status == LogStatus.DONE
-                    )
-                ).count()
-                
-                total_contributions += done_count * gh.contribution_weight
-            
-            goal.current_value = total_contributions
-            
-            # Check if goal is completed
-            if goal.current_value >= goal.target_value and not goal.is_completed:
-                from datetime import datetime
-                goal.is_completed = True
-                goal.completed_at = datetime.utcnow()
-                
-                # Publish completion event
-                publish_event(
-                    channel=f"user:{goal.user_id}",
-                    event_type="goal_completed",
-                    data={
-                        "goal_id": goal.id,
-                        "goal_name": goal.name,
-                        "current_value": goal.current_value,
-                        "target_value": goal.target_value
-                    },
-                    user_id=goal.user_id
-                )
+        """Recalculate progress of all open goals linked to a habit from its logs"""
+        goal_ids = [row.goal_id for row in db.query(GoalHabit.goal_id).filter(GoalHabit.habit_id == habit_id).all()]
+        GoalService.recalculate_goals(db, goal_ids)
+    
+    @staticmethod
+    def apply_completion_deltas(db: Session, deltas: Dict[int, int]):
+        """
+        Apply changes in DONE log counts (habit_id -> +n/-n) to open goals.
+        Links are fetched with one joined query and every affected goal is
+        incremented in the database by a single UPDATE, then committed once
+        (or flushed inside a unit_of_work). Returns the number of goals
+        completed.
+        """
+        deltas = {habit_id: delta for habit_id, delta in deltas.items() if delta}
+        if not deltas:
+            return 0
+        
+        links = db.query(GoalHabit.goal_id, GoalHabit.habit_id, GoalHabit.contribution_weight).join(Goal).filter(
+            and_(GoalHabit.habit_id.in_(deltas), Goal.is_completed == False)
+        ).all()
+        if not links:
+            return 0
+        
+        goal_deltas: Dict[int, float] = {}
+        for link in links:
+            weight = link.contribution_weight if link.contribution_weight is not None else 1.0
+            goal_deltas[link.goal_id] = goal_deltas.get(link.goal_id, 0.0) + weight * deltas[link.habit_id]
+        
+        SyncService.allocate(db, select(Goal.user_id).where(Goal.id.in_(goal_deltas)))
+        reached = db.execute(
+            update(Goal).where(Goal.id.in_(goal_deltas)).values(
+                current_value=func.coalesce(Goal.current_value, 0.0) + case(goal_deltas, value=Goal.id, else_=0.0),
+                change_seq=SyncService.user_seq(Goal)
+            ).returning(Goal.id, Goal.current_value, Goal.target_value).execution_options(synchronize_session=False)
+        ).all()
+        
+        events = GoalService._mark_completed(db, [row.id for row in reached if row.current_value >= row.target_value])
+        OutboxService.enqueue_many(db, events)
+        commit_or_flush(db)
+        return len(events)
+    
+    @staticmethod
+    def recalculate_goals(db: Session, goal_ids: List[int] = None) -> int:
+        """
+        Recompute current_value of open goals from done log counts with one
+        grouped query and fix those that drifted. Returns the number fixed.
+        """
+        # Done logs still in habit_logs plus those archived
+        all_done = union_all(
+            select(HabitLog.habit_id.label("habit_id"), func.count(HabitLog.id).label("done")).where(
+                HabitLog.status == LogStatus.DONE
+            ).group_by(HabitLog.habit_id),
+            select(HabitLogArchiveTotal.habit_id, HabitLogArchiveTotal.done_count)
+        ).subquery()
+        done_counts = select(
+            all_done.c.habit_id, func.sum(all_done.c.done).label("done")
+        ).group_by(all_done.c.habit_id).subquery()
+        
+        query = db.query(
+            Goal.id,
+            Goal.user_id,
+            Goal.current_value,
+            Goal.target_value,
+            func.coalesce(func.sum(
+                func.coalesce(GoalHabit.contribution_weight, 1.0) * func.coalesce(done_counts.c.done, 0)
+            ), 0.0)
+        ).outerjoin(GoalHabit, GoalHabit.goal_id == Goal.id).outerjoin(
+            done_counts, done_counts.c.habit_id == GoalHabit.habit_id
+        ).filter(Goal.is_completed == False)
+        if goal_ids is not None:
+            if not goal_ids:
+                return 0
+            query = query.filter(Goal.id.in_(goal_ids))
+        
+        rows = []
+        reached = []
+        for goal_id, user_id, current_value, target_value, expected in query.group_by(Goal.id).all():
+            if abs((current_value or 0.0) - expected) > 1e-6:
+                rows.append({"id": goal_id, "user_id": user_id, "current_value": expected})
+            if expected >= target_value:
+                reached.append(goal_id)
+        
+        if rows:
+            seqs = SyncService.allocate(db, {row["user_id"] for row in rows})
+            db.execute(update(Goal), [
+                {"id": row["id"], "current_value": row["current_value"], "change_seq": seqs[row["user_id"]]}
+                for row in rows
+            ])
+        OutboxService.enqueue_many(db, GoalService._mark_completed(db, reached))
+        db.commit()
+        return len(rows)
+    
+    @staticmethod
+    def reconcile_all_goals(db: Session, chunk_size: int = 1000) -> dict:
+        """Verify progress counters of all open goals against logs, in id-ordered chunks"""
+        last_id = 0
+        checked = 0
+        fixed = 0
+        
+        while True:
+            goal_ids = [row.id for row in db.query(Goal.id).filter(
+                and_(Goal.id > last_id, Goal.is_completed == False)
+            ).order_by(Goal.id).limit(chunk_size).all()]
+            if not goal_ids:
+                break
             
-            db.commit()
-            db.refresh(goal)
-
+            fixed += GoalService.recalculate_goals(db, goal_ids)
+            checked += len(goal_ids)
+            last_id = goal_ids[-1]
+        
+        if fixed:
+            print(f"Goal reconcile fixed {fixed} of {checked} goals")
+        return {"goals": checked, "fixed": fixed}
+    
+    @staticmethod
+    def _mark_completed(db: Session, goal_ids: List[int]) -> List[dict]:
+        """Flag goals as completed (once) and build their goal_completed events"""
+        if not goal_ids:
+            return []
+        
+        SyncService.allocate(db, select(Goal.user_id).where(Goal.id.in_(goal_ids)))
+        completed = db.execute(
+            update(Goal).where(
+                and_(Goal.id.in_(goal_ids), Goal.is_completed == False)
+            ).values(
+                is_completed=True,
+                completed_at=datetime.utcnow(),
+                change_seq=SyncService.user_seq(Goal)
+            ).returning(
+                Goal.id, Goal.user_id, Goal.name, Goal.current_value, Goal.target_value
+            ).execution_options(synchronize_session=False)
+        ).all()
+        
+        return [
+            {
+                "channel": f"user:{goal.user_id}",
+                "event_type": "goal_completed",
+                "data": {
+                    "goal_id": goal.id,
+                    "goal_name": goal.name,
+                    "current_value": goal.current_value,
+                    "target_value": goal.target_value
+                },
+                "user_id": goal.user_id
+            }
+            for goal in completed
+        ]
@@ -0,0 +1,273 @@
+import base64
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, event
+from sqlalchemy.dialects.postgresql import insert
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import redis
+from app.database import commit_or_flush
+from app.models.habit import Habit
+from app.models.habit_log import HabitLog, LogStatus
+from app.models.habit_bitmap import HabitYearBitmap
+from app.core.redis_client import cache_get, cache_set, cache_delete
+from app.services.habit_log_partition_service import HabitLogPartitionService
+
+
+Bitmaps = Dict[LogStatus, int]
+
+
+class HabitBitmapService:
+    """
+    Per-habit, per-year bitsets of logged days (see HabitYearBitmap), kept in
+    the database alongside logs and cached in Redis. Range counts are a mask
+    and a popcount; streaks are found with bit_length.
+    """
+    
+    BYTES = 46
+    CACHE_KEY = "habit:{habit_id}:bitmap:{year}"
+    CACHE_TTL = 3600
+    
+    COLUMNS = {
+        LogStatus.DONE: "done_bits",
+        LogStatus.SKIPPED: "skipped_bits",
+        LogStatus.MISSED: "missed_bits",
+    }
+    
+    @staticmethod
+    def get_year(db: Session, habit_id: int, year: int) -> Bitmaps:
+        """
+        Get a habit's bitsets for a year, from Redis, the database or (if not
+        built yet) its logs. Years changed in the session's open transaction
+        bypass the cache, which only catches up after commit.
+        """
+        key = HabitBitmapService.CACHE_KEY.format(habit_id=habit_id, year=year)
+        dirty = (habit_id, year) in db.info.get(DIRTY_BITMAPS, ())
+        if not dirty:
+            try:
+                cached = cache_get(key)
+            except redis.RedisError:
+                cached = None
+            if cached:
+                return {status: int(cached[status.value], 16) for status in HabitBitmapService.COLUMNS}
+        
+        row = db.get(HabitYearBitmap, (habit_id, year))
+        if row:
+            bitmaps = HabitBitmapService._from_row(row)
+        else:
+            bitmaps = HabitBitmapService._build(db, habit_id, year)
+        
+        if dirty:
+            return bitmaps
+        # Written now rather than with the request's batch, which could land
+        # after a concurrent writer's after-commit invalidation
+        cache_set(
+            key,
+            {status.value: format(bits, "x") for status, bits in bitmaps.items()},
+            expire=HabitBitmapService.CACHE_TTL,
+            immediate=True
+        )
+        return bitmaps
+    
+    @staticmethod
+    def apply_changes(db: Session, changes: Iterable[Tuple[int, date, Optional[LogStatus], Optional[LogStatus]]]):
+        """
+        Stage (habit_id, log_date, old_status, new_status) log changes in the
+        stored bitsets; callers commit. The affected rows are locked with one
+        SELECT ... FOR UPDATE, and missing rows are built from the (already
+        flushed) logs.
+        """
+        grouped: Dict[Tuple[int, int], List[tuple]] = {}
+        for habit_id, log_date, old_status, new_status in changes:
+            if old_status != new_status:
+                grouped.setdefault((habit_id, log_date.year), []).append((log_date, old_status, new_status))
+        if not grouped:
+            return
+        
+        db.flush()
+        rows = {
+            (row.habit_id, row.year): row
+            for row in db.query(HabitYearBitmap).filter(
+                and_(
+                    HabitYearBitmap.habit_id.in_({habit_id for habit_id, _ in grouped}),
+                    HabitYearBitmap.year.in_({year for _, year in grouped})
+                )
+            ).with_for_update().all()
+        }
+        
+        for (habit_id, year), year_changes in grouped.items():
+            row = rows.get((habit_id, year))
+            if row is None:
+                # Built from logs, which already include these changes
+                HabitBitmapService._store(db, habit_id, year, HabitBitmapService._build(db, habit_id, year))
+            else:
+                bitmaps = HabitBitmapService._from_row(row)
+                for log_date, old_status, new_status in year_changes:
+                    bit = 1 << HabitBitmapService.day_index(log_date)
+                    if old_status is not None:
+                        bitmaps[old_status] &= ~bit
+                    if new_status is not None:
+                        bitmaps[new_status] |= bit
+                for status, column in HabitBitmapService.COLUMNS.items():
+                    setattr(row, column, HabitBitmapService._to_bytes(bitmaps[status]))
+            
+            db.info.setdefault(DIRTY_BITMAPS, set()).add((habit_id, year))
+    
+    @staticmethod
+    def rebuild(db: Session, habit_ids: List[int]) -> int:
+        """
+        Rebuild and store all years of bitsets for habits from their logs.
+        Bits of days whose logs were archived are kept. Returns rows written.
+        Commits, or only flushes inside a unit_of_work.
+        """
+        built: Dict[Tuple[int, int], Bitmaps] = {}
+        archived_through = HabitLogPartitionService.archived_through(db)
+        if archived_through:
+            for row in db.query(HabitYearBitmap).filter(
+                and_(HabitYearBitmap.habit_id.in_(habit_ids), HabitYearBitmap.year <= archived_through.year)
+            ).all():
+                mask = -1
+                if row.year == archived_through.year:
+                    mask = (1 << HabitBitmapService.day_index(archived_through)) - 1
+                built[(row.habit_id, row.year)] = {
+                    status: bits & mask for status, bits in HabitBitmapService._from_row(row).items()
+                }
+        db.query(HabitYearBitmap).filter(HabitYearBitmap.habit_id.in_(habit_ids)).delete(synchronize_session=False)
+        
+        for habit_id, log_date, status in db.query(HabitLog.habit_id, HabitLog.log_date, HabitLog.status).filter(
+            HabitLog.habit_id.in_(habit_ids)
+        ).all():
+            bitmaps = built.setdefault((habit_id, log_date.year), HabitBitmapService._empty())
+            bitmaps[status] |= 1 << HabitBitmapService.day_index(log_date)
+        
+        for (habit_id, year), bitmaps in built.items():
+            HabitBitmapService._store(db, habit_id, year, bitmaps, overwrite=True)
+            db.info.setdefault(DIRTY_BITMAPS, set()).add((habit_id, year))
+        commit_or_flush(db)
+        return len(built)
+    
+    @staticmethod
+    def rebuild_all(db: Session, chunk_size: int = 500) -> dict:
+        """Rebuild the bitsets of every habit in id-ordered chunks"""
+        last_id = 0
+        habits = 0
+        rows = 0
+        while True:
+            habit_ids = [row.id for row in db.query(Habit.id).filter(
+                Habit.id > last_id
+            ).order_by(Habit.id).limit(chunk_size).all()]
+            if not habit_ids:
+                break
+            rows += HabitBitmapService.rebuild(db, habit_ids)
+            habits += len(habit_ids)
+            last_id = habit_ids[-1]
+        return {"habits": habits, "rows": rows}
+    
+    @staticmethod
+    def count_range(db: Session, habit_id: int, start: date, end: date) -> Dict[LogStatus, int]:
+        """Number of days per status between start and end (inclusive)"""
+        counts = {status: 0 for status in HabitBitmapService.COLUMNS}
+        if start > end:
+            return counts
+        for year in range(start.year, end.year + 1):
+            low = HabitBitmapService.day_index(max(start, date(year, 1, 1)))
+            high = HabitBitmapService.day_index(min(end, date(year, 12, 31)))
+            mask = ((1 << (high - low + 1)) - 1) << low
+            for status, bits in HabitBitmapService.get_year(db, habit_id, year).items():
+                counts[status] += (bits & mask).bit_count()
+        return counts
+    
+    @staticmethod
+    def days_with(bits: int, year: int) -> List[date]:
+        """Dates whose bit is set"""
+        jan_first = date(year, 1, 1)
+        days = []
+        while bits:
+            lowest = bits & -bits
+            days.append(jan_first + timedelta(days=lowest.bit_length() - 1))
+            bits ^= lowest
+        return days
+    
+    @staticmethod
+    def current_streak(db: Session, habit_id: int, today: date = None) -> int:
+        """Consecutive DONE days ending today (0 if today is not done)"""
+        day = today or date.today()
+        streak = 0
+        while True:
+            done = HabitBitmapService.get_year(db, habit_id, day.year)[LogStatus.DONE]
+            index = HabitBitmapService.day_index(day)
+            # Highest not-done day at or before `day` ends the run
+            gaps = ~done & ((1 << (index + 1)) - 1)
+            if gaps:
+                return streak + index - (gaps.bit_length() - 1)
+            streak += index + 1
+            day = date(day.year - 1, 12, 31)
+    
+    @staticmethod
+    def encode(bits: int) -> str:
+        """Base64 of the 46-byte bitset, for clients"""
+        return base64.b64encode(HabitBitmapService._to_bytes(bits)).decode()
+    
+    @staticmethod
+    def day_index(day: date) -> int:
+        return day.timetuple().tm_yday - 1
+    
+    @staticmethod
+    def _build(db: Session, habit_id: int, year: int) -> Bitmaps:
+        bitmaps = HabitBitmapService._empty()
+        for log_date, status in db.query(HabitLog.log_date, HabitLog.status).filter(
+            and_(
+                HabitLog.habit_id == habit_id,
+                HabitLog.log_date >= date(year, 1, 1),
+                HabitLog.log_date <= date(year, 12, 31)
+            )
+        ).all():
+            bitmaps[status] |= 1 << HabitBitmapService.day_index(log_date)
+        return bitmaps
+    
+    @staticmethod
+    def _store(db: Session, habit_id: int, year: int, bitmaps: Bitmaps, overwrite: bool = False):
+        values = {
+            column: HabitBitmapService._to_bytes(bitmaps[status])
+            for status, column in HabitBitmapService.COLUMNS.items()
+        }
+        stmt = insert(HabitYearBitmap).values(habit_id=habit_id, year=year, **values)
+        key = [HabitYearBitmap.habit_id, HabitYearBitmap.year]
+        if overwrite:
+            stmt = stmt.on_conflict_do_update(index_elements=key, set_=values)
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=key)
+        db.execute(stmt)
+    
+    @staticmethod
+    def _from_row(row: HabitYearBitmap) -> Bitmaps:
+        return {
+            status: int.from_bytes(getattr(row, column), "little")
+            for status, column in HabitBitmapService.COLUMNS.items()
+        }
+    
+    @staticmethod
+    def _empty() -> Bitmaps:
+        return {status: 0 for status in HabitBitmapService.COLUMNS}
+    
+    @staticmethod
+    def _to_bytes(bits: int) -> bytes:
+        return bits.to_bytes(HabitBitmapService.BYTES, "little")
+
+
+DIRTY_BITMAPS = "dirty_habit_bitmaps"
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    dirty = session.info.pop(DIRTY_BITMAPS, None)
+    if not dirty:
+        return
+    cache_delete(*[
+        HabitBitmapService.CACHE_KEY.format(habit_id=habit_id, year=year)
+        for habit_id, year in dirty
+    ])
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(DIRTY_BITMAPS, None)
@@ -0,0 +1,254 @@
+import gzip
+import os
+import re
+from sqlalchemy.orm import Session
+from sqlalchemy import func, text
+from dateutil.relativedelta import relativedelta
+from datetime import date
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.database import unit_of_work
+from app.models.habit_log import HabitLog
+from app.models.habit_log_archive import HabitLogArchive
+
+
+Partition = Tuple[str, date, date]
+
+
+class HabitLogPartitionService:
+    """
+    Opt-in range partitioning of habit_logs by log_date (monthly or yearly
+    partitions plus a DEFAULT one), future partition creation, and archival
+    of partitions older than HABIT_LOGS_ARCHIVE_AFTER_MONTHS into gzipped
+    CSV. Archived per-habit counts go to habit_log_archive_totals so
+    recomputing stats from logs keeps all-time totals. PostgreSQL only;
+    everything is a no-op while habit_logs is a plain table.
+    """
+    
+    TABLE = "habit_logs"
+    DEFAULT_PARTITION = "habit_logs_default"
+    INTERVALS = {"month": relativedelta(months=1), "year": relativedelta(years=1)}
+    BOUND = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+    
+    @staticmethod
+    def is_partitioned(db: Session) -> bool:
+        if db.get_bind().dialect.name != "postgresql":
+            return False
+        return bool(db.execute(text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"
+        ), {"table": HabitLogPartitionService.TABLE}).scalar())
+    
+    @staticmethod
+    def partitions(db: Session) -> List[Partition]:
+        """Range partitions of habit_logs as (name, start, end), oldest first; end is exclusive"""
+        rows = db.execute(text("""
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(:table)
+        """), {"table": HabitLogPartitionService.TABLE}).all()
+        
+        partitions = []
+        for name, bound in rows:
+            match = HabitLogPartitionService.BOUND.search(bound)
+            if match:
+                partitions.append((name, date.fromisoformat(match.group(1)), date.fromisoformat(match.group(2))))
+        return sorted(partitions, key=lambda partition: partition[1])
+    
+    @staticmethod
+    def interval(db: Session) -> Optional[str]:
+        """Partition interval in use, inferred from the existing partitions"""
+        for _, start, end in HabitLogPartitionService.partitions(db):
+            return "year" if end == start + relativedelta(years=1) else "month"
+        return None
+    
+    @staticmethod
+    def archived_through(db: Session) -> Optional[date]:
+        """Logs dated before this day were archived (None if nothing was)"""
+        return db.query(func.max(HabitLogArchive.range_end)).scalar()
+    
+    @staticmethod
+    def convert(db: Session, interval: str = "month", ahead: int = None):
+        """
+        Turn habit_logs into a table partitioned by range of log_date: the
+        rows are copied into a new partitioned table that takes over the
+        name, constraints, indexes and id sequence. Callers commit; the
+        table is locked until then.
+        """
+        if interval not in HabitLogPartitionService.INTERVALS:
+            raise ValueError(f"Unknown partition interval: {interval}")
+        if HabitLogPartitionService.is_partitioned(db):
+            return
+        
+        old = HabitLogPartitionService._swap_out(db, "unpartitioned")
+        HabitLogPartitionService._create_table(db, old, "PRIMARY KEY (id, log_date)", "PARTITION BY RANGE (log_date)")
+        db.execute(text(
+            f"CREATE TABLE {HabitLogPartitionService.DEFAULT_PARTITION} PARTITION OF {HabitLogPartitionService.TABLE} DEFAULT"
+        ))
+        
+        first_day = db.execute(text(f"SELECT min(log_date) FROM {old}")).scalar() or date.today()
+        for start, end in HabitLogPartitionService._ranges(interval, first_day, ahead):
+            db.execute(text(
+                f"CREATE TABLE {HabitLogPartitionService._partition_name(start, interval)} "
+                f"PARTITION OF {HabitLogPartitionService.TABLE} FOR VALUES FROM ('{start}') TO ('{end}')"
+            ))
+        
+        HabitLogPartitionService._swap_in(db, old)
+    
+    @staticmethod
+    def revert(db: Session):
+        """Turn a partitioned habit_logs back into a plain table (archived partitions stay archived). Callers commit."""
+        if not HabitLogPartitionService.is_partitioned(db):
+            return
+        old = HabitLogPartitionService._swap_out(db, "partitioned")
+        HabitLogPartitionService._create_table(db, old, "PRIMARY KEY (id)", "")
+        HabitLogPartitionService._swap_in(db, old)
+    
+    @staticmethod
+    def ensure_future_partitions(db: Session, ahead: int = None) -> List[str]:
+        """Create missing partitions from the current interval to `ahead` intervals later"""
+        if not HabitLogPartitionService.is_partitioned(db):
+            return []
+        interval = HabitLogPartitionService.interval(db) or "month"
+        existing = {name for name, _, _ in HabitLogPartitionService.partitions(db)}
+        
+        created = []
+        for start, end in HabitLogPartitionService._ranges(interval, date.today(), ahead):
+            name = HabitLogPartitionService._partition_name(start, interval)
+            if name not in existing:
+                HabitLogPartitionService._attach_partition(db, name, start, end)
+                created.append(name)
+        db.commit()
+        return created
+    
+    @staticmethod
+    def archive(db: Session, months: int = None, directory: str = None) -> List[dict]:
+        """Archive every partition that ends at least `months` months before the current month"""
+        months = settings.HABIT_LOGS_ARCHIVE_AFTER_MONTHS if months is None else months
+        if not months or not HabitLogPartitionService.is_partitioned(db):
+            return []
+        cutoff = date.today().replace(day=1) - relativedelta(months=months)
+        
+        return [
+            HabitLogPartitionService.archive_partition(db, name, start, end, directory)
+            for name, start, end in HabitLogPartitionService.partitions(db)
+            if end <= cutoff
+        ]
+    
+    @staticmethod
+    def archive_partition(db: Session, name: str, start: date, end: date, directory: str = None) -> dict:
+        """
+        Export a partition to <directory>/<name>.csv.gz, add its per-habit
+        counts to habit_log_archive_totals, then detach and drop it, in one
+        transaction (the bitset rebuilds only flush inside it). A failed run
+        leaves the partition attached and can be retried.
+        """
+        from app.services.habit_bitmap_service import HabitBitmapService
+        
+        with unit_of_work(db):
+            # The bitsets become the only day-level history of these logs
+            habit_ids = [row[0] for row in db.execute(text(f"SELECT DISTINCT habit_id FROM {name} ORDER BY habit_id")).all()]
+            for i in range(0, len(habit_ids), 500):
+                HabitBitmapService.rebuild(db, habit_ids[i:i + 500])
+            
+            db.execute(text(f"""
+                INSERT INTO habit_log_archive_totals (habit_id, done_count, skipped_count, missed_count)
+                SELECT habit_id,
+                       count(*) FILTER (WHERE status = 'DONE'),
+                       count(*) FILTER (WHERE status = 'SKIPPED'),
+                       count(*) FILTER (WHERE status = 'MISSED')
+                FROM {name}
+                GROUP BY habit_id
+                ON CONFLICT (habit_id) DO UPDATE SET
+                    done_count = habit_log_archive_totals.done_count + excluded.done_count,
+                    skipped_count = habit_log_archive_totals.skipped_count + excluded.skipped_count,
+                    missed_count = habit_log_archive_totals.missed_count + excluded.missed_count
+            """))
+            row_count = db.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            
+            directory = directory or settings.HABIT_LOGS_ARCHIVE_DIR
+            os.makedirs(directory, exist_ok=True)
+            file_path = os.path.join(directory, f"{name}.csv.gz")
+            cursor = db.connection().connection.cursor()
+            with gzip.open(file_path, "wt") as export:
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", export)
+            
+            db.execute(text(f"ALTER TABLE {HabitLogPartitionService.TABLE} DETACH PARTITION {name}"))
+            db.execute(text(f"DROP TABLE {name}"))
+            db.add(HabitLogArchive(
+                partition_name=name, range_start=start, range_end=end, row_count=row_count, file_path=file_path
+            ))
+        
+        return {"partition": name, "rows": row_count, "file": file_path}
+    
+    @staticmethod
+    def _ranges(interval: str, first_day: date, ahead: int = None) -> List[Tuple[date, date]]:
+        """Consecutive partition ranges from the one containing first_day to `ahead` intervals past today's"""
+        step = HabitLogPartitionService.INTERVALS[interval]
+        ahead = settings.HABIT_LOGS_PARTITIONS_AHEAD if ahead is None else ahead
+        start = first_day.replace(day=1) if interval == "month" else first_day.replace(month=1, day=1)
+        last = date.today() + step * ahead
+        
+        ranges = []
+        while start <= last:
+            ranges.append((start, start + step))
+            start += step
+        return ranges
+    
+    @staticmethod
+    def _partition_name(start: date, interval: str) -> str:
+        suffix = f"{start:%Y}" if interval == "year" else f"{start:%Y_%m}"
+        return f"{HabitLogPartitionService.TABLE}_p{suffix}"
+    
+    @staticmethod
+    def _attach_partition(db: Session, name: str, start: date, end: date):
+        # Rows for the range that landed in the default partition move along;
+        # ATTACH only takes a SHARE UPDATE EXCLUSIVE lock on habit_logs
+        table = HabitLogPartitionService.TABLE
+        db.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+        db.execute(text(f"""
+            WITH moved AS (
+                DELETE FROM {HabitLogPartitionService.DEFAULT_PARTITION}
+                WHERE log_date >= :start AND log_date < :end
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+        """), {"start": start, "end": end})
+        db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM ('{start}') TO ('{end}')"))
+    
+    @staticmethod
+    def _swap_out(db: Session, suffix: str) -> str:
+        """Rename habit_logs and its constraints out of the way and drop its indexes; returns the new name"""
+        table = HabitLogPartitionService.TABLE
+        old = f"{table}_{suffix}"
+        db.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        db.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+        db.execute(text(f"ALTER TABLE {old} RENAME CONSTRAINT {table}_pkey TO {old}_pkey"))
+        db.execute(text(f"ALTER TABLE {old} RENAME CONSTRAINT unique_habit_date TO unique_habit_date_{suffix}"))
+        for index in HabitLog.__table__.indexes:
+            db.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+        return old
+    
+    @staticmethod
+    def _create_table(db: Session, old: str, primary_key: str, partitioning: str):
+        db.execute(text(f"""
+            CREATE TABLE {HabitLogPartitionService.TABLE} (
+                LIKE {old} INCLUDING DEFAULTS,
+                {primary_key},
+                CONSTRAINT unique_habit_date UNIQUE (habit_id, log_date),
+                FOREIGN KEY (habit_id) REFERENCES habits (id)
+            ) {partitioning}
+        """))
+    
+    @staticmethod
+    def _swap_in(db: Session, old: str):
+        """Move the rows and id sequence of `old` to the new habit_logs, index it and drop `old`"""
+        table = HabitLogPartitionService.TABLE
+        sequence = db.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": old}).scalar()
+        if sequence:
+            db.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+        db.execute(text(f"INSERT INTO {table} SELECT * FROM {old}"))
+        for index in HabitLog.__table__.indexes:
+            index.create(db.connection())
+        db.execute(text(f"DROP TABLE {old}"))
+        db.execute(text(f"ANALYZE {table}"))
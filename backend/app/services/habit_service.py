@@ -1,23 +1,44 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, func
+from sqlalchemy import and_, func, inspect
+from sqlalchemy.dialects.postgresql import insert
 from datetime import date, datetime, timedelta
+from itertools import groupby
 from typing import List, Optional
-from app.models.habit import Habit, HabitStatus
+from app.database import commit_or_flush, unit_of_work
+from app.models.habit import Habit, HabitStatus, HabitFrequency
 from app.models.habit_log import HabitLog, LogStatus
+from app.models.habit_log_archive import HabitLogArchiveTotal
+from app.models.achievement import AchievementType
 from app.schemas.habit import HabitCreate, HabitUpdate
-from app.core.redis_client import publish_event, cache_get, cache_set, get_cache_key
+from app.schemas.habit_log import HabitLogCreate
+from app.core.redis_client import cache_delete, cache_read_through, get_cache_key
+from app.services.analytics_service import AnalyticsService
+from app.services.rollup_service import RollupService
+from app.services.habit_bitmap_service import HabitBitmapService
+from app.services.outbox_service import OutboxService
+from app.services.sync_service import SyncService
 
 
 class HabitService:
     """Service for habit-related business logic"""
     
+    # Rows per INSERT ... ON CONFLICT statement in bulk_log_habits
+    BULK_CHUNK_SIZE = 500
+    
+    # Days of log history the Today checklist can include, and its cache lifetime
+    TODAY_MAX_DAYS = 7
+    TODAY_CACHE_TTL = 300
+    
     @staticmethod
     def create_habit(db: Session, user_id: int, habit_data: HabitCreate) -> Habit:
         """Create a new habit"""
         habit = Habit(user_id=user_id, **habit_data.dict())
         db.add(habit)
+        db.flush()
+        RollupService.apply_habit_changes(db, user_id, RollupService.habit_change({}, RollupService.habit_totals(habit)))
         db.commit()
         db.refresh(habit)
+        HabitService.invalidate_today([user_id])
         return habit
     
     @staticmethod
@@ -42,12 +63,18 @@ class HabitService:
         if not habit:
             return None
         
+        before = RollupService.habit_totals(habit)
         update_data = habit_data.dict(exclude_unset=True)
         for field, value in update_data.items():
             setattr(habit, field, value)
         
+        RollupService.apply_habit_changes(db, user_id, RollupService.habit_change(before, RollupService.habit_totals(habit)))
         db.commit()
         db.refresh(habit)
+        
+        # Only the dashboard aggregates habit attributes; per-habit reports are log-based
+        AnalyticsService.invalidate_dashboards([user_id])
+        HabitService.invalidate_today([user_id])
         return habit
     
     @staticmethod
@@ -57,18 +84,113 @@ class HabitService:
         if not habit:
             return False
         
+        RollupService.remove_habit_logs(db, user_id, habit_id)
+        before = RollupService.habit_totals(habit)
         db.delete(habit)
+        RollupService.apply_habit_changes(db, user_id, RollupService.habit_change(before, {}))
         db.commit()
+        AnalyticsService.invalidate_habit(user_id, habit_id)
+        HabitService.invalidate_today([user_id])
         return True
     
+    @staticmethod
+    def get_today(db: Session, user_id: int, days: int = 1) -> dict:
+        """
+        Checklist of all the user's habits with their log status today and on
+        the `days - 1` days before, read in one query and cached per user
+        until a log or habit change drops it.
+        """
+        today = date.today()
+        return cache_read_through(
+            HabitService._today_key(user_id, today, days),
+            lambda: HabitService._compute_today(db, user_id, today, days),
+            expire=HabitService.TODAY_CACHE_TTL
+        )
+    
+    @staticmethod
+    def invalidate_today(user_ids: List[int]):
+        """Drop the cached Today checklists of the given users"""
+        today = date.today()
+        cache_delete(*[
+            HabitService._today_key(user_id, today, days)
+            for user_id in user_ids
+            for days in range(1, HabitService.TODAY_MAX_DAYS + 1)
+        ])
+    
+    @staticmethod
+    def _today_key(user_id: int, today: date, days: int) -> str:
+        return get_cache_key(f"habits:today:{today.isoformat()}:{days}", user_id)
+    
+    @staticmethod
+    def _compute_today(db: Session, user_id: int, today: date, days: int) -> dict:
+        # Habits LEFT JOIN their logs in the window; the log side is read from ix_habit_logs_habit_date_status alone
+        start = today - timedelta(days=days - 1)
+        rows = db.query(
+            Habit.id, Habit.name, Habit.frequency, Habit.status, Habit.current_streak,
+            HabitLog.log_date, HabitLog.status.label("log_status")
+        ).outerjoin(HabitLog, and_(
+            HabitLog.habit_id == Habit.id,
+            HabitLog.log_date >= start,
+            HabitLog.log_date <= today
+        )).filter(
+            Habit.user_id == user_id
+        ).order_by(Habit.created_at.desc(), Habit.id).all()
+        
+        habits = []
+        for _, habit_rows in groupby(rows, key=lambda row: row.id):
+            habit_rows = list(habit_rows)
+            statuses = {row.log_date: row.log_status.value for row in habit_rows if row.log_date is not None}
+            habit = habit_rows[0]
+            habits.append({
+                "id": habit.id,
+                "name": habit.name,
+                "frequency": habit.frequency.value,
+                "status": habit.status.value,
+                "current_streak": habit.current_streak,
+                "today": statuses.get(today),
+                # Newest first, starting the day before today
+                "recent": [statuses.get(today - timedelta(days=offset)) for offset in range(1, days)]
+            })
+        return {"date": today.isoformat(), "habits": habits}
+    
+    @staticmethod
+    def get_habit_logs(db: Session, habit_id: int, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[HabitLog]:
+        """Get logs for a habit, newest first"""
+        query = db.query(HabitLog).filter(HabitLog.habit_id == habit_id)
+        
+        if start_date:
+            query = query.filter(HabitLog.log_date >= start_date)
+        if end_date:
+            query = query.filter(HabitLog.log_date <= end_date)
+        
+        return query.order_by(HabitLog.log_date.desc()).all()
+    
     @staticmethod
     def log_habit(db: Session, habit_id: int, user_id: int, log_date: date, status: LogStatus, notes: Optional[str] = None) -> Optional[HabitLog]:
-        """Log a habit completion/skip/miss"""
+        """
+        Log a habit completion/skip/miss. The log, stats, rollups, goal
+        progress, XP, achievements and the real-time event are written in one
+        transaction (see unit_of_work) with a single commit.
+        """
         # Verify habit belongs to user
         habit = HabitService.get_habit(db, habit_id, user_id)
         if not habit:
             return None
         
+        with unit_of_work(db):
+            log = HabitService._log_habit(db, habit, user_id, log_date, status, notes)
+        AnalyticsService.invalidate_habit(user_id, habit_id, log_date)
+        HabitService.invalidate_today([user_id])
+        
+        # Only server-side timestamps not returned by the flush need a reload
+        if inspect(log).expired_attributes:
+            db.refresh(log)
+        return log
+    
+    @staticmethod
+    def _log_habit(db: Session, habit: Habit, user_id: int, log_date: date, status: LogStatus, notes: Optional[str]) -> HabitLog:
+        habit_id = habit.id
+        
         # Check if log already exists
         existing_log = db.query(HabitLog).filter(
             and_(
@@ -78,29 +200,43 @@ class HabitService:
         ).first()
         
         if existing_log:
+            old_status = existing_log.status
             existing_log.status = status
             existing_log.notes = notes
-            db.commit()
-            db.refresh(existing_log)
+            RollupService.apply_log_changes(db, user_id, {log_date: RollupService.log_change(old_status, status)})
+            HabitBitmapService.apply_changes(db, [(habit_id, log_date, old_status, status)])
             log = existing_log
         else:
+            old_status = None
             log = HabitLog(habit_id=habit_id, log_date=log_date, status=status, notes=notes)
             db.add(log)
-            db.commit()
-            db.refresh(log)
+            RollupService.apply_log_changes(db, user_id, {log_date: RollupService.log_change(None, status)})
+            HabitBitmapService.apply_changes(db, [(habit_id, log_date, None, status)])
+        
+        # The stats below count logs in the database
+        db.flush()
         
-        # Update habit statistics
-        HabitService._update_habit_stats(db, habit)
+        # Update habit statistics from the status transition of this log
+        from app.services.gamification_service import GamificationService
+        previous = GamificationService.habit_metrics([habit])
+        HabitService._apply_log_delta(db, habit, log_date, old_status, status)
+        
+        # Goal progress follows the change in done logs
+        from app.services.goal_service import GoalService
+        done_delta = int(status == LogStatus.DONE) - int(old_status == LogStatus.DONE)
+        goals_completed = GoalService.apply_completion_deltas(db, {habit_id: done_delta})
         
         # Gamification: Award XP and check achievements if habit is completed
         xp_data = {}
         achievements = []
         if status == LogStatus.DONE:
-            from app.services.gamification_service import GamificationService
             xp_data = GamificationService.award_xp_for_habit(db, user_id, habit)
-            achievements = GamificationService.check_achievements(db, user_id, habit)
+            achievements = GamificationService.check_achievements(
+                db, user_id, habit, previous=previous,
+                gained={AchievementType.COMPLETION: done_delta, AchievementType.GOAL: goals_completed}
+            )
         
-        # Publish real-time event
+        # Real-time event, relayed to Redis once committed
         event_data = {
             "habit_id": habit_id,
             "habit_name": habit.name,
@@ -119,7 +255,8 @@ class HabitService:
         if achievements:
             event_data["achievements_unlocked"] = achievements
         
-        publish_event(
+        OutboxService.enqueue(
+            db,
             channel=f"user:{user_id}",
             event_type="habit_logged",
             data=event_data,
@@ -128,9 +265,176 @@ class HabitService:
         
         return log
     
+    @staticmethod
+    def bulk_log_habits(db: Session, user_id: int, logs: List[HabitLogCreate]) -> dict:
+        """
+        Upsert many logs with INSERT ... ON CONFLICT (habit_id, log_date), then
+        recompute stats per affected habit, award XP and achievements, update
+        linked goals and publish a single habits_logged event for the batch,
+        all in one transaction (see unit_of_work). XP is only awarded for logs
+        that became DONE.
+        """
+        from app.services.gamification_service import GamificationService
+        from app.services.goal_service import GoalService
+        from app.services.stats_rebuild_service import StatsRebuildService
+        
+        owned_ids = {row.id for row in db.query(Habit.id).filter(
+            and_(Habit.user_id == user_id, Habit.id.in_({log.habit_id for log in logs}))
+        ).all()}
+        
+        # The last entry wins for repeated (habit_id, log_date) pairs; a single
+        # ON CONFLICT statement cannot update the same row twice
+        results = [
+            {"habit_id": log.habit_id, "log_date": log.log_date, "result": "not_found"}
+            for log in logs
+        ]
+        latest = {}
+        for index, log in enumerate(logs):
+            if log.habit_id not in owned_ids:
+                continue
+            key = (log.habit_id, log.log_date)
+            if key in latest:
+                results[latest[key]]["result"] = "duplicate"
+            latest[key] = index
+        
+        if not latest:
+            return {"created": 0, "updated": 0, "skipped": len(logs), "results": results}
+        
+        with unit_of_work(db):
+            # Previous status of every targeted row, to tell inserts from updates
+            # and to find logs that became (or stopped being) DONE
+            existing = {
+                (row.habit_id, row.log_date): row.status
+                for row in db.query(HabitLog.habit_id, HabitLog.log_date, HabitLog.status).filter(
+                    and_(
+                        HabitLog.habit_id.in_({habit_id for habit_id, _ in latest}),
+                        HabitLog.log_date.in_({log_date for _, log_date in latest})
+                    )
+                ).all()
+                if (row.habit_id, row.log_date) in latest
+            }
+            
+            change_seq = SyncService.allocate(db, [user_id])[user_id]
+            rows = [
+                {
+                    "habit_id": logs[index].habit_id,
+                    "log_date": logs[index].log_date,
+                    "status": logs[index].status,
+                    "notes": logs[index].notes,
+                    "change_seq": change_seq
+                }
+                for index in latest.values()
+            ]
+            log_ids = {}
+            for start in range(0, len(rows), HabitService.BULK_CHUNK_SIZE):
+                stmt = insert(HabitLog).values(rows[start:start + HabitService.BULK_CHUNK_SIZE])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[HabitLog.habit_id, HabitLog.log_date],
+                    set_={
+                        "status": stmt.excluded.status,
+                        "notes": stmt.excluded.notes,
+                        "change_seq": stmt.excluded.change_seq,
+                        "updated_at": func.now()
+                    }
+                ).returning(HabitLog.id, HabitLog.habit_id, HabitLog.log_date)
+                for row in db.execute(stmt):
+                    log_ids[(row.habit_id, row.log_date)] = row.id
+            
+            created = 0
+            newly_done = {}
+            done_deltas = {}
+            rollup_changes = {}
+            for key, index in latest.items():
+                old_status = existing.get(key)
+                new_status = logs[index].status
+                if old_status is None:
+                    created += 1
+                results[index].update(result="created" if old_status is None else "updated", id=log_ids.get(key))
+                
+                if new_status == LogStatus.DONE and old_status != LogStatus.DONE:
+                    newly_done[key[0]] = newly_done.get(key[0], 0) + 1
+                delta = int(new_status == LogStatus.DONE) - int(old_status == LogStatus.DONE)
+                done_deltas[key[0]] = done_deltas.get(key[0], 0) + delta
+                
+                day_changes = rollup_changes.setdefault(key[1], {})
+                for status, count in RollupService.log_change(old_status, new_status).items():
+                    day_changes[status] = day_changes.get(status, 0) + count
+            
+            RollupService.apply_log_changes(db, user_id, rollup_changes)
+            HabitBitmapService.apply_changes(db, [
+                (habit_id, log_date, existing.get((habit_id, log_date)), logs[index].status)
+                for (habit_id, log_date), index in latest.items()
+            ])
+            
+            # Stats: one set-based recomputation for all affected habits
+            affected_ids = sorted({habit_id for habit_id, _ in latest})
+            habits = db.query(Habit).filter(Habit.id.in_(affected_ids)).all()
+            previous = GamificationService.habit_metrics([habit for habit in habits if habit.id in newly_done])
+            StatsRebuildService.rebuild_habits(db, affected_ids)
+            habits = db.query(Habit).filter(Habit.id.in_(affected_ids)).populate_existing().all()
+            
+            goals_completed = GoalService.apply_completion_deltas(db, done_deltas)
+            
+            # Gamification: once for the whole batch
+            xp_data = {}
+            achievements = []
+            completed_habits = [habit for habit in habits if habit.id in newly_done]
+            if completed_habits:
+                xp_data = GamificationService.award_xp_for_completions(
+                    db, user_id, [(habit, newly_done[habit.id]) for habit in completed_habits]
+                )
+                achievements = GamificationService.check_achievements(
+                    db, user_id, habits=completed_habits, previous=previous,
+                    gained={AchievementType.COMPLETION: sum(done_deltas.values()), AchievementType.GOAL: goals_completed}
+                )
+            
+            # One coalesced real-time event for the batch
+            event_data = {
+                "logs": [
+                    {
+                        "habit_id": logs[index].habit_id,
+                        "log_date": str(logs[index].log_date),
+                        "status": logs[index].status.value
+                    }
+                    for index in latest.values()
+                ],
+                "habits": [
+                    {"habit_id": habit.id, "habit_name": habit.name, "streak": habit.current_streak}
+                    for habit in habits
+                ]
+            }
+            if xp_data:
+                event_data["xp_earned"] = xp_data.get("xp_earned", 0)
+                event_data["level"] = xp_data.get("level", 1)
+                event_data["leveled_up"] = xp_data.get("leveled_up", False)
+                event_data["total_xp"] = xp_data.get("total_xp", 0)
+            if achievements:
+                event_data["achievements_unlocked"] = achievements
+            
+            OutboxService.enqueue(
+                db,
+                channel=f"user:{user_id}",
+                event_type="habits_logged",
+                data=event_data,
+                user_id=user_id
+            )
+        
+        for habit_id in affected_ids:
+            AnalyticsService.invalidate_habit(user_id, habit_id)
+        HabitService.invalidate_today([user_id])
+        
+        return {
+            "created": created,
+            "updated": len(latest) - created,
+            "skipped": len(logs) - len(latest),
+            "results": results
+        }
+    
     @staticmethod
     def _update_habit_stats(db: Session, habit: Habit):
         """Update habit statistics (streak, consistency, etc.)"""
+        before = RollupService.habit_totals(habit)
+        
         # Count logs
         total_logs = db.query(func.count(HabitLog.id)).filter(
             HabitLog.habit_id == habit.id
@@ -150,8 +454,16 @@ class HabitService:
             )
         ).scalar()
         
+        # Logs moved out by partition archival still count toward the all-time totals
+        archived = db.get(HabitLogArchiveTotal, habit.id)
+        if archived:
+            total_logs += archived.done_count + archived.skipped_count + archived.missed_count
+            done_logs += archived.done_count
+            skipped_logs += archived.skipped_count
+        
         habit.total_completions = done_logs
         habit.total_skips = skipped_logs
+        habit.total_logs = total_logs
         
         # Calculate streak
         streak = HabitService._calculate_streak(db, habit)
@@ -183,36 +495,116 @@ class HabitService:
         # Check for consecutive misses
         HabitService._check_consecutive_misses(db, habit)
         
-        db.commit()
-        db.refresh(habit)
+        RollupService.apply_habit_changes(db, habit.user_id, RollupService.habit_change(before, RollupService.habit_totals(habit)))
+        if commit_or_flush(db):
+            db.refresh(habit)
     
     @staticmethod
-    def _calculate_streak(db: Session, habit: Habit) -> int:
-        """Calculate current streak of completed habits"""
-        # Get all done logs ordered by date descending
-        done_logs = db.query(HabitLog).filter(
-            and_(
-                HabitLog.habit_id == habit.id,
-                HabitLog.status == LogStatus.DONE
-            )
-        ).order_by(HabitLog.log_date.desc()).all()
-        
-        if not done_logs:
-            return 0
-        
-        streak = 0
+    def _apply_log_delta(db: Session, habit: Habit, log_date: date, old_status: Optional[LogStatus], new_status: LogStatus):
+        """
+        Incrementally update habit statistics for a single log insert/update.
+        
+        Counters, streaks, last completion and failure rate are derived from the
+        old -> new status transition instead of re-scanning the habit's history.
+        Falls back to a full rebuild only when the change extends the streak
+        window backwards (or the stored counters cannot be trusted).
+        """
+        if habit.total_logs is None:
+            HabitService._update_habit_stats(db, habit)
+            return
+        
+        before = RollupService.habit_totals(habit)
         today = date.today()
-        expected_date = today
+        was_done = old_status == LogStatus.DONE
+        is_done = new_status == LogStatus.DONE
+        last_done = habit.last_completed_date.date() if habit.last_completed_date else None
+        
+        # A completion logged for a future date leaves the stored streak anchor
+        # ambiguous, so rebuild rather than guess
+        if last_done and last_done > today and log_date <= today and was_done != is_done:
+            HabitService._update_habit_stats(db, habit)
+            return
+        
+        # Counters
+        if old_status is None:
+            habit.total_logs += 1
+        habit.total_completions += int(is_done) - int(was_done)
+        habit.total_skips += int(new_status == LogStatus.SKIPPED) - int(old_status == LogStatus.SKIPPED)
+        
+        # Last completed date
+        new_last_done = last_done
+        if is_done and (last_done is None or log_date > last_done):
+            new_last_done = log_date
+        elif was_done and not is_done and log_date == last_done:
+            new_last_done = db.query(func.max(HabitLog.log_date)).filter(
+                and_(
+                    HabitLog.habit_id == habit.id,
+                    HabitLog.status == LogStatus.DONE
+                )
+            ).scalar()
+        
+        habit.last_completed_date = (
+            datetime.combine(new_last_done, datetime.min.time()) if new_last_done else None
+        )
         
-        for log in done_logs:
-            if log.log_date == expected_date:
-                streak += 1
-                expected_date -= timedelta(days=1)
-            elif log.log_date < expected_date:
-                # Gap found, streak broken
-                break
+        # Current streak: consecutive DONE days ending today (0 if today is not done).
+        # Logs dated after today are outside it and leave it as it was
+        if log_date > today:
+            pass
+        elif not HabitService._done_today(db, habit, today, log_date, is_done, new_last_done):
+            habit.current_streak = 0
+        elif log_date == today and is_done and not was_done:
+            if last_done == today - timedelta(days=1):
+                if habit.current_streak:
+                    habit.current_streak += 1
+                else:
+                    # The nightly recompute zeroes runs not yet done today; yesterday's run is in the bitmap
+                    habit.current_streak = HabitBitmapService.current_streak(db, habit.id, today - timedelta(days=1)) + 1
+            else:
+                habit.current_streak = 1
+        elif log_date < today and was_done != is_done:
+            window_start = today - timedelta(days=max(habit.current_streak, 1) - 1)
+            if was_done and log_date >= window_start:
+                # Streak now starts the day after the broken date
+                habit.current_streak = (today - log_date).days
+            elif is_done and log_date == window_start - timedelta(days=1):
+                # Back-dated completion joins the streak to an older run
+                HabitService._update_habit_stats(db, habit)
+                return
+        
+        if habit.current_streak > (habit.longest_streak or 0):
+            habit.longest_streak = habit.current_streak
+        
+        # Failure rate
+        if habit.total_logs > 0:
+            habit.failure_rate = (habit.total_skips / habit.total_logs) * 100
+        else:
+            habit.failure_rate = 0.0
+        
+        # Windowed stats only touch the last 30 days, independent of history size
+        habit.consistency_score = HabitService._calculate_consistency_score(db, habit)
+        HabitService._check_consecutive_misses(db, habit)
         
-        return streak
+        RollupService.apply_habit_changes(db, habit.user_id, RollupService.habit_change(before, RollupService.habit_totals(habit)))
+        if commit_or_flush(db):
+            db.refresh(habit)
+    
+    @staticmethod
+    def _done_today(db: Session, habit: Habit, today: date, log_date: date, is_done: bool, last_done: Optional[date]) -> bool:
+        """Whether today is done after logging `log_date`, given the habit's latest completion"""
+        if log_date == today:
+            return is_done
+        if last_done is not None and last_done > today:
+            # The latest completion is future-dated and says nothing about today
+            return db.query(HabitLog.status).filter(
+                and_(HabitLog.habit_id == habit.id, HabitLog.log_date == today)
+            ).scalar() == LogStatus.DONE
+        return last_done == today
+    
+    @staticmethod
+    def _calculate_streak(db: Session, habit: Habit) -> int:
+        """Calculate current streak of completed habits"""
+        return HabitBitmapService.current_streak(db, habit.id)
     
     @staticmethod
     def _calculate_consistency_score(db: Session, habit: Habit, days: int = 30) -> float:
@@ -220,24 +612,22 @@ class HabitService:
         end_date = date.today()
         start_date = end_date - timedelta(days=days)
         
+        # Count actual completions
+        completions = HabitBitmapService.count_range(db, habit.id, start_date, end_date)[LogStatus.DONE]
+        
+        return HabitService._consistency_from_completions(habit.frequency, completions, days)
+    
+    @staticmethod
+    def _consistency_from_completions(frequency: HabitFrequency, completions: int, days: int = 30) -> float:
+        """Convert a completion count over the last N days into a 0-100 score"""
         # Count expected days (based on frequency)
-        if habit.frequency.value == "daily":
+        if frequency.value == "daily":
             expected_days = days
-        elif habit.frequency.value == "weekly":
+        elif frequency.value == "weekly":
             expected_days = days // 7
         else:
             expected_days = days // 7  # Default to weekly
         
-        # Count actual completions
-        completions = db.query(func.count(HabitLog.id)).filter(
-            and_(
-                HabitLog.habit_id == habit.id,
-                HabitLog.status == LogStatus.DONE,
-                HabitLog.log_date >= start_date,
-                HabitLog.log_date <= end_date
-            )
-        ).scalar()
-        
         if expected_days == 0:
             return 0.0
         
@@ -270,8 +660,9 @@ class HabitService:
         # Mark as at risk if 2 consecutive misses
         if missed_count >= 2 and habit.status == HabitStatus.ACTIVE:
             habit.status = HabitStatus.AT_RISK
-            # Publish risk alert
-            publish_event(
+            # Risk alert, published when the caller commits
+            OutboxService.enqueue(
+                db,
                 channel=f"user:{habit.user_id}",
                 event_type="habit_at_risk",
                 data={
@@ -0,0 +1,93 @@
+from bisect import bisect_right
+from math import isqrt
+from typing import Callable, Dict, List, Sequence
+from app.config import settings
+
+
+class LevelCurve:
+    """
+    Maps levels to XP. `xp_for_level(level)` is the XP needed to go from
+    `level - 1` to `level`; level 1 starts at 0 XP.
+    
+    Cumulative thresholds are precomputed up to `table_size` levels (and
+    extended on demand), so level lookups are a bisect instead of a loop.
+    """
+    
+    def __init__(self, xp_for_level: Callable[[int], int], table_size: int = 1000):
+        self.xp_for_level = xp_for_level
+        self._thresholds: List[int] = [0, 0]
+        self._extend(table_size)
+    
+    def threshold(self, level: int) -> int:
+        """Cumulative XP needed to reach a level"""
+        if level < 1:
+            return 0
+        if level >= len(self._thresholds):
+            self._extend(level)
+        return self._thresholds[level]
+    
+    def level_for(self, total_xp: int) -> int:
+        """Level reached with the given total XP"""
+        total_xp = max(0, total_xp or 0)
+        self._cover(total_xp)
+        return max(1, bisect_right(self._thresholds, total_xp) - 1)
+    
+    def levels_for(self, xps: Sequence[int]) -> List[int]:
+        """Levels for many XP totals at once"""
+        if xps:
+            self._cover(max(xp or 0 for xp in xps))
+        thresholds = self._thresholds
+        return [max(1, bisect_right(thresholds, max(0, xp or 0)) - 1) for xp in xps]
+    
+    def xp_to_next_level(self, total_xp: int) -> int:
+        """XP still needed to reach the level after the one `total_xp` is at"""
+        return max(0, self.threshold(self.level_for(total_xp) + 1) - (total_xp or 0))
+    
+    def _cover(self, total_xp: int):
+        while total_xp >= self._thresholds[-1]:
+            self._extend(2 * len(self._thresholds))
+    
+    def _extend(self, max_level: int):
+        # _thresholds[level] is the cumulative XP for that level; index 0 is unused
+        for level in range(len(self._thresholds), max_level + 1):
+            self._thresholds.append(self._thresholds[-1] + self.xp_for_level(level))
+
+
+class ArithmeticCurve(LevelCurve):
+    """
+    `step * level` XP per level. The cumulative threshold is
+    step * (L(L+1)/2 - 1), so the level is solved in closed form.
+    """
+    
+    def __init__(self, step: int = 100, table_size: int = 1000):
+        self.step = step
+        super().__init__(lambda level: step * level, table_size)
+    
+    def level_for(self, total_xp: int) -> int:
+        # Largest L with L(L+1) <= 2 * total_xp / step + 2
+        n = (2 * max(0, total_xp or 0)) // self.step + 2
+        return max(1, (isqrt(4 * n + 1) - 1) // 2)
+
+
+LEVEL_CURVES: Dict[str, Callable[[], LevelCurve]] = {
+    "linear": lambda: ArithmeticCurve(100),
+    "quadratic": lambda: LevelCurve(lambda level: 50 * level * level),
+    "exponential": lambda: LevelCurve(lambda level: int(100 * 1.15 ** (level - 2))),
+}
+
+_curve: LevelCurve = None
+
+
+def register_curve(name: str, factory: Callable[[], LevelCurve]):
+    """Make a level curve selectable through the LEVEL_CURVE setting"""
+    LEVEL_CURVES[name] = factory
+
+
+def get_level_curve() -> LevelCurve:
+    """The level curve selected by LEVEL_CURVE, built once per process"""
+    global _curve
+    if _curve is None:
+        if settings.LEVEL_CURVE not in LEVEL_CURVES:
+            raise ValueError(f"Unknown level curve: {settings.LEVEL_CURVE}")
+        _curve = LEVEL_CURVES[settings.LEVEL_CURVE]()
+    return _curve
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import uuid
+import redis
+from sqlalchemy.orm import Session
+from sqlalchemy import delete, event, func, insert, update
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+from app.config import settings
+from app.core.redis_client import build_event, get_redis_client, stream_and_publish
+from app.database import SessionLocal
+from app.models.outbox_event import OutboxEvent
+
+
+class OutboxService:
+    """
+    Transactional outbox for real-time events.
+    
+    Services add events to the session with `enqueue` before they commit, so
+    an event exists exactly when the change that caused it does and writes
+    never wait on Redis. The relay appends pending rows to their channels'
+    replay streams, publishes them in id order (two pipelines per batch)
+    and marks them published. Delivery is at least once: a relay that dies
+    between publishing and marking publishes (and streams) the batch again,
+    so every message carries its `event_id` for consumers to drop
+    duplicates.
+    """
+    
+    @staticmethod
+    def enqueue(db: Session, channel: str, event_type: str, data: Dict[str, Any], user_id: int = None):
+        """Add an event to the current transaction (same arguments as publish_event)"""
+        OutboxService.enqueue_many(db, [
+            {"channel": channel, "event_type": event_type, "data": data, "user_id": user_id}
+        ])
+    
+    @staticmethod
+    def enqueue_many(db: Session, events: List[Dict[str, Any]]):
+        """Add many events (dicts with publish_event's arguments) with one INSERT"""
+        if not events:
+            return
+        rows = []
+        for item in events:
+            event_id = str(uuid.uuid4())
+            message = build_event(item["event_type"], item["data"], item.get("user_id"))
+            message["id"] = event_id
+            rows.append({"event_id": event_id, "channel": item["channel"], "payload": json.dumps(message)})
+        db.execute(insert(OutboxEvent), rows)
+        db.info[PENDING_EVENTS] = True
+    
+    @staticmethod
+    def relay(db: Session, batch_size: int = None, max_batches: int = None) -> int:
+        """
+        Publish pending events until none are left (or max_batches batches
+        were sent). Concurrent relays skip each other's locked rows. Returns
+        the number published; Redis errors are raised after rolling back, so
+        the batch stays pending.
+        """
+        batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        published = 0
+        batches = 0
+        
+        while max_batches is None or batches < max_batches:
+            rows = db.query(OutboxEvent.id, OutboxEvent.channel, OutboxEvent.payload).filter(
+                OutboxEvent.published_at.is_(None)
+            ).order_by(OutboxEvent.id).limit(batch_size).with_for_update(skip_locked=True).all()
+            if not rows:
+                db.commit()
+                break
+            
+            try:
+                stream_and_publish(get_redis_client(), [(row.channel, json.loads(row.payload)) for row in rows])
+            except redis.RedisError:
+                db.rollback()
+                raise
+            
+            db.execute(
+                update(OutboxEvent).where(OutboxEvent.id.in_([row.id for row in rows])).values(published_at=func.now())
+            )
+            db.commit()
+            published += len(rows)
+            batches += 1
+        
+        return published
+    
+    @staticmethod
+    def purge(db: Session, older_than: timedelta = None) -> int:
+        """Delete events published more than OUTBOX_RETENTION_HOURS ago"""
+        older_than = older_than or timedelta(hours=settings.OUTBOX_RETENTION_HOURS)
+        deleted = db.execute(
+            delete(OutboxEvent).where(OutboxEvent.published_at < func.now() - older_than)
+        ).rowcount
+        db.commit()
+        return deleted
+    
+    @staticmethod
+    def pending_count(db: Session) -> int:
+        return db.query(func.count(OutboxEvent.id)).filter(OutboxEvent.published_at.is_(None)).scalar()
+
+
+class OutboxRelay:
+    """
+    Relay loop for the API process: woken right after a commit that added
+    events, and every OUTBOX_POLL_SECONDS to pick up events committed by
+    other processes or left over after a Redis outage.
+    """
+    
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.published = 0
+        self.errors = 0
+    
+    def start(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    def wake(self):
+        """Ask the loop to relay now; safe to call from any thread"""
+        if self._task is None or self._loop is None or self._loop.is_closed():
+            return
+        self._loop.call_soon_threadsafe(self._wakeup.set)
+    
+    def get_stats(self) -> dict:
+        return {"running": self._task is not None and not self._task.done(), "published": self.published, "errors": self.errors}
+    
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            
+            try:
+                self.published += await asyncio.to_thread(self._relay)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"Error relaying outbox events: {e}")
+    
+    @staticmethod
+    def _relay() -> int:
+        db = SessionLocal()
+        try:
+            return OutboxService.relay(db)
+        finally:
+            db.close()
+
+
+outbox_relay = OutboxRelay()
+
+
+PENDING_EVENTS = "outbox_pending"
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_relay_after_commit(session):
+    if session.info.pop(PENDING_EVENTS, False):
+        outbox_relay.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop(PENDING_EVENTS, None)
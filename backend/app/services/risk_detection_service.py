@@ -1,10 +1,16 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_
+from sqlalchemy import and_, or_, exists, func, select, update
 from datetime import date, timedelta
-from typing import List
+from itertools import groupby
+from typing import Iterator, List, Tuple
+from app.models.user import User
 from app.models.habit import Habit, HabitStatus, HabitFrequency
 from app.models.habit_log import HabitLog, LogStatus
-from app.core.redis_client import publish_event
+from app.services.analytics_service import AnalyticsService
+from app.services.habit_service import HabitService
+from app.services.rollup_service import RollupService
+from app.services.outbox_service import OutboxService
+from app.services.sync_service import SyncService
 
 
 class RiskDetectionService:
@@ -46,8 +52,9 @@ class RiskDetectionService:
                 habit.consecutive_misses = missed_count
                 at_risk.append(habit)
                 
-                # Publish risk alert
-                publish_event(
+                # Risk alert, published once committed
+                OutboxService.enqueue(
+                    db,
                     channel=f"user:{user_id}",
                     event_type="habit_at_risk",
                     data={
@@ -58,9 +65,77 @@ class RiskDetectionService:
                     user_id=user_id
                 )
         
+        RollupService.apply_habit_changes(db, user_id, {"active_habits": -len(at_risk), "at_risk_habits": len(at_risk)})
         db.commit()
         return at_risk
     
+    @staticmethod
+    def detect_all_at_risk_habits(db: Session) -> List[dict]:
+        """
+        Cluster-wide risk detection for all active users.
+        
+        Flags every ACTIVE habit without a DONE log on either of the last two
+        days with a single anti-join UPDATE, adds the alerts to the outbox and
+        commits once. The owners' change sequences are bumped first; habits
+        of other users that start matching in between are left for the next
+        run.
+        """
+        today = date.today()
+        yesterday = today - timedelta(days=1)
+        day_before = today - timedelta(days=2)
+        
+        recent_done = exists().where(
+            and_(
+                HabitLog.habit_id == Habit.id,
+                HabitLog.status == LogStatus.DONE,
+                HabitLog.log_date.in_([yesterday, day_before])
+            )
+        )
+        active_users = select(User.id).where(User.is_active == True)
+        at_risk_filter = and_(
+            Habit.status == HabitStatus.ACTIVE,
+            Habit.user_id.in_(active_users),
+            ~recent_done
+        )
+        
+        seqs = SyncService.allocate(db, select(Habit.user_id).where(at_risk_filter))
+        if not seqs:
+            db.commit()
+            return []
+        
+        flagged = db.execute(
+            update(Habit)
+            .where(and_(at_risk_filter, Habit.user_id.in_(list(seqs))))
+            .values(status=HabitStatus.AT_RISK, consecutive_misses=2, change_seq=SyncService.user_seq(Habit))
+            .returning(Habit.id, Habit.user_id, Habit.name)
+            .execution_options(synchronize_session=False)
+        ).all()
+        at_risk = [
+            {"id": habit_id, "user_id": user_id, "name": name}
+            for habit_id, user_id, name in flagged
+        ]
+        RollupService.refresh_snapshots(db, {habit["user_id"] for habit in at_risk})
+        OutboxService.enqueue_many(db, [
+            {
+                "channel": f"user:{habit['user_id']}",
+                "event_type": "habit_at_risk",
+                "data": {
+                    "habit_id": habit["id"],
+                    "habit_name": habit["name"],
+                    "consecutive_misses": 2
+                },
+                "user_id": habit["user_id"]
+            }
+            for habit in at_risk
+        ])
+        db.commit()
+        
+        user_ids = list({habit["user_id"] for habit in at_risk})
+        AnalyticsService.invalidate_dashboards(user_ids)
+        HabitService.invalidate_today(user_ids)
+        
+        return at_risk
+    
     @staticmethod
     def generate_adaptive_suggestions(db: Session, habit: Habit) -> dict:
         """Generate adaptive suggestions based on failure rate"""
@@ -119,4 +194,46 @@ class RiskDetectionService:
                 inactive.append(habit)
         
         return inactive
+    
+    @staticmethod
+    def iter_inactive_habits(db: Session, days_inactive: int = 7, page_size: int = 500) -> Iterator[List[Tuple[int, List[dict]]]]:
+        """
+        Stream inactive habits for all active users.
+        
+        A single grouped query computes MAX(log_date) per ACTIVE habit and keeps
+        those not logged since the cutoff. Rows are streamed from a server-side
+        cursor ordered by user and yielded as pages of up to page_size
+        (user_id, [{"id", "name"}, ...]) pairs.
+        """
+        cutoff_date = date.today() - timedelta(days=days_inactive)
+        last_log_date = func.max(HabitLog.log_date)
+        
+        rows = db.query(
+            Habit.user_id, Habit.id, Habit.name
+        ).join(
+            User, User.id == Habit.user_id
+        ).outerjoin(
+            HabitLog, HabitLog.habit_id == Habit.id
+        ).filter(
+            and_(
+                User.is_active == True,
+                Habit.status == HabitStatus.ACTIVE
+            )
+        ).group_by(
+            Habit.user_id, Habit.id, Habit.name
+        ).having(
+            or_(last_log_date.is_(None), last_log_date < cutoff_date)
+        ).order_by(
+            Habit.user_id, Habit.id
+        ).execution_options(yield_per=page_size)
+        
+        page = []
+        for user_id, habit_rows in groupby(rows, key=lambda row: row.user_id):
+            page.append((user_id, [{"id": row.id, "name": row.name} for row in habit_rows]))
+            if len(page) >= page_size:
+                yield page
+                page = []
+        
+        if page:
+            yield page
 
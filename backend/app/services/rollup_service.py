@@ -0,0 +1,278 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, select, update, literal, bindparam
+from sqlalchemy.dialects.postgresql import insert
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional
+from app.models.user import User
+from app.models.habit import Habit, HabitStatus
+from app.models.habit_log import HabitLog, LogStatus
+from app.models.user_daily_rollup import UserDailyRollup
+from app.services.habit_log_partition_service import HabitLogPartitionService
+
+
+class RollupService:
+    """
+    Maintains user_daily_rollups: per user and day, log counts by status, XP
+    earned and a snapshot of the user's habits. Helpers only stage changes;
+    callers commit.
+    """
+    
+    COUNT_COLUMNS = {
+        LogStatus.DONE: "done_count",
+        LogStatus.SKIPPED: "skipped_count",
+        LogStatus.MISSED: "missed_count",
+    }
+    
+    SNAPSHOT_COLUMNS = ("total_habits", "active_habits", "at_risk_habits", "total_streak", "consistency_total")
+    
+    @staticmethod
+    def apply_log_changes(db: Session, user_id: int, changes: Dict[date, Dict[LogStatus, int]]):
+        """Add per-day, per-status log count deltas to the user's rollups"""
+        rows = []
+        for day, deltas in changes.items():
+            row = {"user_id": user_id, "day": day}
+            for status, column in RollupService.COUNT_COLUMNS.items():
+                row[column] = deltas.get(status, 0)
+            if any(row[column] for column in RollupService.COUNT_COLUMNS.values()):
+                rows.append(row)
+        if not rows:
+            return
+        
+        columns = list(RollupService.COUNT_COLUMNS.values())
+        key = [UserDailyRollup.user_id, UserDailyRollup.day]
+        
+        # Deltas are applied in the database so concurrent writers don't
+        # overwrite each other: increments as an upsert, decrements as an
+        # UPDATE of the (existing) rows
+        increments = [dict(row, **{column: max(0, row[column]) for column in columns}) for row in rows]
+        increments = [row for row in increments if any(row[column] for column in columns)]
+        if increments:
+            stmt = insert(UserDailyRollup).values(increments)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=key,
+                set_={column: getattr(UserDailyRollup, column) + stmt.excluded[column] for column in columns}
+            ))
+        
+        decrements = [
+            {"b_user_id": row["user_id"], "b_day": row["day"], **{f"b_{column}": min(0, row[column]) for column in columns}}
+            for row in rows
+            if any(row[column] < 0 for column in columns)
+        ]
+        if decrements:
+            table = UserDailyRollup.__table__
+            db.execute(
+                update(table).where(
+                    and_(table.c.user_id == bindparam("b_user_id"), table.c.day == bindparam("b_day"))
+                ).values({
+                    column: func.greatest(table.c[column] + bindparam(f"b_{column}"), 0)
+                    for column in columns
+                }),
+                decrements
+            )
+    
+    @staticmethod
+    def log_change(old_status: Optional[LogStatus], new_status: Optional[LogStatus]) -> Dict[LogStatus, int]:
+        """Count deltas for one log moving from old_status to new_status"""
+        deltas: Dict[LogStatus, int] = {}
+        if old_status == new_status:
+            return deltas
+        if old_status is not None:
+            deltas[old_status] = deltas.get(old_status, 0) - 1
+        if new_status is not None:
+            deltas[new_status] = deltas.get(new_status, 0) + 1
+        return deltas
+    
+    @staticmethod
+    def remove_habit_logs(db: Session, user_id: int, habit_id: int):
+        """Subtract a habit's logs from the rollups (before deleting the habit)"""
+        changes: Dict[date, Dict[LogStatus, int]] = {}
+        for log_date, status, count in db.query(
+            HabitLog.log_date, HabitLog.status, func.count(HabitLog.id)
+        ).filter(HabitLog.habit_id == habit_id).group_by(HabitLog.log_date, HabitLog.status).all():
+            changes.setdefault(log_date, {})[status] = -count
+        RollupService.apply_log_changes(db, user_id, changes)
+    
+    @staticmethod
+    def add_xp(db: Session, user_id: int, xp: int, day: date = None):
+        """Add XP earned to the user's rollup for a day (today by default)"""
+        if not xp:
+            return
+        stmt = insert(UserDailyRollup).values(user_id=user_id, day=day or date.today(), xp_earned=xp)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[UserDailyRollup.user_id, UserDailyRollup.day],
+            set_={"xp_earned": UserDailyRollup.xp_earned + stmt.excluded.xp_earned}
+        ))
+    
+    @staticmethod
+    def habit_totals(habit: Habit) -> Dict[str, float]:
+        """A habit's contribution to the snapshot columns"""
+        return {
+            "total_habits": 1,
+            "active_habits": int(habit.status == HabitStatus.ACTIVE),
+            "at_risk_habits": int(habit.status == HabitStatus.AT_RISK),
+            "total_streak": habit.current_streak or 0,
+            "consistency_total": habit.consistency_score or 0.0,
+        }
+    
+    @staticmethod
+    def habit_change(before: Dict[str, float], after: Dict[str, float]) -> Dict[str, float]:
+        """Snapshot deltas for one habit moving from `before` to `after` totals ({} if absent)"""
+        return {column: after.get(column, 0) - before.get(column, 0) for column in RollupService.SNAPSHOT_COLUMNS}
+    
+    @staticmethod
+    def apply_habit_changes(db: Session, user_id: int, deltas: Dict[str, float], day: date = None):
+        """
+        Add habit snapshot deltas to the user's rollup for a day (today by
+        default). The first change on a day without a snapshot takes one
+        instead, which already includes the change.
+        """
+        deltas = {column: value for column, value in deltas.items() if value}
+        if not deltas:
+            return
+        day = day or date.today()
+        
+        table = UserDailyRollup.__table__
+        result = db.execute(
+            update(table).where(
+                and_(table.c.user_id == user_id, table.c.day == day, table.c.snapshot_at.isnot(None))
+            ).values({
+                **{column: table.c[column] + value for column, value in deltas.items()},
+                "snapshot_at": func.now()
+            })
+        )
+        if not result.rowcount:
+            RollupService.refresh_snapshots(db, [user_id], day)
+    
+    @staticmethod
+    def refresh_snapshots(db: Session, user_ids: Iterable[int], day: date = None):
+        """
+        Recompute the habit snapshot columns of the users' rollups for a day
+        (today by default) with one aggregate INSERT ... SELECT ... ON CONFLICT.
+        Used by batch jobs and to seed a day's snapshot; writes of single
+        habits go through apply_habit_changes.
+        """
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+        # Make pending ORM changes to habits visible to the aggregate
+        db.flush()
+        
+        snapshot = select(
+            User.id,
+            literal(day or date.today()),
+            func.count(Habit.id),
+            func.count(Habit.id).filter(Habit.status == HabitStatus.ACTIVE),
+            func.count(Habit.id).filter(Habit.status == HabitStatus.AT_RISK),
+            func.coalesce(func.sum(Habit.current_streak), 0),
+            func.coalesce(func.sum(Habit.consistency_score), 0.0),
+            func.now()
+        ).select_from(User).outerjoin(Habit, Habit.user_id == User.id).where(
+            User.id.in_(user_ids)
+        ).group_by(User.id)
+        
+        columns = [
+            "user_id", "day", "total_habits", "active_habits", "at_risk_habits",
+            "total_streak", "consistency_total", "snapshot_at"
+        ]
+        stmt = insert(UserDailyRollup).from_select(columns, snapshot)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[UserDailyRollup.user_id, UserDailyRollup.day],
+            set_={column: stmt.excluded[column] for column in columns[2:]}
+        ))
+    
+    @staticmethod
+    def get_day(db: Session, user_id: int, day: date = None) -> UserDailyRollup:
+        """
+        Get a user's rollup for a day by primary key, without writing. Before
+        the day's first habit change (or the backfill), the habit snapshot is
+        carried over from the user's latest earlier one.
+        """
+        day = day or date.today()
+        rollup = db.get(UserDailyRollup, (user_id, day))
+        if rollup is not None and rollup.snapshot_at is not None:
+            return rollup
+        
+        previous = db.query(UserDailyRollup).filter(
+            and_(
+                UserDailyRollup.user_id == user_id,
+                UserDailyRollup.day < day,
+                UserDailyRollup.snapshot_at.isnot(None)
+            )
+        ).order_by(UserDailyRollup.day.desc()).first()
+        
+        # Transient: never added to the session
+        return UserDailyRollup(
+            user_id=user_id,
+            day=day,
+            done_count=rollup.done_count if rollup else 0,
+            skipped_count=rollup.skipped_count if rollup else 0,
+            missed_count=rollup.missed_count if rollup else 0,
+            xp_earned=rollup.xp_earned if rollup else 0,
+            **{column: getattr(previous, column) if previous else 0 for column in RollupService.SNAPSHOT_COLUMNS},
+            snapshot_at=previous.snapshot_at if previous else None
+        )
+    
+    @staticmethod
+    def get_history(db: Session, user_id: int, days: int = 30) -> List[UserDailyRollup]:
+        """Get a user's rollups for the last `days` days (oldest first), one range scan on the primary key"""
+        today = date.today()
+        return db.query(UserDailyRollup).filter(
+            and_(
+                UserDailyRollup.user_id == user_id,
+                UserDailyRollup.day > today - timedelta(days=days),
+                UserDailyRollup.day <= today
+            )
+        ).order_by(UserDailyRollup.day).all()
+    
+    @staticmethod
+    def backfill(db: Session, days: Optional[int] = None, chunk_size: int = 500) -> dict:
+        """
+        Rebuild log counts from habit_logs (all history still in habit_logs,
+        or the last `days` days) and refresh today's snapshots, in user-id
+        ordered chunks
+        """
+        since = date.today() - timedelta(days=days - 1) if days else None
+        # Days whose logs were archived keep their counts
+        archived_through = HabitLogPartitionService.archived_through(db)
+        if archived_through and (since is None or since < archived_through):
+            since = archived_through
+        last_id = 0
+        users = 0
+        
+        while True:
+            user_ids = [row.id for row in db.query(User.id).filter(
+                User.id > last_id
+            ).order_by(User.id).limit(chunk_size).all()]
+            if not user_ids:
+                break
+            
+            reset = update(UserDailyRollup).where(UserDailyRollup.user_id.in_(user_ids)).values(
+                done_count=0, skipped_count=0, missed_count=0
+            )
+            counts = select(
+                Habit.user_id,
+                HabitLog.log_date,
+                func.count(HabitLog.id).filter(HabitLog.status == LogStatus.DONE),
+                func.count(HabitLog.id).filter(HabitLog.status == LogStatus.SKIPPED),
+                func.count(HabitLog.id).filter(HabitLog.status == LogStatus.MISSED)
+            ).join(Habit, Habit.id == HabitLog.habit_id).where(
+                Habit.user_id.in_(user_ids)
+            ).group_by(Habit.user_id, HabitLog.log_date)
+            if since:
+                reset = reset.where(UserDailyRollup.day >= since)
+                counts = counts.where(HabitLog.log_date >= since)
+            
+            columns = ["user_id", "day", "done_count", "skipped_count", "missed_count"]
+            stmt = insert(UserDailyRollup).from_select(columns, counts)
+            db.execute(reset.execution_options(synchronize_session=False))
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[UserDailyRollup.user_id, UserDailyRollup.day],
+                set_={column: stmt.excluded[column] for column in columns[2:]}
+            ))
+            RollupService.refresh_snapshots(db, user_ids)
+            db.commit()
+            
+            users += len(user_ids)
+            last_id = user_ids[-1]
+        
+        return {"users": users, "since": since.isoformat() if since else None}
@@ -0,0 +1,287 @@
+from sqlalchemy.orm import Session
+from sqlalchemy import and_, func, case, cast, update, Integer
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import time
+import redis
+from app.database import commit_or_flush
+from app.models.habit import Habit, HabitStatus
+from app.models.habit_log import HabitLog, LogStatus
+from app.models.habit_log_archive import HabitLogArchiveTotal
+from app.services.analytics_service import AnalyticsService
+from app.services.habit_service import HabitService
+from app.services.rollup_service import RollupService
+from app.services.outbox_service import OutboxService
+from app.services.sync_service import SyncService
+from app.core.redis_client import cache_get, cache_set, get_redis_client
+
+
+class StatsRebuildService:
+    """Set-based recomputation of habit statistics for batch jobs"""
+    
+    CURSOR_KEY = "stats_rebuild:cursor"
+    CURSOR_EXPIRE = 2 * 86400
+    DEFAULT_CHUNK_SIZE = 1000
+    CONSISTENCY_DAYS = 30
+    
+    # Stored stats compared with the recomputed values
+    STATS_COLUMNS = (
+        "total_logs", "total_completions", "total_skips", "current_streak", "longest_streak",
+        "consistency_score", "failure_rate", "consecutive_misses", "last_completed_date"
+    )
+    
+    @staticmethod
+    def rebuild_all(
+        db: Session,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        status: Optional[HabitStatus] = HabitStatus.ACTIVE,
+        resume: bool = True
+    ) -> Dict:
+        """
+        Recompute stats for all habits (optionally filtered by status) in
+        keyset-paginated chunks. Progress is checkpointed in Redis after every
+        chunk so a crashed run resumes where it stopped on the same day.
+        """
+        today = date.today()
+        last_id = 0
+        
+        if resume:
+            cursor = StatsRebuildService._load_cursor()
+            if cursor and cursor.get("run_date") == today.isoformat():
+                last_id = cursor.get("last_id", 0)
+        
+        chunks = []
+        started_at = time.monotonic()
+        
+        while True:
+            query = db.query(Habit.id).filter(Habit.id > last_id)
+            if status:
+                query = query.filter(Habit.status == status)
+            habit_ids = [row.id for row in query.order_by(Habit.id).limit(chunk_size).all()]
+            if not habit_ids:
+                break
+            
+            chunk_started = time.monotonic()
+            updated = StatsRebuildService.rebuild_habits(db, habit_ids, today)
+            elapsed_ms = round((time.monotonic() - chunk_started) * 1000, 1)
+            
+            last_id = habit_ids[-1]
+            StatsRebuildService._save_cursor(today, last_id)
+            
+            chunks.append({"last_id": last_id, "habits": updated, "elapsed_ms": elapsed_ms})
+            print(f"Stats rebuild chunk up to habit {last_id}: {updated} habits in {elapsed_ms} ms")
+        
+        StatsRebuildService._clear_cursor()
+        
+        return {
+            "run_date": today.isoformat(),
+            "habits": sum(chunk["habits"] for chunk in chunks),
+            "chunks": chunks,
+            "elapsed_ms": round((time.monotonic() - started_at) * 1000, 1)
+        }
+    
+    @staticmethod
+    def rebuild_habits(db: Session, habit_ids: List[int], today: date = None) -> int:
+        """
+        Recompute stats for a set of habits with two aggregate queries over
+        habit_logs and write the ones that changed back with a single bulk
+        UPDATE, stamped for delta sync. Commits, or only flushes inside a
+        unit_of_work. Returns the number of habits updated.
+        """
+        if not habit_ids:
+            return 0
+        if today is None:
+            today = date.today()
+        
+        habits = db.query(
+            Habit.id, Habit.user_id, Habit.name, Habit.frequency, Habit.status,
+            *[getattr(Habit, column) for column in StatsRebuildService.STATS_COLUMNS]
+        ).filter(Habit.id.in_(habit_ids)).all()
+        
+        counts = StatsRebuildService._log_counts(db, habit_ids, today)
+        streaks = StatsRebuildService._streaks(db, habit_ids, today)
+        
+        rows = []
+        at_risk = []
+        for habit in habits:
+            total_logs, done, skipped, window_done, recent_done, last_done = counts.get(
+                habit.id, (0, 0, 0, 0, 0, None)
+            )
+            current_streak, longest_run = streaks.get(habit.id, (0, 0))
+            consecutive_misses = 2 - recent_done
+            
+            row = {
+                "id": habit.id,
+                "total_logs": total_logs,
+                "total_completions": done,
+                "total_skips": skipped,
+                "current_streak": current_streak,
+                "longest_streak": max(habit.longest_streak or 0, longest_run),
+                "consistency_score": HabitService._consistency_from_completions(
+                    habit.frequency, window_done, StatsRebuildService.CONSISTENCY_DAYS
+                ),
+                "failure_rate": (skipped / total_logs) * 100 if total_logs > 0 else 0.0,
+                "consecutive_misses": consecutive_misses,
+            }
+            if last_done:
+                row["last_completed_date"] = datetime.combine(last_done, datetime.min.time())
+            
+            # Same risk transitions as HabitService._check_consecutive_misses
+            if consecutive_misses >= 2 and habit.status == HabitStatus.ACTIVE:
+                row["status"] = HabitStatus.AT_RISK
+                at_risk.append((habit, consecutive_misses))
+            elif consecutive_misses < 2 and habit.status == HabitStatus.AT_RISK:
+                row["status"] = HabitStatus.ACTIVE
+            
+            # Unchanged habits are left alone, so they do not show up in delta syncs
+            if StatsRebuildService._changed(habit, row):
+                rows.append(row)
+        if not rows:
+            commit_or_flush(db)
+            return 0
+        
+        user_ids = {habit.id: habit.user_id for habit in habits}
+        seqs = SyncService.allocate(db, {user_ids[row["id"]] for row in rows})
+        for row in rows:
+            row["change_seq"] = seqs[user_ids[row["id"]]]
+        
+        # Rows differ in which keys they carry, so group them per key set
+        # to keep each executemany homogeneous
+        grouped: Dict[tuple, List[dict]] = {}
+        for row in rows:
+            grouped.setdefault(tuple(sorted(row)), []).append(row)
+        for group in grouped.values():
+            db.execute(update(Habit), group)
+        RollupService.refresh_snapshots(db, set(seqs))
+        OutboxService.enqueue_many(db, [
+            {
+                "channel": f"user:{habit.user_id}",
+                "event_type": "habit_at_risk",
+                "data": {
+                    "habit_id": habit.id,
+                    "habit_name": habit.name,
+                    "consecutive_misses": consecutive_misses
+                },
+                "user_id": habit.user_id
+            }
+            for habit, consecutive_misses in at_risk
+        ])
+        if commit_or_flush(db):
+            # Inside a unit_of_work the caller drops its caches once committed
+            AnalyticsService.invalidate_dashboards(list(seqs))
+            HabitService.invalidate_today(list(seqs))
+        
+        return len(rows)
+    
+    @staticmethod
+    def _changed(habit, row: dict) -> bool:
+        """True if a recomputed row differs from the habit's stored stats"""
+        for column, value in row.items():
+            stored = getattr(habit, column)
+            if column == "last_completed_date":
+                # Stored with a time zone; only the day is meaningful
+                stored, value = stored and stored.date(), value.date()
+            if stored != value:
+                return True
+        return False
+    
+    @staticmethod
+    def _log_counts(db: Session, habit_ids: List[int], today: date) -> Dict[int, tuple]:
+        """Per-habit totals (including archived logs), windowed completion counts and last completion date"""
+        is_done = HabitLog.status == LogStatus.DONE
+        window_start = today - timedelta(days=StatsRebuildService.CONSISTENCY_DAYS)
+        yesterday = today - timedelta(days=1)
+        day_before = today - timedelta(days=2)
+        
+        rows = db.query(
+            HabitLog.habit_id,
+            func.count(HabitLog.id),
+            func.count(HabitLog.id).filter(is_done),
+            func.count(HabitLog.id).filter(HabitLog.status == LogStatus.SKIPPED),
+            func.count(HabitLog.id).filter(
+                and_(is_done, HabitLog.log_date >= window_start, HabitLog.log_date <= today)
+            ),
+            func.count(HabitLog.id).filter(
+                and_(is_done, HabitLog.log_date.in_([yesterday, day_before]))
+            ),
+            func.max(HabitLog.log_date).filter(is_done)
+        ).filter(
+            HabitLog.habit_id.in_(habit_ids)
+        ).group_by(HabitLog.habit_id).all()
+        counts = {row[0]: tuple(row[1:]) for row in rows}
+        
+        for archived in db.query(HabitLogArchiveTotal).filter(HabitLogArchiveTotal.habit_id.in_(habit_ids)).all():
+            total_logs, done, skipped, window_done, recent_done, last_done = counts.get(
+                archived.habit_id, (0, 0, 0, 0, 0, None)
+            )
+            counts[archived.habit_id] = (
+                total_logs + archived.done_count + archived.skipped_count + archived.missed_count,
+                done + archived.done_count,
+                skipped + archived.skipped_count,
+                window_done,
+                recent_done,
+                last_done
+            )
+        return counts
+    
+    @staticmethod
+    def _streaks(db: Session, habit_ids: List[int], today: date) -> Dict[int, tuple]:
+        """
+        Per-habit (current_streak, longest_run) using gaps-and-islands:
+        consecutive DONE dates share the same (log_date - row_number) value.
+        """
+        row_number = func.row_number().over(
+            partition_by=HabitLog.habit_id,
+            order_by=HabitLog.log_date
+        )
+        island = HabitLog.log_date - cast(row_number, Integer)
+        if db.get_bind().dialect.name == "sqlite":
+            # date - integer is Postgres; SQLite (tests) counts days with julianday()
+            island = func.julianday(HabitLog.log_date) - row_number
+        done_logs = db.query(
+            HabitLog.habit_id.label("habit_id"),
+            HabitLog.log_date.label("log_date"),
+            island.label("island")
+        ).filter(
+            and_(
+                HabitLog.habit_id.in_(habit_ids),
+                HabitLog.status == LogStatus.DONE,
+                HabitLog.log_date <= today
+            )
+        ).subquery()
+        
+        islands = db.query(
+            done_logs.c.habit_id.label("habit_id"),
+            func.count().label("run_length"),
+            func.max(done_logs.c.log_date).label("run_end")
+        ).group_by(done_logs.c.habit_id, done_logs.c.island).subquery()
+        
+        rows = db.query(
+            islands.c.habit_id,
+            func.max(case((islands.c.run_end == today, islands.c.run_length), else_=0)),
+            func.max(islands.c.run_length)
+        ).group_by(islands.c.habit_id).all()
+        
+        return {habit_id: (current or 0, longest or 0) for habit_id, current, longest in rows}
+    
+    @staticmethod
+    def _load_cursor() -> Optional[dict]:
+        try:
+            return cache_get(StatsRebuildService.CURSOR_KEY)
+        except redis.RedisError:
+            return None
+    
+    @staticmethod
+    def _save_cursor(run_date: date, last_id: int):
+        cache_set(
+            StatsRebuildService.CURSOR_KEY,
+            {"run_date": run_date.isoformat(), "last_id": last_id},
+            expire=StatsRebuildService.CURSOR_EXPIRE
+        )
+    
+    @staticmethod
+    def _clear_cursor():
+        try:
+            get_redis_client().delete(StatsRebuildService.CURSOR_KEY)
+        except redis.RedisError:
+            pass
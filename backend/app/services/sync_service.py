@@ -0,0 +1,224 @@
+from itertools import chain
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import and_, delete, event, select, update
+from sqlalchemy.sql import Select
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Optional, Union
+from app.config import settings
+from app.models.user import User
+from app.models.habit import Habit
+from app.models.habit_log import HabitLog
+from app.models.goal import Goal, GoalHabit
+from app.models.achievement import UserAchievement
+from app.models.sync_tombstone import SyncTombstone
+
+
+class SyncService:
+    """
+    Per-user change sequence behind GET /api/sync.
+    
+    The first write of a transaction to a user's habits, logs, goals,
+    achievements or profile bumps `users.change_seq` (which locks the user's
+    row until commit) and every row it writes is stamped with the new value;
+    deleted rows leave a tombstone carrying it. The row lock orders a user's
+    writers, so a client that has everything up to sequence N only needs
+    rows stamped after N. ORM writes are stamped by a before_flush hook;
+    bulk statements call `allocate` first and stamp their rows themselves.
+    """
+    
+    ENTITIES = ("habits", "habit_logs", "goals", "achievements")
+    
+    @staticmethod
+    def allocate(db: Session, users: Union[Iterable[int], Select]) -> Dict[int, int]:
+        """
+        Bump the change sequence of users (ids or a SELECT of ids) once per
+        transaction. Returns the transaction's sequence for every user
+        allocated so far.
+        """
+        seqs = db.info.setdefault(SYNC_SEQS, {})
+        stmt = update(User).values(change_seq=User.change_seq + 1)
+        if isinstance(users, Select):
+            stmt = stmt.where(User.id.in_(users))
+            if seqs:
+                stmt = stmt.where(User.id.notin_(list(seqs)))
+        else:
+            user_ids = set(users) - seqs.keys()
+            if not user_ids:
+                return seqs
+            stmt = stmt.where(User.id.in_(user_ids))
+        
+        rows = db.execute(
+            stmt.returning(User.id, User.change_seq).execution_options(synchronize_session=False)
+        ).all()
+        seqs.update({row.id: row.change_seq for row in rows})
+        return seqs
+    
+    @staticmethod
+    def user_seq(model):
+        """The owner's change sequence as a column value for bulk UPDATEs of `model`, after `allocate`"""
+        return select(User.change_seq).where(User.id == model.user_id).scalar_subquery()
+    
+    @staticmethod
+    def touch(db: Session, obj):
+        """Stamp a habit or goal whose change the ORM does not see (e.g. its links were bulk deleted)"""
+        obj.change_seq = SyncService.allocate(db, [obj.user_id])[obj.user_id]
+    
+    @staticmethod
+    def get_changes(db: Session, user_id: int, since: Optional[int] = None) -> dict:
+        """
+        Rows of the user changed after `since`, the ids of deleted ones and the
+        cursor to send next time. Without `since`, or when tombstones after it
+        were purged, returns a full snapshot (`full` is true) instead.
+        """
+        from app.services.gamification_service import GamificationService
+        
+        user = db.query(User).filter(User.id == user_id).one()
+        cursor = user.change_seq
+        full = since is None or since < user.sync_floor or since > cursor
+        changes = {
+            "cursor": cursor,
+            "full": full,
+            "user": None,
+            **{entity: [] for entity in SyncService.ENTITIES},
+            "deleted": {entity: [] for entity in SyncService.ENTITIES}
+        }
+        if not full and since == cursor:
+            return changes
+        
+        after = -1 if full else since
+        changes["user"] = {
+            "id": user.id,
+            "email": user.email,
+            "full_name": user.full_name,
+            "total_xp": user.total_xp,
+            "level": user.level,
+            "total_points": user.total_points,
+            "xp_to_next_level": GamificationService.xp_to_next_level(user.total_xp, user.level)
+        }
+        changes["habits"] = db.query(Habit).filter(
+            and_(Habit.user_id == user_id, Habit.change_seq > after)
+        ).order_by(Habit.id).all()
+        changes["habit_logs"] = db.query(HabitLog).join(Habit, Habit.id == HabitLog.habit_id).filter(
+            and_(Habit.user_id == user_id, HabitLog.change_seq > after)
+        ).order_by(HabitLog.id).all()
+        changes["goals"] = db.query(Goal).options(
+            selectinload(Goal.habit_contributions).joinedload(GoalHabit.habit)
+        ).filter(
+            and_(Goal.user_id == user_id, Goal.change_seq > after)
+        ).order_by(Goal.id).all()
+        changes["achievements"] = [
+            {
+                "id": unlocked.achievement.id,
+                "name": unlocked.achievement.name,
+                "description": unlocked.achievement.description,
+                "icon": unlocked.achievement.icon,
+                "unlocked_at": unlocked.unlocked_at
+            }
+            for unlocked in db.query(UserAchievement).options(joinedload(UserAchievement.achievement)).filter(
+                and_(UserAchievement.user_id == user_id, UserAchievement.change_seq > after)
+            ).order_by(UserAchievement.id).all()
+        ]
+        
+        if not full:
+            for entity, entity_id in db.query(SyncTombstone.entity, SyncTombstone.entity_id).filter(
+                and_(SyncTombstone.user_id == user_id, SyncTombstone.change_seq > since)
+            ).order_by(SyncTombstone.id).all():
+                changes["deleted"][entity].append(entity_id)
+        
+        return changes
+    
+    @staticmethod
+    def purge_tombstones(db: Session, older_than: timedelta = None) -> int:
+        """
+        Delete tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS. Each
+        user's sync_floor moves past them, so clients that synced before get
+        a full snapshot.
+        """
+        older_than = older_than or timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        purged = db.execute(
+            delete(SyncTombstone).where(
+                SyncTombstone.deleted_at < datetime.now(timezone.utc) - older_than
+            ).returning(SyncTombstone.user_id, SyncTombstone.change_seq)
+        ).all()
+        
+        floors: Dict[int, int] = {}
+        for user_id, change_seq in purged:
+            floors[user_id] = max(floors.get(user_id, 0), change_seq)
+        if floors:
+            db.execute(update(User), [{"id": user_id, "sync_floor": floor} for user_id, floor in floors.items()])
+        db.commit()
+        return len(purged)
+
+
+SYNC_SEQS = "sync_seqs"
+
+
+def _habit_owner(session: Session, habit_id: int) -> Optional[int]:
+    habit = session.get(Habit, habit_id)
+    return habit.user_id if habit is not None else None
+
+
+def _goal_of(session: Session, link: GoalHabit) -> Optional[Goal]:
+    return link.goal if link.goal is not None else session.get(Goal, link.goal_id)
+
+
+@event.listens_for(Session, "before_flush")
+def _stamp_changes(session, flush_context, instances):
+    """Stamp synced rows written through the ORM with their user's change sequence and record tombstones for deletions"""
+    owners = {}
+    tombstones = []
+    deleted_habits = {obj.id for obj in session.deleted if isinstance(obj, Habit)}
+    deleted_goals = {obj.id for obj in session.deleted if isinstance(obj, Goal)}
+    
+    modified = [obj for obj in session.dirty if session.is_modified(obj)]
+    for obj in chain(session.new, modified):
+        if isinstance(obj, (Habit, Goal, UserAchievement)):
+            owners[obj] = obj.user_id
+        elif isinstance(obj, HabitLog):
+            owners[obj] = _habit_owner(session, obj.habit_id)
+        elif isinstance(obj, GoalHabit):
+            goal = _goal_of(session, obj)
+            if goal is not None and goal not in session.deleted:
+                owners[goal] = goal.user_id
+        elif isinstance(obj, User) and obj.id is not None:
+            owners[obj] = obj.id
+    
+    for obj in session.deleted:
+        if isinstance(obj, Habit):
+            tombstones.append((obj.user_id, "habits", obj.id))
+        elif isinstance(obj, Goal):
+            tombstones.append((obj.user_id, "goals", obj.id))
+        elif isinstance(obj, UserAchievement):
+            tombstones.append((obj.user_id, "achievements", obj.achievement_id))
+        elif isinstance(obj, HabitLog) and obj.habit_id not in deleted_habits:
+            tombstones.append((_habit_owner(session, obj.habit_id), "habit_logs", obj.id))
+        elif isinstance(obj, GoalHabit) and obj.goal_id not in deleted_goals:
+            goal = _goal_of(session, obj)
+            if goal is not None:
+                owners[goal] = goal.user_id
+    
+    user_ids = {user_id for user_id in owners.values() if user_id is not None}
+    user_ids.update(user_id for user_id, _, _ in tombstones if user_id is not None)
+    if not user_ids:
+        return
+    
+    seqs = SyncService.allocate(session, user_ids)
+    for obj, user_id in owners.items():
+        # A user's own row carries the counter itself
+        if user_id is not None and not isinstance(obj, User):
+            obj.change_seq = seqs[user_id]
+    session.add_all([
+        SyncTombstone(user_id=user_id, entity=entity, entity_id=entity_id, change_seq=seqs[user_id])
+        for user_id, entity, entity_id in tombstones
+        if user_id is not None
+    ])
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_seqs_after_commit(session):
+    session.info.pop(SYNC_SEQS, None)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_seqs_after_rollback(session):
+    session.info.pop(SYNC_SEQS, None)
@@ -0,0 +1,58 @@
+"""
+Manage habit_logs range partitioning (PostgreSQL).
+
+    python -m app.tools.habit_log_partitions convert --interval month
+    python -m app.tools.habit_log_partitions revert
+    python -m app.tools.habit_log_partitions maintain
+    python -m app.tools.habit_log_partitions list
+
+`convert` and `revert` rewrite the table and hold an exclusive lock on it
+while they run. `maintain` does what the daily Celery job does: create
+upcoming partitions and archive those older than
+HABIT_LOGS_ARCHIVE_AFTER_MONTHS.
+"""
+import argparse
+import sys
+from typing import List
+from app.database import SessionLocal
+from app.services.habit_log_partition_service import HabitLogPartitionService
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("command", choices=["convert", "revert", "maintain", "list"])
+    parser.add_argument("--interval", choices=sorted(HabitLogPartitionService.INTERVALS), default="month")
+    parser.add_argument("--ahead", type=int, default=None, help="partitions to create past the current one")
+    args = parser.parse_args(argv)
+    
+    db = SessionLocal()
+    try:
+        if db.get_bind().dialect.name != "postgresql":
+            print("habit_logs partitioning needs PostgreSQL")
+            return 2
+        
+        if args.command == "convert":
+            HabitLogPartitionService.convert(db, args.interval, args.ahead)
+            db.commit()
+        elif args.command == "revert":
+            HabitLogPartitionService.revert(db)
+            db.commit()
+        elif args.command == "maintain":
+            for name in HabitLogPartitionService.ensure_future_partitions(db, args.ahead):
+                print(f"created {name}")
+            for archived in HabitLogPartitionService.archive(db):
+                print(f"archived {archived['partition']}: {archived['rows']} rows -> {archived['file']}")
+        
+        if not HabitLogPartitionService.is_partitioned(db):
+            print("habit_logs is not partitioned")
+            return 0
+        for name, start, end in HabitLogPartitionService.partitions(db):
+            print(f"{name}: {start} .. {end}")
+        print(f"archived through: {HabitLogPartitionService.archived_through(db) or '-'}")
+        return 0
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""
+Index advisor: checks that the services' queries are served by indexes.
+
+Seeds users, habits, logs, goals and achievements inside a transaction,
+runs the per-user service calls of the request path against the seeded
+data while recording every statement they issue, then runs EXPLAIN on
+each one. Any sequential scan of a table holding more than --threshold
+rows is reported and makes the command exit with status 1. The
+transaction is rolled back at the end, so nothing is left behind.
+
+Batch jobs (risk detection for all users, rebuilds, backfills) read whole
+tables by design and are not checked.
+
+    python -m app.tools.index_advisor --users 500 --habits 4 --days 180
+
+Requires PostgreSQL (DATABASE_URL).
+"""
+import argparse
+import sys
+from datetime import date, timedelta
+from typing import Callable, Dict, Iterator, List, Tuple
+from sqlalchemy import String, and_, case, cast, create_engine, event, func, insert, literal, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models.user import User
+from app.models.habit import Habit
+from app.models.habit_log import HabitLog, LogStatus
+from app.models.goal import Goal, GoalHabit
+from app.models.achievement import Achievement, UserAchievement
+from app.services.habit_service import HabitService
+from app.services.analytics_service import AnalyticsService
+from app.services.risk_detection_service import RiskDetectionService
+from app.services.goal_service import GoalService
+from app.services.gamification_service import GamificationService
+from app.services.stats_rebuild_service import StatsRebuildService
+
+
+SEED_EMAIL = "index-advisor-%@example.invalid"
+DML = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+def seed(connection: Connection, users: int, habits_per_user: int, days: int) -> Dict[str, int]:
+    """Insert seed rows set-based with generate_series; returns row counts"""
+    n = func.generate_series(1, users).table_valued("n").render_derived()
+    connection.execute(insert(User).from_select(
+        ["email", "hashed_password", "full_name"],
+        select(literal("index-advisor-") + cast(n.c.n, String) + "@example.invalid", literal("!"), literal("Index advisor"))
+    ))
+    seeded_users = select(User.id).where(User.email.like(SEED_EMAIL)).subquery()
+    
+    h = func.generate_series(1, habits_per_user).table_valued("n").render_derived()
+    connection.execute(insert(Habit).from_select(
+        ["user_id", "name"],
+        select(seeded_users.c.id, literal("Habit ") + cast(h.c.n, String)).select_from(seeded_users.join(h, literal(True)))
+    ))
+    seeded_habits = select(Habit.id, Habit.user_id, Habit.name).where(Habit.user_id.in_(select(seeded_users.c.id))).subquery()
+    
+    # Deterministic mix of statuses: 5 done, 1 skipped, 1 missed per 7 days
+    d = func.generate_series(0, days - 1).table_valued("n").render_derived()
+    phase = (seeded_habits.c.id + d.c.n) % 7
+    connection.execute(insert(HabitLog).from_select(
+        ["habit_id", "log_date", "status"],
+        select(
+            seeded_habits.c.id,
+            func.current_date() - d.c.n,
+            cast(case(
+                (phase < 5, literal(LogStatus.DONE, HabitLog.status.type)),
+                (phase == 5, literal(LogStatus.SKIPPED, HabitLog.status.type)),
+                else_=literal(LogStatus.MISSED, HabitLog.status.type)
+            ), HabitLog.status.type)
+        ).select_from(seeded_habits.join(d, literal(True)))
+    ))
+    
+    connection.execute(insert(Goal).from_select(
+        ["user_id", "name", "target_value"],
+        select(seeded_users.c.id, literal("Advisor goal"), literal(100.0))
+    ))
+    connection.execute(insert(GoalHabit).from_select(
+        ["goal_id", "habit_id"],
+        select(Goal.id, seeded_habits.c.id).select_from(Goal).join(
+            seeded_habits,
+            and_(seeded_habits.c.user_id == Goal.user_id, seeded_habits.c.name == "Habit 1")
+        )
+    ))
+    connection.execute(insert(UserAchievement).from_select(
+        ["user_id", "achievement_id"],
+        select(seeded_users.c.id, Achievement.id).select_from(seeded_users.join(Achievement, literal(True))).where(
+            Achievement.requirement_value <= 3
+        )
+    ))
+    
+    # Fresh statistics so the planner sees the seeded sizes
+    for table in ("users", "habits", "habit_logs", "goals", "goal_habits", "achievements", "user_achievements"):
+        connection.execute(text(f"ANALYZE {table}"))
+    
+    return {
+        row.relname: int(row.reltuples)
+        for row in connection.execute(text(
+            "SELECT relname, reltuples FROM pg_class "
+            "WHERE relkind = 'r' AND relnamespace = 'public'::regnamespace"
+        ))
+    }
+
+
+def scenario(db: Session, user_id: int) -> List[Tuple[str, Callable[[], object]]]:
+    """The per-user service calls to check, as (name, call) pairs"""
+    habit = db.query(Habit).filter(Habit.user_id == user_id).order_by(Habit.id).first()
+    goal = db.query(Goal).filter(Goal.user_id == user_id).first()
+    today = date.today()
+    return [
+        ("HabitService.get_habits", lambda: HabitService.get_habits(db, user_id)),
+        ("HabitService.get_habit", lambda: HabitService.get_habit(db, habit.id, user_id)),
+        ("HabitService.get_habit_logs", lambda: HabitService.get_habit_logs(db, habit.id, today - timedelta(days=30), today)),
+        ("HabitService.log_habit", lambda: HabitService.log_habit(db, habit.id, user_id, today, LogStatus.DONE)),
+        ("StatsRebuildService.rebuild_habits", lambda: StatsRebuildService.rebuild_habits(db, [habit.id])),
+        ("AnalyticsService heatmap", lambda: AnalyticsService._compute_heatmap_data(db, habit.id, today.year)),
+        ("AnalyticsService weekly", lambda: AnalyticsService._compute_weekly_stats(db, habit.id, today - timedelta(days=today.weekday()))),
+        ("AnalyticsService monthly", lambda: AnalyticsService._compute_monthly_stats(db, habit.id, today.year, today.month)),
+        ("AnalyticsService trend", lambda: AnalyticsService._compute_consistency_trend(db, habit.id, today, 30)),
+        ("AnalyticsService dashboard", lambda: AnalyticsService._compute_user_dashboard_stats(db, user_id)),
+        ("AnalyticsService history", lambda: AnalyticsService.get_dashboard_history(db, user_id, 30)),
+        ("RiskDetectionService.detect_at_risk_habits", lambda: RiskDetectionService.detect_at_risk_habits(db, user_id)),
+        ("RiskDetectionService.check_inactive_habits", lambda: RiskDetectionService.check_inactive_habits(db, user_id)),
+        ("GoalService.get_goals", lambda: GoalService.get_goals(db, user_id)),
+        ("GoalService.recalculate_goals", lambda: GoalService.recalculate_goals(db, [goal.id])),
+        ("GamificationService.check_achievements", lambda: GamificationService.check_achievements(db, user_id, habit=habit)),
+        ("GamificationService.get_user_stats", lambda: GamificationService.get_user_stats(db, user_id)),
+    ]
+
+
+def capture(connection: Connection, db: Session, steps: List[Tuple[str, Callable[[], object]]]) -> List[Tuple[str, str, object]]:
+    """Run the steps, recording (step, statement, parameters) for each distinct DML statement"""
+    statements: Dict[str, Tuple[str, str, object]] = {}
+    current = {"step": None}
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(DML) and statement not in statements:
+            statements[statement] = (current["step"], statement, parameters[0] if executemany else parameters)
+    
+    event.listen(connection, "before_cursor_execute", record)
+    try:
+        for name, call in steps:
+            current["step"] = name
+            try:
+                call()
+            except Exception as e:
+                db.rollback()
+                print(f"  ! {name} failed, its remaining queries are not checked: {e}")
+    finally:
+        event.remove(connection, "before_cursor_execute", record)
+    return list(statements.values())
+
+
+def seq_scans(plan: dict) -> Iterator[str]:
+    """Relations read with a sequential scan anywhere in an EXPLAIN (FORMAT JSON) plan"""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan["Relation Name"]
+    for child in plan.get("Plans", []):
+        yield from seq_scans(child)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database-url", default=settings.database_url)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--habits", type=int, default=4, help="habits per user")
+    parser.add_argument("--days", type=int, default=180, help="days of logs per habit")
+    parser.add_argument("--threshold", type=int, default=1000, help="largest table (rows) a sequential scan may read")
+    args = parser.parse_args(argv)
+    
+    engine = create_engine(args.database_url)
+    if engine.dialect.name != "postgresql":
+        print(f"The index advisor needs PostgreSQL, not {engine.dialect.name}")
+        return 2
+    
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            print(f"Seeding {args.users} users x {args.habits} habits x {args.days} days...")
+            table_rows = seed(connection, args.users, args.habits, args.days)
+            
+            # Service commits become savepoints of the outer transaction
+            db = Session(bind=connection, join_transaction_mode="create_savepoint")
+            user_id = db.query(User.id).filter(User.email.like(SEED_EMAIL)).order_by(User.id).offset(args.users // 2).limit(1).scalar()
+            statements = capture(connection, db, scenario(db, user_id))
+            db.close()
+            
+            problems = []
+            for step, statement, parameters in statements:
+                plan = connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters).scalar()[0]["Plan"]
+                for table in set(seq_scans(plan)):
+                    rows = table_rows.get(table, 0)
+                    if rows > args.threshold:
+                        problems.append((step, table, rows, statement))
+        finally:
+            transaction.rollback()
+    
+    print(f"Checked {len(statements)} statements")
+    for step, table, rows, statement in problems:
+        print(f"\nSEQ SCAN on {table} (~{rows} rows) in {step}:\n  {' '.join(statement.split())}")
+    if problems:
+        print(f"\n{len(problems)} sequential scan(s) above {args.threshold} rows")
+        return 1
+    print("No sequential scans above the threshold")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
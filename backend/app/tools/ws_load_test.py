@@ -0,0 +1,119 @@
+"""
+WebSocket load test: checks that open sockets hold no database connections.
+
+Opens --connections WebSockets to a running API worker (at most
+--concurrency handshakes in flight), waits for each "connected" message,
+holds them for --hold seconds, then compares the worker's database pool
+usage from /health/pool with the usage before the test. Exits with
+status 1 if connections are still checked out or sockets failed to open.
+
+    python -m app.tools.ws_load_test --url http://localhost:8000 \\
+        --email user@example.com --password secret --connections 10000
+
+/health/pool reports the worker that answers it, so run the API with a
+single worker (`uvicorn app.main:app --workers 1`) for the test. The
+client needs one file descriptor per socket; the soft limit is raised to
+the hard limit where possible.
+"""
+import argparse
+import asyncio
+import json
+import resource
+import sys
+import time
+import urllib.parse
+import urllib.request
+from typing import List, Optional
+import websockets
+
+
+def get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.loads(response.read())
+
+
+def login(base_url: str, email: str, password: str) -> str:
+    data = urllib.parse.urlencode({"username": email, "password": password}).encode()
+    with urllib.request.urlopen(f"{base_url}/api/auth/login", data=data, timeout=30) as response:
+        return json.loads(response.read())["access_token"]
+
+
+def checked_out(pool_health: dict) -> int:
+    return sum(pool["checked_out"] for pool in pool_health["pools"].values())
+
+
+async def open_sockets(ws_url: str, count: int, concurrency: int) -> List[Optional[websockets.WebSocketClientProtocol]]:
+    """Open `count` sockets and wait for their "connected" message; failures are returned as None"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def open_one():
+        async with semaphore:
+            try:
+                socket = await websockets.connect(ws_url, open_timeout=30, ping_interval=None)
+                message = json.loads(await asyncio.wait_for(socket.recv(), timeout=30))
+                if message.get("type") != "connected":
+                    await socket.close()
+                    return None
+                return socket
+            except Exception:
+                return None
+    
+    return await asyncio.gather(*[open_one() for _ in range(count)])
+
+
+async def run(args) -> int:
+    base_url = args.url.rstrip("/")
+    token = args.token or login(base_url, args.email, args.password)
+    ws_url = base_url.replace("http", "ws", 1) + "/ws?" + urllib.parse.urlencode({"token": token})
+    
+    before = get_json(f"{base_url}/health/pool")
+    print(f"Before: {checked_out(before)} DB connections checked out, {before['websocket_connections']} sockets")
+    
+    started = time.monotonic()
+    sockets = await open_sockets(ws_url, args.connections, args.concurrency)
+    opened = [socket for socket in sockets if socket is not None]
+    print(f"Opened {len(opened)}/{args.connections} sockets in {time.monotonic() - started:.1f}s")
+    
+    try:
+        await asyncio.sleep(args.hold)
+        during = get_json(f"{base_url}/health/pool")
+        print(f"While open: {checked_out(during)} DB connections checked out, {during['websocket_connections']} sockets")
+        print(json.dumps(during["pools"], indent=2))
+    finally:
+        await asyncio.gather(*[socket.close() for socket in opened], return_exceptions=True)
+    
+    problems = []
+    if checked_out(during) > checked_out(before) + args.tolerance:
+        problems.append(f"{checked_out(during) - checked_out(before)} more DB connections checked out with sockets open")
+    if len(opened) < args.connections:
+        problems.append(f"{args.connections - len(opened)} sockets failed to open")
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    if not problems:
+        print("OK: open sockets hold no database connections")
+    return 1 if problems else 0
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--token", help="JWT to connect with (instead of --email/--password)")
+    parser.add_argument("--email")
+    parser.add_argument("--password")
+    parser.add_argument("--connections", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=200, help="handshakes in flight")
+    parser.add_argument("--hold", type=float, default=5.0, help="seconds to keep the sockets open")
+    parser.add_argument("--tolerance", type=int, default=2, help="extra checked-out connections allowed (concurrent HTTP traffic)")
+    args = parser.parse_args(argv)
+    if not args.token and not (args.email and args.password):
+        parser.error("give --token or --email and --password")
+    
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
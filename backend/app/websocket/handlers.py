@@ -1,15 +1,28 @@
-from fastapi import WebSocket, WebSocketDisconnect, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import asyncio
+import json
+from datetime import datetime
+from typing import Optional
+from fastapi import Header, HTTPException, Query, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from app.websocket.manager import manager
-from app.database import get_db
-from app.core.security import get_current_user
-from app.models.user import User
+from app.database import AsyncSessionLocal
+from app.core.security import authenticate_token
 
 
 async def websocket_endpoint(websocket: WebSocket):
     """
     WebSocket endpoint for real-time updates.
-    Requires JWT token in query parameter.
+    Requires JWT token in query parameter; `last_event_id` (the last
+    `cursor` the client saw) replays the events it missed while away.
+    
+    The token is checked before the socket is accepted, with a session that
+    is closed right away (no session at all when the principal cache has
+    the user), so open sockets hold no database connection.
+    
+    Any inbound frame counts as a sign of life for the idle reaper; clients
+    answer the server's {"type": "ping"} with {"type": "pong"}, and a client
+    {"type": "ping"} is answered with a pong.
     """
     # Get token from query parameters
     token = websocket.query_params.get("token")
@@ -18,66 +31,133 @@ async def websocket_endpoint(websocket: WebSocket):
         return
     
     # Authenticate user
-    db = None
     try:
-        db_gen = get_db()
-        db = next(db_gen)
-        user = await verify_token(token, db)
-        if not user:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            if db:
-                db.close()
-            return
-    except Exception as e:
+        user_id = await verify_token(token)
+    except Exception:
+        user_id = None
+    if user_id is None:
         await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-        if db:
-            db.close()
         return
     
-    # Connect
-    await manager.connect(websocket, user.id)
-    await manager.subscribe_to_user_channel(user.id)
-    
+    # Send the welcome message before any event can be queued for the socket
+    await websocket.accept()
     try:
-        # Send welcome message
         await websocket.send_json({
             "type": "connected",
             "data": {
                 "message": "WebSocket connected",
-                "user_id": user.id
+                "user_id": user_id
             }
         })
-        
-        # Keep connection alive and handle incoming messages
+    except Exception:
+        return
+    
+    # Connect
+    await manager.connect(websocket, user_id, websocket.query_params.get("last_event_id"))
+    
+    try:
         while True:
             data = await websocket.receive_text()
-            # Handle client messages if needed
-            # For now, we just keep the connection alive
-            await websocket.send_json({
-                "type": "pong",
-                "data": {"message": "Received"}
-            })
+            manager.touch(websocket)
+            if is_ping(data):
+                manager.send_to(websocket, {
+                    "type": "pong",
+                    "timestamp": str(datetime.utcnow().isoformat())
+                })
     
     except WebSocketDisconnect:
-        manager.disconnect(websocket, user.id)
+        pass
     finally:
-        if db:
-            db.close()
+        await manager.disconnect(websocket, user_id)
 
 
-async def verify_token(token: str, db: Session) -> User:
-    """Verify JWT token and return user"""
-    from jose import JWTError, jwt
-    from app.config import settings
+async def event_stream_endpoint(
+    token: str = Query(...),
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """
+    Server-Sent Events alternative to /ws for clients that only listen.
     
+    Delivers the same events through the connection manager; each carries
+    its stream cursor as the SSE id, so EventSource reconnects resume from
+    the Last-Event-ID header it sends automatically.
+    """
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            return None
-    except JWTError:
-        return None
+        user_id = await verify_token(token)
+    except Exception:
+        user_id = None
+    if user_id is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Could not validate credentials")
+    
+    connection = EventStreamConnection(user_id)
+    await manager.connect(connection, user_id, last_event_id_header or last_event_id)
+    return StreamingResponse(
+        connection.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(manager.disconnect, connection, user_id)
+    )
+
+
+class EventStreamConnection:
+    """Stands in for a WebSocket in the connection manager and writes its frames as Server-Sent Events"""
+    
+    RETRY_MS = 3000
+    
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        # One pending chunk, so a client that stops reading times out the manager's send
+        self.chunks: asyncio.Queue = asyncio.Queue(maxsize=1)
+        self.closed = False
     
-    user = db.query(User).filter(User.email == email).first()
-    return user
+    async def send_json(self, frame: dict):
+        messages = frame["data"] if frame.get("type") == "batch" else [frame]
+        await self.chunks.put("".join(format_event(message) for message in messages))
+        # Written chunks are the only sign of life an SSE client gives
+        manager.touch(self)
+    
+    async def close(self, code: int = status.WS_1000_NORMAL_CLOSURE):
+        self.closed = True
+        try:
+            self.chunks.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+    
+    async def stream(self):
+        yield f"retry: {self.RETRY_MS}\n\n"
+        yield format_event({"type": "connected", "data": {"message": "Event stream connected", "user_id": self.user_id}})
+        while not self.closed:
+            chunk = await self.chunks.get()
+            if chunk is None:
+                break
+            yield chunk
+
 
+def format_event(message: dict) -> str:
+    """One message as a Server-Sent Event; keepalive pings become comments"""
+    if message.get("type") == "ping":
+        return ": ping\n\n"
+    lines = []
+    if message.get("cursor"):
+        lines.append(f"id: {message['cursor']}")
+    lines.append(f"data: {json.dumps(message)}")
+    return "\n".join(lines) + "\n\n"
+
+
+async def verify_token(token: str) -> Optional[int]:
+    """Verify a JWT token and return the id of its active user, releasing the DB connection before returning"""
+    async with AsyncSessionLocal() as db:
+        user = await authenticate_token(token, db)
+        if user is None or not user.is_active:
+            return None
+        return user.id
+
+
+def is_ping(data: str) -> bool:
+    """True for a client {"type": "ping"} message"""
+    try:
+        message = json.loads(data)
+    except ValueError:
+        return False
+    return isinstance(message, dict) and message.get("type") == "ping"
@@ -1,104 +1,492 @@
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set, Tuple
+from collections import OrderedDict, deque
 from datetime import datetime
-from fastapi import WebSocket
+from fastapi import WebSocket, status
 import json
+import re
+import os
+import socket
+import time
 import asyncio
-from app.core.redis_client import get_redis_client
+from app.config import settings
+from app.core.redis_client import get_async_redis_client, stream_key
 
 
 class ConnectionManager:
     """
     Manages WebSocket connections per user.
     Supports multiple connections per user (e.g., multiple browser tabs).
+    
+    Each worker process subscribes to `user:{id}` only while that user has a
+    connection on it ("channel" fan-out mode), so any number of uvicorn workers
+    and nodes can share one Redis without every worker receiving every event.
+    The "pattern" mode instead holds a single PSUBSCRIBE on `user:*`.
+    
+    Connected users and connection counts per worker are registered in Redis
+    (`ws:connections` and `ws:worker:{worker_id}`) and refreshed by a heartbeat
+    so stale entries from crashed workers are pruned.
+    
+    Every connection has its own bounded send queue drained by a dedicated
+    task, so a slow client only delays (and eventually drops) its own messages.
+    Messages queued within WS_COALESCE_MS of each other go out as one "batch"
+    frame, and a send that exceeds WS_SEND_TIMEOUT_SECONDS drops the socket.
+    A keepalive task pings every connection and reaps those that stayed
+    silent for WS_IDLE_TIMEOUT_SECONDS.
+    
+    Events from the outbox are delivered at least once; redeliveries are
+    recognised by their event id and dropped.
+    
+    Every published event also lands in the channel's capped Redis Stream and
+    carries its entry id as `cursor`. A client that reconnects with the last
+    cursor it saw gets the events it missed from the stream (or a "resync"
+    message when they were trimmed) before any live event.
     """
     
+    CHANNEL_PATTERN = "user:*"
+    SEND_QUEUE_SIZE = 100
+    LATENCY_SAMPLES = 1000
+    SEEN_EVENT_IDS = 10000
+    MAX_BATCH = 50
+    CURSOR_PATTERN = re.compile(r"^\d+-\d+$")
+    
+    REGISTRY_CONNECTIONS_KEY = "ws:connections"
+    REGISTRY_HEARTBEATS_KEY = "ws:workers"
+    REGISTRY_WORKER_KEY = "ws:worker:{worker_id}"
+    
     def __init__(self):
         # Map user_id -> Set of WebSocket connections
         self.active_connections: Dict[int, Set[WebSocket]] = {}
-        self.redis_client = get_redis_client()
+        self.send_queues: Dict[WebSocket, asyncio.Queue] = {}
+        self.sender_tasks: Dict[WebSocket, asyncio.Task] = {}
+        self.redis = None
         self.pubsub = None
-        self._listening = False
-    
-    async def connect(self, websocket: WebSocket, user_id: int):
-        """Connect a WebSocket for a user"""
-        await websocket.accept()
+        self._listener_task: Optional[asyncio.Task] = None
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._keepalive_task: Optional[asyncio.Task] = None
+        # Last inbound frame per connection (time.monotonic())
+        self.last_seen: Dict[WebSocket, float] = {}
+        # Live messages held back while a connection's missed events are read
+        self.replaying: Dict[WebSocket, List[Tuple[dict, Optional[datetime]]]] = {}
+        
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.fanout_mode = settings.WS_FANOUT_MODE
+        self.subscribed_users: Set[int] = set()
+        self._subscription_lock = asyncio.Lock()
+        self._subscribed = asyncio.Event()
         
+        # Delivery metrics (publish -> socket send)
+        self.latencies_ms = deque(maxlen=self.LATENCY_SAMPLES)
+        self.delivered = 0
+        self.dropped = 0
+        self.duplicates = 0
+        self.frames = 0
+        self.send_timeouts = 0
+        self.reaped = 0
+        self.replayed = 0
+        self.resyncs = 0
+        self._seen_event_ids: "OrderedDict[str, None]" = OrderedDict()
+    
+    async def connect(self, websocket: WebSocket, user_id: int, last_event_id: str = None):
+        """Register an accepted WebSocket for a user, replaying the events after `last_event_id`"""
         if user_id not in self.active_connections:
             self.active_connections[user_id] = set()
         
         self.active_connections[user_id].add(websocket)
+        self.last_seen[websocket] = time.monotonic()
+        if last_event_id:
+            self.replaying[websocket] = []
+        
+        queue = asyncio.Queue(maxsize=self.SEND_QUEUE_SIZE)
+        self.send_queues[websocket] = queue
+        self.sender_tasks[websocket] = asyncio.create_task(self._sender(websocket, user_id, queue))
+        
+        # The pub/sub connection must exist before the user's channel is
+        # subscribed, otherwise events for early connections are lost
+        await self._ensure_listener()
+        await self._sync_subscription(user_id)
+        await self._register(user_id)
         
-        # Start listening to Redis pub/sub if not already started
-        if not self._listening:
-            asyncio.create_task(self._listen_to_redis())
-            self._listening = True
+        if last_event_id:
+            await self._replay(websocket, user_id, last_event_id)
     
-    def disconnect(self, websocket: WebSocket, user_id: int):
+    async def disconnect(self, websocket: WebSocket, user_id: int):
         """Disconnect a WebSocket for a user"""
+        if websocket not in self.send_queues:
+            return
+        
         if user_id in self.active_connections:
             self.active_connections[user_id].discard(websocket)
             if not self.active_connections[user_id]:
                 del self.active_connections[user_id]
+        
+        self.send_queues.pop(websocket, None)
+        self.last_seen.pop(websocket, None)
+        self.replaying.pop(websocket, None)
+        task = self.sender_tasks.pop(websocket, None)
+        if task and task is not asyncio.current_task():
+            task.cancel()
+        
+        await self._sync_subscription(user_id)
+        await self._register(user_id)
     
-    async def send_personal_message(self, message: dict, user_id: int):
-        """Send a message to all connections of a specific user"""
-        if user_id in self.active_connections:
-            disconnected = set()
-            for connection in self.active_connections[user_id]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    disconnected.add(connection)
-            
-            # Remove disconnected connections
-            for conn in disconnected:
-                self.active_connections[user_id].discard(conn)
+    async def shutdown(self):
+        """Remove this worker from the Redis registry"""
+        for task in (self._heartbeat_task, self._keepalive_task, self._listener_task):
+            if task:
+                task.cancel()
+        
+        if self.redis:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.hdel(self.REGISTRY_CONNECTIONS_KEY, self.worker_id)
+                pipe.zrem(self.REGISTRY_HEARTBEATS_KEY, self.worker_id)
+                pipe.delete(self.REGISTRY_WORKER_KEY.format(worker_id=self.worker_id))
+                await pipe.execute()
+                await self.pubsub.aclose()
+            except Exception as e:
+                print(f"Error unregistering WebSocket worker: {e}")
+    
+    def touch(self, websocket: WebSocket):
+        """Record an inbound frame, which keeps the connection from being reaped"""
+        if websocket in self.last_seen:
+            self.last_seen[websocket] = time.monotonic()
     
-    async def broadcast_to_user(self, user_id: int, event_type: str, data: dict):
+    def send_to(self, websocket: WebSocket, message: dict, published_at: datetime = None):
+        """Queue a message for one connection"""
+        queue = self.send_queues.get(websocket)
+        if queue is None:
+            return
+        
+        held = self.replaying.get(websocket)
+        if held is not None:
+            held.append((message, published_at))
+            return
+        
+        if queue.full():
+            # Slow consumer: drop its oldest pending message
+            queue.get_nowait()
+            self.dropped += 1
+        queue.put_nowait((message, published_at))
+    
+    async def send_personal_message(self, message: dict, user_id: int, published_at: datetime = None):
+        """Queue a message for all connections of a specific user"""
+        for connection in list(self.active_connections.get(user_id, ())):
+            self.send_to(connection, message, published_at)
+    
+    async def broadcast_to_user(self, user_id: int, event_type: str, data: dict, published_at: datetime = None, event_id: str = None, cursor: str = None):
         """Broadcast an event to a user's connections"""
         message = {
             "type": event_type,
             "data": data,
             "timestamp": str(datetime.utcnow().isoformat())
         }
-        await self.send_personal_message(message, user_id)
+        if event_id:
+            message["id"] = event_id
+        if cursor:
+            message["cursor"] = cursor
+        await self.send_personal_message(message, user_id, published_at)
     
-    async def _listen_to_redis(self):
-        """Listen to Redis pub/sub and forward messages to WebSocket connections"""
-        self.pubsub = self.redis_client.pubsub()
+    def get_stats(self) -> dict:
+        """Connection and delivery latency metrics for this process"""
+        samples = sorted(self.latencies_ms)
+        latency = {"count": len(samples)}
+        if samples:
+            latency.update({
+                "avg": round(sum(samples) / len(samples), 2),
+                "p50": samples[len(samples) // 2],
+                "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+                "max": samples[-1]
+            })
         
-        # Subscribe to user-specific channels
-        # In production, you might want to subscribe to a pattern like "user:*"
-        # For now, we'll handle this in the handlers
+        return {
+            "worker_id": self.worker_id,
+            "fanout_mode": self.fanout_mode,
+            "users": len(self.active_connections),
+            "connections": len(self.send_queues),
+            "delivered": self.delivered,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "send_timeouts": self.send_timeouts,
+            "reaped": self.reaped,
+            "replayed": self.replayed,
+            "resyncs": self.resyncs,
+            "duplicates": self.duplicates,
+            "latency_ms": latency
+        }
+    
+    async def _sender(self, websocket: WebSocket, user_id: int, queue: asyncio.Queue):
+        """Drain one connection's send queue, coalescing messages that arrive within WS_COALESCE_MS"""
+        window = settings.WS_COALESCE_MS / 1000
+        while True:
+            batch = [await queue.get()]
+            if window > 0:
+                await asyncio.sleep(window)
+            while not queue.empty() and len(batch) < self.MAX_BATCH:
+                batch.append(queue.get_nowait())
+            
+            messages = [message for message, _ in batch]
+            frame = messages[0] if len(messages) == 1 else {"type": "batch", "data": messages}
+            try:
+                await asyncio.wait_for(websocket.send_json(frame), timeout=settings.WS_SEND_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                self.send_timeouts += 1
+                await self._drop(websocket, user_id, status.WS_1011_INTERNAL_ERROR)
+                return
+            except Exception:
+                await self.disconnect(websocket, user_id)
+                return
+            
+            self.frames += 1
+            self.delivered += len(batch)
+            now = datetime.utcnow()
+            for _, published_at in batch:
+                if published_at:
+                    latency = (now - published_at).total_seconds() * 1000
+                    self.latencies_ms.append(round(latency, 2))
+    
+    async def _drop(self, websocket: WebSocket, user_id: int, code: int):
+        """Unregister a connection and close it without waiting on an unresponsive client"""
+        await self.disconnect(websocket, user_id)
+        try:
+            await asyncio.wait_for(websocket.close(code=code), timeout=settings.WS_SEND_TIMEOUT_SECONDS)
+        except Exception:
+            pass
+    
+    async def _keepalive(self):
+        """Ping every connection and reap those silent for longer than WS_IDLE_TIMEOUT_SECONDS"""
+        while True:
+            await asyncio.sleep(settings.WS_PING_INTERVAL_SECONDS)
+            try:
+                idle_before = time.monotonic() - settings.WS_IDLE_TIMEOUT_SECONDS
+                idle = []
+                ping = {"type": "ping", "timestamp": str(datetime.utcnow().isoformat())}
+                for user_id, connections in list(self.active_connections.items()):
+                    for websocket in list(connections):
+                        if settings.WS_IDLE_TIMEOUT_SECONDS and self.last_seen.get(websocket, idle_before) <= idle_before:
+                            idle.append(self._drop(websocket, user_id, status.WS_1001_GOING_AWAY))
+                        else:
+                            self.send_to(websocket, ping)
+                
+                self.reaped += len(idle)
+                await asyncio.gather(*idle, return_exceptions=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in WebSocket keepalive: {e}")
+    
+    async def get_cluster_stats(self) -> dict:
+        """Connection counts per worker across the cluster, from the Redis registry"""
+        if not self.redis:
+            return {"workers": {}, "connections": 0}
+        
+        connections = await self.redis.hgetall(self.REGISTRY_CONNECTIONS_KEY)
+        workers = {worker_id: int(count) for worker_id, count in connections.items()}
+        return {"workers": workers, "connections": sum(workers.values())}
+    
+    async def _ensure_listener(self):
+        """Create the pub/sub connection and start the listener/heartbeat tasks once"""
+        if self.pubsub is None:
+            # The shared pooled client: registry and stream reads go through its
+            # timeouts and circuit breaker; pub/sub holds one pooled connection
+            self.redis = get_async_redis_client()
+            self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+            if self.fanout_mode == "pattern":
+                await self.pubsub.psubscribe(self.CHANNEL_PATTERN)
+                self._subscribed.set()
+        
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen_to_redis())
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.create_task(self._heartbeat())
+        if self._keepalive_task is None or self._keepalive_task.done():
+            self._keepalive_task = asyncio.create_task(self._keepalive())
+    
+    async def _sync_subscription(self, user_id: int):
+        """Subscribe/unsubscribe the user's channel to match local connections"""
+        if self.fanout_mode == "pattern" or self.pubsub is None:
+            return
+        
+        async with self._subscription_lock:
+            wanted = user_id in self.active_connections
+            try:
+                if wanted and user_id not in self.subscribed_users:
+                    await self.pubsub.subscribe(f"user:{user_id}")
+                    self.subscribed_users.add(user_id)
+                elif not wanted and user_id in self.subscribed_users:
+                    await self.pubsub.unsubscribe(f"user:{user_id}")
+                    self.subscribed_users.discard(user_id)
+            except Exception as e:
+                print(f"Error updating Redis subscription for user {user_id}: {e}")
+            
+            if self.subscribed_users:
+                self._subscribed.set()
+            else:
+                self._subscribed.clear()
+    
+    async def _register(self, user_id: int):
+        """Record a connection change for this worker in the Redis registry"""
+        if not self.redis:
+            return
+        
+        worker_key = self.REGISTRY_WORKER_KEY.format(worker_id=self.worker_id)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            if user_id in self.active_connections:
+                pipe.hset(worker_key, str(user_id), len(self.active_connections[user_id]))
+            else:
+                pipe.hdel(worker_key, str(user_id))
+            pipe.hset(self.REGISTRY_CONNECTIONS_KEY, self.worker_id, len(self.send_queues))
+            await pipe.execute()
+        except Exception as e:
+            print(f"Error updating WebSocket registry: {e}")
+    
+    async def _heartbeat(self):
+        """Periodically rewrite this worker's registry entry and prune dead workers"""
+        interval = settings.WS_REGISTRY_HEARTBEAT_SECONDS
+        worker_key = self.REGISTRY_WORKER_KEY.format(worker_id=self.worker_id)
         
         while True:
             try:
-                message = self.pubsub.get_message(timeout=1.0)
-                if message and message['type'] == 'message':
-                    try:
-                        event = json.loads(message['data'])
-                        user_id = event.get('user_id')
-                        if user_id:
-                            await self.broadcast_to_user(
-                                user_id,
-                                event.get('type', 'notification'),
-                                event.get('data', {})
-                            )
-                    except Exception as e:
-                        print(f"Error processing Redis message: {e}")
+                now = time.time()
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.delete(worker_key)
+                if self.active_connections:
+                    pipe.hset(worker_key, mapping={
+                        str(user_id): len(connections)
+                        for user_id, connections in self.active_connections.items()
+                    })
+                pipe.expire(worker_key, interval * 3)
+                pipe.hset(self.REGISTRY_CONNECTIONS_KEY, self.worker_id, len(self.send_queues))
+                pipe.zadd(self.REGISTRY_HEARTBEATS_KEY, {self.worker_id: now})
+                await pipe.execute()
                 
-                await asyncio.sleep(0.1)
+                # Workers that missed three heartbeats are considered dead
+                stale = await self.redis.zrangebyscore(self.REGISTRY_HEARTBEATS_KEY, 0, now - interval * 3)
+                if stale:
+                    pipe = self.redis.pipeline(transaction=False)
+                    pipe.hdel(self.REGISTRY_CONNECTIONS_KEY, *stale)
+                    pipe.zrem(self.REGISTRY_HEARTBEATS_KEY, *stale)
+                    await pipe.execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error in WebSocket registry heartbeat: {e}")
+            
+            await asyncio.sleep(interval)
+    
+    async def _listen_to_redis(self):
+        """Listen to Redis pub/sub and forward messages to WebSocket connections"""
+        while True:
+            try:
+                # get_message needs at least one subscription on the connection
+                await self._subscribed.wait()
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message["type"] in ("message", "pmessage"):
+                    await self._dispatch(message["channel"], message["data"])
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 print(f"Error in Redis listener: {e}")
                 await asyncio.sleep(1)
     
-    async def subscribe_to_user_channel(self, user_id: int):
-        """Subscribe to Redis channel for a specific user"""
-        if self.pubsub:
-            channel = f"user:{user_id}"
-            self.pubsub.subscribe(channel)
+    async def _dispatch(self, channel: str, payload: str):
+        """Forward a pub/sub message if its user is connected to this process"""
+        try:
+            user_id = int(channel.split(":", 1)[1])
+        except (IndexError, ValueError):
+            return
+        
+        if user_id not in self.active_connections:
+            return
+        
+        try:
+            event = json.loads(payload)
+            if self._is_duplicate(event.get("id")):
+                self.duplicates += 1
+                return
+            published_at = self._parse_timestamp(event.get("timestamp"))
+            await self.broadcast_to_user(
+                user_id,
+                event.get("type", "notification"),
+                event.get("data", {}),
+                published_at,
+                event.get("id"),
+                event.get("cursor")
+            )
+        except Exception as e:
+            print(f"Error processing Redis message: {e}")
+    
+    async def read_stream(self, channel: str, cursor: str) -> Tuple[Optional[List[dict]], Optional[str]]:
+        """
+        The events of a channel's stream after `cursor`, oldest first, and the
+        newest cursor. The events are None when some after `cursor` may have
+        been trimmed or expired (or the cursor is malformed): the client has
+        to reload its state instead.
+        """
+        key = stream_key(channel)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.xrange(key, min="-", max="+", count=1)
+        pipe.xrevrange(key, max="+", min="-", count=1)
+        oldest, newest = await pipe.execute()
+        latest = newest[0][0] if newest else None
+        
+        if not self.CURSOR_PATTERN.match(cursor) or not oldest or self._cursor_key(oldest[0][0]) > self._cursor_key(cursor):
+            return None, latest
+        
+        entries = await self.redis.xrange(key, min=f"({cursor}", max="+")
+        return [{**json.loads(fields["event"]), "cursor": entry_id} for entry_id, fields in entries], latest
+    
+    async def _replay(self, websocket: WebSocket, user_id: int, cursor: str):
+        """Queue the events a reconnecting client missed, then the live ones held meanwhile"""
+        try:
+            messages, latest = await self.read_stream(f"user:{user_id}", cursor)
+        except Exception as e:
+            print(f"Error reading event stream for user {user_id}: {e}")
+            messages, latest = None, None
+        
+        held = self.replaying.pop(websocket, [])
+        if messages is None:
+            self.resyncs += 1
+            resync = {"type": "resync", "timestamp": str(datetime.utcnow().isoformat())}
+            if latest:
+                resync["cursor"] = latest
+            self.send_to(websocket, resync)
+        else:
+            for message in messages:
+                self.send_to(websocket, message)
+            self.replayed += len(messages)
+            latest = messages[-1]["cursor"] if messages else cursor
+        
+        # Live events already covered by the stream read are skipped
+        for message, published_at in held:
+            if not latest or not message.get("cursor") or self._cursor_key(message["cursor"]) > self._cursor_key(latest):
+                self.send_to(websocket, message, published_at)
+    
+    @staticmethod
+    def _cursor_key(cursor: str) -> Tuple[int, int]:
+        milliseconds, sequence = cursor.split("-")
+        return int(milliseconds), int(sequence)
+    
+    def _is_duplicate(self, event_id: Optional[str]) -> bool:
+        """Remember recent event ids; True if this one was already dispatched"""
+        if not event_id:
+            return False
+        if event_id in self._seen_event_ids:
+            return True
+        self._seen_event_ids[event_id] = None
+        if len(self._seen_event_ids) > self.SEEN_EVENT_IDS:
+            self._seen_event_ids.popitem(last=False)
+        return False
+    
+    @staticmethod
+    def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
 
 
 # Global connection manager instance
 manager = ConnectionManager()
-
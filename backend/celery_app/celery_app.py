@@ -27,6 +27,31 @@ celery_app.conf.update(
             "task": "celery_app.tasks.update_all_streaks",
             "schedule": 86400.0,  # Daily at midnight
         },
+        "reconcile-rollups": {
+            "task": "celery_app.tasks.backfill_user_rollups",
+            "schedule": 86400.0,  # Daily
+            "kwargs": {"days": 2},
+        },
+        "reconcile-goals": {
+            "task": "celery_app.tasks.reconcile_goal_progress",
+            "schedule": 86400.0,  # Daily
+        },
+        "relay-outbox": {
+            "task": "celery_app.tasks.relay_outbox",
+            "schedule": 30.0,  # Catches events no API process relayed
+        },
+        "purge-outbox": {
+            "task": "celery_app.tasks.purge_outbox",
+            "schedule": 86400.0,  # Daily
+        },
+        "purge-sync-tombstones": {
+            "task": "celery_app.tasks.purge_sync_tombstones",
+            "schedule": 86400.0,  # Daily
+        },
+        "habit-log-partitions": {
+            "task": "celery_app.tasks.maintain_habit_log_partitions",
+            "schedule": 86400.0,  # Daily
+        },
     },
 )
 
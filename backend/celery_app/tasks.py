@@ -3,11 +3,17 @@ from app.database import SessionLocal
 from app.config import settings
 from app.services.risk_detection_service import RiskDetectionService
 from app.services.habit_service import HabitService
+from app.services.stats_rebuild_service import StatsRebuildService
+from app.services.gamification_service import GamificationService
+from app.services.goal_service import GoalService
+from app.services.rollup_service import RollupService
+from app.services.habit_bitmap_service import HabitBitmapService
+from app.services.habit_log_partition_service import HabitLogPartitionService
+from app.services.outbox_service import OutboxService
+from app.services.sync_service import SyncService
 from app.models.user import User
 from app.models.habit import Habit, HabitStatus
-from app.websocket.manager import manager
 from datetime import datetime
-import asyncio
 
 
 @celery_app.task
@@ -15,9 +21,9 @@ def detect_habit_risks():
     """Periodically detect habits at risk"""
     db = SessionLocal()
     try:
-        users = db.query(User).filter(User.is_active == True).all()
-        for user in users:
-            RiskDetectionService.detect_at_risk_habits(db, user.id)
+        at_risk = RiskDetectionService.detect_all_at_risk_habits(db)
+        _relay_events(db)
+        return {"at_risk_count": len(at_risk)}
     finally:
         db.close()
 
@@ -26,41 +32,147 @@ def detect_habit_risks():
 def send_daily_nudges():
     """Send nudges to users with inactive habits"""
     db = SessionLocal()
+    # Nudges are committed per page through a second session, which leaves
+    # the streaming cursor of `db` open
+    outbox = SessionLocal()
+    nudged = 0
     try:
-        users = db.query(User).filter(User.is_active == True).all()
-        for user in users:
-            inactive_habits = RiskDetectionService.check_inactive_habits(db, user.id, days_inactive=2)
+        for page in RiskDetectionService.iter_inactive_habits(db, days_inactive=2):
+            # Through the outbox like every other event: relayed below or by relay_outbox
+            OutboxService.enqueue_many(outbox, [
+                {
+                    "channel": f"user:{user_id}",
+                    "event_type": "nudge",
+                    "data": {
+                        "message": f"You have {len(habits)} inactive habits",
+                        "habits": habits
+                    },
+                    "user_id": user_id
+                }
+                for user_id, habits in page
+            ])
+            outbox.commit()
+            nudged += len(page)
             
-            if inactive_habits:
-                # Send WebSocket notification
-                asyncio.run(manager.broadcast_to_user(
-                    user.id,
-                    "nudge",
-                    {
-                        "message": f"You have {len(inactive_habits)} inactive habits",
-                        "habits": [{"id": h.id, "name": h.name} for h in inactive_habits]
-                    }
-                ))
-                
-                # Send email if configured
-                if settings.SMTP_HOST:
-                    send_nudge_email(user, inactive_habits)
+            # Send email if configured
+            if settings.SMTP_HOST:
+                inactive_by_user = dict(page)
+                users = db.query(User).filter(User.id.in_(inactive_by_user.keys())).all()
+                for user in users:
+                    send_nudge_email(user, inactive_by_user[user.id])
+        
+        _relay_events(outbox)
+        return {"nudged_users": nudged}
     finally:
+        outbox.close()
         db.close()
 
 
-@celery_app.task
+@celery_app.task(acks_late=True)
 def update_all_streaks():
-    """Update streaks for all active habits"""
+    """Update streaks for all active habits (set-based, resumable after a crash)"""
+    db = SessionLocal()
+    try:
+        result = StatsRebuildService.rebuild_all(db, status=HabitStatus.ACTIVE)
+        _relay_events(db)
+        return result
+    finally:
+        db.close()
+
+
+@celery_app.task(acks_late=True)
+def relevel_users():
+    """Recompute all user levels, run after changing LEVEL_CURVE"""
+    db = SessionLocal()
+    try:
+        return GamificationService.relevel_all_users(db)
+    finally:
+        db.close()
+
+
+@celery_app.task(acks_late=True)
+def reconcile_goal_progress():
+    """Verify incrementally maintained goal progress against habit logs"""
+    db = SessionLocal()
+    try:
+        result = GoalService.reconcile_all_goals(db)
+        _relay_events(db)
+        return result
+    finally:
+        db.close()
+
+
+@celery_app.task(acks_late=True)
+def backfill_user_rollups(days: int = None):
+    """Rebuild user_daily_rollups log counts from habit_logs (all history when days is None)"""
+    db = SessionLocal()
+    try:
+        return RollupService.backfill(db, days=days)
+    finally:
+        db.close()
+
+
+@celery_app.task(acks_late=True)
+def rebuild_habit_bitmaps():
+    """Rebuild habit_year_bitmaps from habit_logs"""
     db = SessionLocal()
     try:
-        habits = db.query(Habit).filter(Habit.status == HabitStatus.ACTIVE).all()
-        for habit in habits:
-            HabitService._update_habit_stats(db, habit)
+        return HabitBitmapService.rebuild_all(db)
     finally:
         db.close()
 
 
+@celery_app.task(acks_late=True)
+def maintain_habit_log_partitions():
+    """Create upcoming habit_logs partitions and archive expired ones (no-op unless habit_logs is partitioned)"""
+    db = SessionLocal()
+    try:
+        return {
+            "created": HabitLogPartitionService.ensure_future_partitions(db),
+            "archived": HabitLogPartitionService.archive(db)
+        }
+    finally:
+        db.close()
+
+
+@celery_app.task
+def relay_outbox():
+    """Publish pending outbox events (a fallback for the API process relay)"""
+    db = SessionLocal()
+    try:
+        return {"published": OutboxService.relay(db)}
+    finally:
+        db.close()
+
+
+@celery_app.task
+def purge_outbox():
+    """Delete outbox events published more than OUTBOX_RETENTION_HOURS ago"""
+    db = SessionLocal()
+    try:
+        return {"deleted": OutboxService.purge(db)}
+    finally:
+        db.close()
+
+
+@celery_app.task
+def purge_sync_tombstones():
+    """Delete delta sync tombstones older than SYNC_TOMBSTONE_RETENTION_DAYS"""
+    db = SessionLocal()
+    try:
+        return {"deleted": SyncService.purge_tombstones(db)}
+    finally:
+        db.close()
+
+
+def _relay_events(db):
+    """Publish the events a task just committed; on failure they stay pending for relay_outbox"""
+    try:
+        OutboxService.relay(db)
+    except Exception as e:
+        print(f"Error relaying outbox events: {e}")
+
+
 def send_nudge_email(user: User, habits: list):
     """Send email nudge (placeholder - implement with aiosmtplib)"""
     # TODO: Implement email sending with aiosmtplib
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+# Settings are read on import: the tests get their own database, SQLite unless TEST_DATABASE_URL is set
+os.environ["DATABASE_URL"] = os.environ.get(
+    "TEST_DATABASE_URL", f"sqlite:///{os.path.join(tempfile.gettempdir(), 'smarthabit_test.db')}"
+)
+
+from datetime import date, timedelta
+import fakeredis
+import pytest
+from sqlalchemy import event
+from app.database import Base, SessionLocal, engine
+from app.core import redis_client
+from app.models import User
+from app.models.habit_log import LogStatus
+from app.schemas.habit import HabitCreate
+from app.services.achievement_catalog import achievement_catalog
+from app.services.habit_service import HabitService
+
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_functions(dbapi_connection, connection_record):
+        # Postgres' GREATEST, used by the rollup upserts
+        dbapi_connection.create_function("greatest", 2, max)
+
+
+@pytest.fixture(autouse=True)
+def redis(monkeypatch):
+    """A fresh in-memory Redis behind get_redis_client"""
+    client = fakeredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(redis_client, "redis_client", client)
+    return client
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+        # The catalog is process-wide; the next test's database starts empty
+        achievement_catalog._stale = True
+
+
+@pytest.fixture
+def user(db):
+    user = User(email="user@example.com", hashed_password="x", full_name="Test User")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def habit(db, user):
+    return HabitService.create_habit(db, user.id, HabitCreate(name="Run"))
+
+
+@pytest.fixture
+def log(db, user):
+    """log(habit, days_ago, status="done"): log a habit relative to today through HabitService.log_habit"""
+    def log(habit, days_ago, status=LogStatus.DONE):
+        return HabitService.log_habit(db, habit.id, user.id, date.today() - timedelta(days=days_ago), LogStatus(status))
+    return log
@@ -0,0 +1,60 @@
+from datetime import date, timedelta
+from app.services.analytics_service import AnalyticsService
+
+
+def cache_reports(db, user, habit, today):
+    """Cache every report for the habit, this year and month plus the same month last year"""
+    AnalyticsService.get_heatmap_data(db, user.id, habit.id, today.year)
+    AnalyticsService.get_heatmap_data(db, user.id, habit.id, today.year - 1)
+    AnalyticsService.get_monthly_stats(db, user.id, habit.id, today.year, today.month)
+    AnalyticsService.get_monthly_stats(db, user.id, habit.id, today.year - 1, today.month)
+    AnalyticsService.get_weekly_stats(db, user.id, habit.id)
+    AnalyticsService.get_consistency_trend(db, user.id, habit.id)
+    AnalyticsService.get_user_dashboard_stats(db, user.id)
+
+
+def test_a_dated_change_drops_only_that_dates_reports(db, user, habit, redis):
+    today = date.today()
+    cache_reports(db, user, habit, today)
+    dropped = {
+        AnalyticsService._heatmap_key(user.id, habit.id, today.year),
+        AnalyticsService._monthly_key(user.id, habit.id, today.year, today.month),
+        AnalyticsService._weekly_key(user.id, habit.id, today - timedelta(days=today.weekday())),
+        AnalyticsService._trend_key(user.id, habit.id, today, 30),
+        AnalyticsService._dashboard_key(user.id)
+    }
+    kept = {
+        AnalyticsService._heatmap_key(user.id, habit.id, today.year - 1),
+        AnalyticsService._monthly_key(user.id, habit.id, today.year - 1, today.month)
+    }
+    assert all(redis.exists(key) for key in dropped | kept)
+    
+    AnalyticsService.invalidate_habit(user.id, habit.id, today)
+    
+    assert [key for key in dropped if redis.exists(key)] == []
+    assert all(redis.exists(key) for key in kept)
+    # The habit's index still tracks the reports left in the cache
+    assert redis.smembers(AnalyticsService._habit_index_key(user.id, habit.id)) == kept
+
+
+def test_an_undated_change_drops_every_report(db, user, habit, redis):
+    today = date.today()
+    cache_reports(db, user, habit, today)
+    index_key = AnalyticsService._habit_index_key(user.id, habit.id)
+    tracked = redis.smembers(index_key)
+    assert len(tracked) == 6
+    
+    AnalyticsService.invalidate_habit(user.id, habit.id)
+    
+    assert [key for key in tracked | {index_key} if redis.exists(key)] == []
+
+
+def test_logging_refreshes_the_cached_heatmap(db, user, habit, log):
+    today = date.today()
+    assert AnalyticsService.get_heatmap_data(db, user.id, habit.id, today.year) == \
+        AnalyticsService._compute_heatmap_data(db, habit.id, today.year)
+    
+    log(habit, 0)
+    
+    assert AnalyticsService.get_heatmap_data(db, user.id, habit.id, today.year) == \
+        AnalyticsService._compute_heatmap_data(db, habit.id, today.year)
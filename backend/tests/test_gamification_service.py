@@ -0,0 +1,54 @@
+import pytest
+from sqlalchemy import event
+from app.database import engine
+from app.models import Achievement, UserAchievement
+from app.models.achievement import AchievementType
+from app.services.achievement_catalog import achievement_catalog
+
+
+@pytest.fixture
+def streak_ladder(db):
+    """A large catalog: one streak achievement for every day up to 500"""
+    db.add_all([
+        Achievement(name=f"Streak {days}", achievement_type=AchievementType.STREAK, requirement_value=days, xp_reward=1)
+        for days in range(1, 501)
+    ])
+    db.commit()
+
+
+@pytest.fixture
+def statements():
+    seen = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+def test_log_matches_only_the_thresholds_it_crossed(db, user, habit, log, streak_ladder, monkeypatch):
+    matched = []
+    crossed = achievement_catalog.crossed
+    
+    def record(*args, **kwargs):
+        result = crossed(*args, **kwargs)
+        matched.append([entry["requirement_value"] for entry in result])
+        return result
+    monkeypatch.setattr(achievement_catalog, "crossed", record)
+    
+    log(habit, 0)
+    # Back-dated completion: the streak goes from 1 to 2
+    log(habit, 1)
+    assert matched == [[1], [2]]
+    unlocked = db.query(Achievement.requirement_value).join(UserAchievement).order_by(Achievement.requirement_value).all()
+    assert [row[0] for row in unlocked] == [1, 2]
+
+
+def test_log_crossing_nothing_skips_the_unlock_lookup(db, user, habit, log, streak_ladder, statements):
+    log(habit, 0)
+    statements.clear()
+    
+    # Re-logging today leaves every metric where it was
+    log(habit, 0)
+    assert not [statement for statement in statements if "user_achievements" in statement]
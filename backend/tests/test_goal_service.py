@@ -0,0 +1,79 @@
+import json
+from datetime import date, timedelta
+from app.models import Goal, OutboxEvent
+from app.models.habit_log import LogStatus
+from app.schemas.goal import GoalCreate
+from app.schemas.habit import HabitCreate
+from app.schemas.habit_log import HabitLogCreate
+from app.services.goal_service import GoalService
+from app.services.habit_service import HabitService
+
+
+def goal_for(db, user, habits, weights, target_value=100):
+    return GoalService.create_goal(db, user.id, GoalCreate(
+        name="Goal", target_value=target_value, habit_ids=[habit.id for habit in habits], contribution_weights=weights
+    ))
+
+
+def completions(db):
+    return [json.loads(event.payload)["data"]["goal_id"] for event in db.query(OutboxEvent).all()
+            if json.loads(event.payload)["type"] == "goal_completed"]
+
+
+def test_deltas_match_a_recalculation(db, user, habit, log):
+    read = HabitService.create_habit(db, user.id, HabitCreate(name="Read"))
+    log(habit, 5)
+    goal = goal_for(db, user, [habit, read], [1.0, 0.5])
+    # Existing completions are counted when the goal is created
+    assert goal.current_value == 1.0
+    
+    log(habit, 0)
+    log(habit, 1)
+    log(read, 0)
+    log(read, 1)
+    log(habit, 1, LogStatus.SKIPPED)
+    log(read, 0, LogStatus.MISSED)
+    log(read, 0, LogStatus.MISSED)
+    today = date.today()
+    HabitService.bulk_log_habits(db, user.id, [
+        HabitLogCreate(habit_id=habit.id, log_date=today - timedelta(days=2), status=LogStatus.DONE),
+        HabitLogCreate(habit_id=read.id, log_date=today - timedelta(days=2), status=LogStatus.DONE),
+        HabitLogCreate(habit_id=habit.id, log_date=today - timedelta(days=5), status=LogStatus.DONE)
+    ])
+    
+    db.refresh(goal)
+    # Run: days 0, 2, 5; Read: days 1, 2 at half weight
+    assert goal.current_value == 4.0
+    assert GoalService.recalculate_goals(db, [goal.id]) == 0
+    db.refresh(goal)
+    assert goal.current_value == 4.0
+
+
+def test_recalculate_fixes_drift(db, user, habit, log):
+    log(habit, 0)
+    goal = goal_for(db, user, [habit], [1.0])
+    goal.current_value = 7.0
+    db.commit()
+    
+    assert GoalService.recalculate_goals(db, [goal.id]) == 1
+    db.refresh(goal)
+    assert goal.current_value == 1.0
+
+
+def test_reaching_the_target_completes_once(db, user, habit, log):
+    goal = goal_for(db, user, [habit], [1.0], target_value=2)
+    
+    log(habit, 1)
+    log(habit, 0)
+    db.refresh(goal)
+    assert goal.is_completed and goal.current_value == 2.0
+    assert completions(db) == [goal.id]
+    
+    # Completed goals are no longer moved by deltas or recalculated
+    log(habit, 0, LogStatus.MISSED)
+    log(habit, 0)
+    assert GoalService.recalculate_goals(db, [goal.id]) == 0
+    db.refresh(goal)
+    assert goal.current_value == 2.0
+    assert completions(db) == [goal.id]
+    assert db.query(Goal).filter(Goal.is_completed == True).count() == 1
@@ -0,0 +1,91 @@
+from datetime import date, timedelta
+import pytest
+from app.core.redis_client import redis_batch
+from app.database import unit_of_work
+from app.models import HabitLog, HabitYearBitmap
+from app.models.habit_log import LogStatus
+from app.services.habit_bitmap_service import HabitBitmapService
+from app.services.habit_service import HabitService
+
+
+def test_log_after_cache_warmed_counts_the_new_log(db, habit, log, redis):
+    log(habit, 2)
+    log(habit, 1)
+    # Nightly recompute: nothing done today yet
+    habit.current_streak = 0
+    db.commit()
+    
+    HabitBitmapService.get_year(db, habit.id, date.today().year)
+    assert redis.exists(HabitBitmapService.CACHE_KEY.format(habit_id=habit.id, year=date.today().year))
+    
+    log(habit, 0)
+    db.refresh(habit)
+    assert habit.current_streak == 3
+    assert habit.consistency_score == HabitService._consistency_from_completions(habit.frequency, 3)
+
+
+def test_dirty_year_is_not_cached_before_commit(db, habit, log, redis):
+    log(habit, 1)
+    HabitBitmapService.apply_changes(db, [(habit.id, date.today(), None, LogStatus.DONE)])
+    
+    bits = HabitBitmapService.get_year(db, habit.id, date.today().year)[LogStatus.DONE]
+    assert bits >> HabitBitmapService.day_index(date.today()) & 1
+    assert not redis.exists(HabitBitmapService.CACHE_KEY.format(habit_id=habit.id, year=date.today().year))
+    db.rollback()
+
+
+def test_current_streak_crosses_year_boundary(db, habit, user):
+    for day in (date(2025, 12, 30), date(2025, 12, 31), date(2026, 1, 1), date(2026, 1, 2)):
+        HabitService.log_habit(db, habit.id, user.id, day, LogStatus.DONE)
+    
+    assert HabitBitmapService.current_streak(db, habit.id, date(2026, 1, 2)) == 4
+    assert HabitBitmapService.current_streak(db, habit.id, date(2026, 1, 3)) == 0
+
+
+def test_count_range_spans_years(db, habit, user):
+    HabitService.log_habit(db, habit.id, user.id, date(2025, 12, 31), LogStatus.DONE)
+    HabitService.log_habit(db, habit.id, user.id, date(2026, 1, 1), LogStatus.SKIPPED)
+    HabitService.log_habit(db, habit.id, user.id, date(2026, 1, 5), LogStatus.DONE)
+    
+    counts = HabitBitmapService.count_range(db, habit.id, date(2025, 12, 31), date(2026, 1, 4))
+    assert counts[LogStatus.DONE] == 1
+    assert counts[LogStatus.SKIPPED] == 1
+    assert counts[LogStatus.MISSED] == 0
+
+
+def test_rebuild_matches_incremental_bits(db, habit, log):
+    log(habit, 3)
+    log(habit, 1, LogStatus.SKIPPED)
+    log(habit, 0)
+    year = date.today().year
+    before = HabitBitmapService.get_year(db, habit.id, year)
+    
+    HabitBitmapService.rebuild(db, [habit.id])
+    assert HabitBitmapService.get_year(db, habit.id, year) == before
+
+
+def test_rebuild_joins_an_enclosing_unit_of_work(db, habit, log):
+    log(habit, 0)
+    
+    with pytest.raises(RuntimeError):
+        with unit_of_work(db):
+            db.query(HabitLog).filter(HabitLog.habit_id == habit.id).delete()
+            HabitBitmapService.rebuild(db, [habit.id])
+            raise RuntimeError("a later step failed")
+    # The rebuild from no logs was rolled back with the rest
+    assert db.query(HabitYearBitmap).filter(HabitYearBitmap.habit_id == habit.id).count() == 1
+    assert HabitBitmapService.get_year(db, habit.id, date.today().year)[LogStatus.DONE]
+
+
+def test_cache_fill_is_not_deferred_to_the_request_batch(db, habit, log, redis):
+    log(habit, 0)
+    year = date.today().year
+    key = HabitBitmapService.CACHE_KEY.format(habit_id=habit.id, year=year)
+    redis.delete(key)
+    
+    with redis_batch():
+        HabitBitmapService.get_year(db, habit.id, year)
+        # Already written: a concurrent invalidation sent before the batch flushes is not overwritten
+        assert redis.exists(key)
+        redis.delete(key)
+    assert not redis.exists(key)
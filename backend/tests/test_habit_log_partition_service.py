@@ -0,0 +1,51 @@
+from datetime import date, timedelta
+from dateutil.relativedelta import relativedelta
+from app.models import HabitLog, HabitLogArchive, HabitLogArchiveTotal, UserDailyRollup
+from app.models.habit_log import LogStatus
+from app.schemas.goal import GoalCreate
+from app.services.goal_service import GoalService
+from app.services.habit_log_partition_service import HabitLogPartitionService
+from app.services.rollup_service import RollupService
+from app.services.stats_rebuild_service import StatsRebuildService
+
+
+def test_ranges_cover_first_day_through_the_partitions_ahead():
+    today = date.today()
+    ranges = HabitLogPartitionService._ranges("month", date(today.year - 1, 3, 17), ahead=2)
+    
+    assert ranges[0] == (date(today.year - 1, 3, 1), date(today.year - 1, 4, 1))
+    assert all(end == next_start for (_, end), (next_start, _) in zip(ranges, ranges[1:]))
+    # The last one holds the month two months from now
+    assert ranges[-1][0] == (today + relativedelta(months=2)).replace(day=1)
+    assert HabitLogPartitionService._partition_name(date(2024, 3, 1), "month") == "habit_logs_p2024_03"
+    assert HabitLogPartitionService._partition_name(date(2024, 1, 1), "year") == "habit_logs_p2024"
+    assert HabitLogPartitionService._ranges("year", date(2024, 6, 5), ahead=0)[0] == (date(2024, 1, 1), date(2025, 1, 1))
+
+
+def test_rebuilds_keep_archived_logs(db, user, habit, log):
+    goal = GoalService.create_goal(db, user.id, GoalCreate(name="Goal", target_value=100, habit_ids=[habit.id]))
+    for days_ago in (60, 59, 58):
+        log(habit, days_ago)
+    log(habit, 57, LogStatus.MISSED)
+    log(habit, 0)
+    cutoff = date.today() - timedelta(days=30)
+    archived_day = db.get(UserDailyRollup, (user.id, date.today() - timedelta(days=60))).done_count
+    
+    # What archive_partition leaves behind: the archive record, per-habit totals, logs gone
+    db.add(HabitLogArchive(partition_name="habit_logs_old", range_start=cutoff - timedelta(days=90), range_end=cutoff, row_count=4, file_path="old.csv"))
+    db.add(HabitLogArchiveTotal(habit_id=habit.id, done_count=3, skipped_count=0, missed_count=1))
+    db.query(HabitLog).filter(HabitLog.log_date < cutoff).delete()
+    db.commit()
+    assert HabitLogPartitionService.archived_through(db) == cutoff
+    
+    StatsRebuildService.rebuild_habits(db, [habit.id])
+    db.refresh(habit)
+    assert (habit.total_logs, habit.total_completions) == (5, 4)
+    
+    assert GoalService.recalculate_goals(db, [goal.id]) == 0
+    db.refresh(goal)
+    assert goal.current_value == 4
+    
+    RollupService.backfill(db)
+    rollup = db.get(UserDailyRollup, (user.id, date.today() - timedelta(days=60)), populate_existing=True)
+    assert rollup.done_count == archived_day == 1
@@ -0,0 +1,217 @@
+from datetime import date, timedelta
+import pytest
+from app.database import count_db_work
+from app.models import HabitLog, HabitLogArchiveTotal, OutboxEvent, User, UserDailyRollup
+from app.models.habit_log import LogStatus
+from app.schemas.goal import GoalCreate
+from app.schemas.habit_log import HabitLogCreate
+from app.services.gamification_service import GamificationService
+from app.services.goal_service import GoalService
+from app.services.habit_service import HabitService
+
+
+def entry(habit, days_ago, status=LogStatus.DONE):
+    return HabitLogCreate(habit_id=habit.id, log_date=date.today() - timedelta(days=days_ago), status=status)
+
+
+def test_bulk_log_upserts_and_reports_each_entry(db, habit, user, log):
+    log(habit, 1, LogStatus.SKIPPED)
+    
+    result = HabitService.bulk_log_habits(db, user.id, [
+        entry(habit, 0, LogStatus.SKIPPED),
+        entry(habit, 1),
+        entry(habit, 0),
+        HabitLogCreate(habit_id=habit.id + 1, log_date=date.today(), status=LogStatus.DONE),
+    ])
+    
+    assert (result["created"], result["updated"], result["skipped"]) == (1, 1, 2)
+    assert [row["result"] for row in result["results"]] == ["duplicate", "updated", "created", "not_found"]
+    assert db.query(HabitLog).filter(HabitLog.status == LogStatus.DONE).count() == 2
+    
+    db.refresh(habit)
+    assert habit.total_completions == 2
+    assert habit.total_skips == 0
+    assert habit.current_streak == 2
+    assert db.query(OutboxEvent).filter(OutboxEvent.payload.contains('"habits_logged"')).count() == 1
+
+
+def test_bulk_log_is_atomic(db, habit, user, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("goal update failed")
+    monkeypatch.setattr(GoalService, "apply_completion_deltas", fail)
+    
+    with pytest.raises(RuntimeError):
+        HabitService.bulk_log_habits(db, user.id, [entry(habit, 1), entry(habit, 0)])
+    
+    assert db.query(HabitLog).count() == 0
+    assert db.get(User, user.id).total_xp == 0
+    db.refresh(habit)
+    assert habit.total_completions == 0
+    
+    # A retry logs the batch as new and awards its XP
+    monkeypatch.undo()
+    result = HabitService.bulk_log_habits(db, user.id, [entry(habit, 1), entry(habit, 0)])
+    assert result["created"] == 2
+    assert db.get(User, user.id).total_xp > 0
+
+
+def test_log_commits_once(db, habit, user, log):
+    goal = GoalService.create_goal(db, user.id, GoalCreate(name="Goal", target_value=1, habit_ids=[habit.id]))
+    
+    with count_db_work() as work:
+        log(habit, 0)
+    
+    assert work["commits"] == 1
+    db.refresh(goal)
+    assert goal.is_completed
+    assert {event.channel for event in db.query(OutboxEvent)} == {f"user:{user.id}"}
+
+
+def test_log_is_atomic(db, habit, user, log, monkeypatch):
+    goal = GoalService.create_goal(db, user.id, GoalCreate(name="Goal", target_value=5, habit_ids=[habit.id]))
+    
+    def fail(*args, **kwargs):
+        raise RuntimeError("XP award failed")
+    monkeypatch.setattr(GamificationService, "award_xp_for_habit", fail)
+    
+    with pytest.raises(RuntimeError):
+        log(habit, 0)
+    
+    # The log, stats, rollup, goal progress and event were rolled back together
+    assert db.query(HabitLog).count() == 0
+    assert db.query(UserDailyRollup).filter(UserDailyRollup.done_count > 0).count() == 0
+    assert db.query(OutboxEvent).count() == 0
+    db.refresh(habit)
+    db.refresh(goal)
+    assert (habit.total_completions, habit.current_streak, goal.current_value) == (0, 0, 0)
+    
+    monkeypatch.undo()
+    log(habit, 0)
+    db.refresh(goal)
+    assert goal.current_value == 1
+
+
+def test_first_completion_of_the_day_extends_the_run_without_a_rescan(db, habit, log, monkeypatch):
+    log(habit, 3)
+    log(habit, 2)
+    log(habit, 1)
+    # Nightly recompute: nothing done today yet
+    habit.current_streak = 0
+    db.commit()
+    
+    def rescan(*args, **kwargs):
+        raise AssertionError("full stats rescan")
+    monkeypatch.setattr(HabitService, "_update_habit_stats", rescan)
+    log(habit, 0)
+    
+    db.refresh(habit)
+    assert habit.current_streak == 4
+    assert habit.longest_streak == 4
+
+
+def test_back_dated_completion_joins_runs(db, habit, log):
+    log(habit, 3)
+    log(habit, 2)
+    log(habit, 0)
+    db.refresh(habit)
+    assert habit.current_streak == 1
+    
+    log(habit, 1)
+    db.refresh(habit)
+    assert habit.current_streak == 4
+    assert habit.longest_streak == 4
+
+
+def test_break_inside_the_streak_window_shortens_the_streak(db, habit, log):
+    for days_ago in (3, 2, 1, 0):
+        log(habit, days_ago)
+    
+    log(habit, 2, LogStatus.SKIPPED)
+    db.refresh(habit)
+    assert habit.current_streak == 2
+    assert habit.longest_streak == 4
+    assert habit.total_completions == 3
+    assert habit.total_skips == 1
+
+
+def test_undoing_today_with_a_future_completion_logged(db, habit, log):
+    log(habit, 1)
+    log(habit, 0)
+    log(habit, -1)
+    
+    log(habit, 0, LogStatus.SKIPPED)
+    db.refresh(habit)
+    assert habit.current_streak == 0
+    assert habit.total_completions == 2
+    assert habit.last_completed_date.date() == date.today() + timedelta(days=1)
+
+
+def test_future_completion_leaves_the_streak(db, habit, log):
+    log(habit, 1)
+    log(habit, 0)
+    
+    log(habit, -3)
+    db.refresh(habit)
+    assert habit.current_streak == 2
+    assert habit.total_completions == 3
+    assert habit.last_completed_date.date() == date.today() + timedelta(days=3)
+    
+    # Later edits before today still see today as done
+    log(habit, 1)
+    log(habit, 2, LogStatus.SKIPPED)
+    db.refresh(habit)
+    assert habit.current_streak == 2
+
+
+def test_undoing_today_ends_the_streak_and_redoing_restores_it(db, habit, log):
+    log(habit, 2)
+    log(habit, 1)
+    log(habit, 0)
+    
+    log(habit, 0, LogStatus.SKIPPED)
+    db.refresh(habit)
+    assert habit.current_streak == 0
+    assert habit.last_completed_date.date() == date.today() - timedelta(days=1)
+    
+    log(habit, 0)
+    db.refresh(habit)
+    assert habit.current_streak == 3
+
+
+def test_incremental_stats_match_a_full_rebuild(db, habit, log):
+    # Edits in an order that exercises inserts, status flips and back-dated changes
+    edits = [
+        (5, LogStatus.DONE), (4, LogStatus.DONE), (2, LogStatus.SKIPPED), (0, LogStatus.DONE),
+        (1, LogStatus.DONE), (2, LogStatus.DONE), (4, LogStatus.MISSED), (3, LogStatus.DONE),
+        (0, LogStatus.SKIPPED), (0, LogStatus.DONE), (6, LogStatus.DONE), (4, LogStatus.DONE),
+    ]
+    fields = ("total_logs", "total_completions", "total_skips", "current_streak", "longest_streak",
+              "failure_rate", "consistency_score", "last_completed_date")
+    for days_ago, status in edits:
+        log(habit, days_ago, status)
+        db.refresh(habit)
+        incremental = {field: getattr(habit, field) for field in fields}
+        
+        HabitService._update_habit_stats(db, habit)
+        db.refresh(habit)
+        assert incremental == {field: getattr(habit, field) for field in fields}, (days_ago, status)
+
+
+def test_fallback_rebuild_keeps_archived_totals(db, habit, log):
+    for days_ago in (40, 39, 38):
+        log(habit, days_ago)
+    log(habit, 37, LogStatus.SKIPPED)
+    # What archive_partition leaves behind: per-habit totals, logs gone
+    db.add(HabitLogArchiveTotal(habit_id=habit.id, done_count=3, skipped_count=1, missed_count=0))
+    db.query(HabitLog).filter(HabitLog.log_date < date.today() - timedelta(days=30)).delete()
+    db.commit()
+    
+    log(habit, 2)
+    log(habit, 0)
+    # Back-dated completion joining the runs takes the full-rebuild fallback
+    log(habit, 1)
+    db.refresh(habit)
+    assert habit.current_streak == 3
+    assert habit.total_completions == 6
+    assert habit.total_skips == 1
+    assert habit.total_logs == 7
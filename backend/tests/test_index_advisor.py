@@ -0,0 +1,44 @@
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from app.database import engine
+from app.models import Habit, User
+from app.tools import index_advisor
+
+
+def test_seq_scans_walks_the_whole_plan():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "users"},
+            {"Node Type": "Hash", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "habit_logs"}]},
+            {"Node Type": "Seq Scan", "Relation Name": "goals"}
+        ]
+    }
+    
+    assert list(index_advisor.seq_scans(plan)) == ["habit_logs", "goals"]
+
+
+def test_capture_records_each_statement_once_and_survives_failing_steps(db):
+    with engine.connect() as connection:
+        session = Session(bind=connection)
+        
+        def fail():
+            session.execute(select(User.id).where(User.id == 2))
+            raise RuntimeError("step failed")
+        steps = [
+            ("users", lambda: session.execute(select(User.id).where(User.id == 1))),
+            ("failing", fail),
+            ("users again", lambda: session.execute(select(User.id).where(User.id == 3))),
+            ("habits", lambda: session.execute(select(Habit.id))),
+            ("pragma", lambda: session.execute(text("PRAGMA user_version")))
+        ]
+        statements = index_advisor.capture(connection, session, steps)
+        session.close()
+    
+    # Only DML is kept, with the step and parameters of its first run
+    assert [(step, parameters) for step, _, parameters in statements] == [("users", (1,)), ("habits", ())]
+
+
+def test_main_refuses_other_databases(capsys):
+    assert index_advisor.main(["--database-url", "sqlite://"]) == 2
+    assert "needs PostgreSQL" in capsys.readouterr().out
@@ -0,0 +1,57 @@
+from app.models import User
+from app.services.gamification_service import GamificationService
+from app.services.leveling import ArithmeticCurve, LevelCurve
+
+
+def old_calculate_level(total_xp):
+    """The loop the level engine replaced: level * 100 XP per level"""
+    level = 1
+    xp_needed = 0
+    while xp_needed <= total_xp:
+        level += 1
+        xp_needed += level * 100
+    return max(1, level - 1)
+
+
+def old_threshold(level):
+    return sum(100 * n for n in range(2, level + 1))
+
+
+# Either side of every threshold of the first 200 levels, plus a spread in between
+XPS = sorted(
+    {max(0, old_threshold(level) + offset) for level in range(1, 201) for offset in (-1, 0, 1)}
+    | set(range(0, 50000, 37))
+)
+
+
+def test_arithmetic_curve_matches_the_old_thresholds():
+    curve = ArithmeticCurve(100, table_size=10)
+    
+    for xp in XPS:
+        assert curve.level_for(xp) == old_calculate_level(xp), xp
+    # The bisect path (extending the table on demand) agrees with the closed form
+    assert curve.levels_for(XPS) == [old_calculate_level(xp) for xp in XPS]
+    assert LevelCurve(lambda level: 100 * level, table_size=10).levels_for(XPS) == curve.levels_for(XPS)
+
+
+def test_xp_to_next_level_uses_the_cumulative_threshold():
+    curve = ArithmeticCurve(100)
+    
+    # Level 2 at 200 XP, level 3 at 500
+    assert curve.level_for(199) == 1 and curve.level_for(200) == 2 and curve.level_for(500) == 3
+    assert curve.xp_to_next_level(0) == 200
+    assert curve.xp_to_next_level(250) == 250
+    assert GamificationService.xp_to_next_level(250, 2) == 250
+
+
+def test_relevel_all_users_writes_only_changed_levels(db):
+    db.add_all([
+        User(email="a@example.com", hashed_password="x", total_xp=0, level=1),
+        User(email="b@example.com", hashed_password="x", total_xp=500, level=1),
+        User(email="c@example.com", hashed_password="x", total_xp=1399, level=5)
+    ])
+    db.commit()
+    
+    assert GamificationService.relevel_all_users(db, chunk_size=2) == {"users": 3, "changed": 2}
+    db.expire_all()
+    assert [user.level for user in db.query(User).order_by(User.id)] == [1, 3, 4]
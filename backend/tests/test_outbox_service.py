@@ -0,0 +1,70 @@
+import json
+import pytest
+import redis as redis_lib
+from app.models import OutboxEvent
+from app.services.outbox_service import OutboxService
+
+
+def enqueue(db, user, count):
+    OutboxService.enqueue_many(db, [
+        {"channel": f"user:{user.id}", "event_type": "tick", "data": {"n": n}, "user_id": user.id}
+        for n in range(count)
+    ])
+    db.commit()
+
+
+def subscribe(redis, user):
+    pubsub = redis.pubsub()
+    pubsub.subscribe(f"user:{user.id}")
+    pubsub.get_message(timeout=1)  # The subscribe confirmation
+    return pubsub
+
+
+def published(pubsub):
+    messages = []
+    while (message := pubsub.get_message(ignore_subscribe_messages=True)) is not None:
+        messages.append(json.loads(message["data"]))
+    return messages
+
+
+def test_relay_publishes_in_order_and_marks_published(db, user, redis):
+    pubsub = subscribe(redis, user)
+    enqueue(db, user, 5)
+    
+    assert OutboxService.relay(db, batch_size=2) == 5
+    messages = published(pubsub)
+    assert [message["data"]["n"] for message in messages] == [0, 1, 2, 3, 4]
+    # Each carries its event id and the stream position it was appended at
+    rows = db.query(OutboxEvent).order_by(OutboxEvent.id).all()
+    assert [message["id"] for message in messages] == [row.event_id for row in rows]
+    assert [message["cursor"] for message in messages] == [entry_id for entry_id, _ in redis.xrange(f"stream:user:{user.id}")]
+    
+    assert all(row.published_at is not None for row in rows)
+    assert OutboxService.pending_count(db) == 0
+    assert OutboxService.relay(db) == 0
+    assert published(pubsub) == []
+
+
+def test_relay_stops_after_max_batches(db, user):
+    enqueue(db, user, 5)
+    
+    assert OutboxService.relay(db, batch_size=2, max_batches=2) == 4
+    assert OutboxService.pending_count(db) == 1
+
+
+def test_failed_batches_stay_pending_and_keep_their_event_ids(db, user, redis, monkeypatch):
+    enqueue(db, user, 3)
+    event_ids = [row.event_id for row in db.query(OutboxEvent).order_by(OutboxEvent.id)]
+    
+    def unavailable(client, messages):
+        raise redis_lib.ConnectionError("down")
+    with monkeypatch.context() as patch:
+        patch.setattr("app.services.outbox_service.stream_and_publish", unavailable)
+        with pytest.raises(redis_lib.ConnectionError):
+            OutboxService.relay(db)
+    assert OutboxService.pending_count(db) == 3
+    
+    # The retry sends the same ids, which consumers use to drop redeliveries
+    pubsub = subscribe(redis, user)
+    assert OutboxService.relay(db) == 3
+    assert [message["id"] for message in published(pubsub)] == event_ids
@@ -0,0 +1,70 @@
+import asyncio
+from collections import OrderedDict
+import fakeredis
+import pytest
+from app.core import principal_cache as principal_cache_module, redis_client
+from app.core.principal_cache import PrincipalCache, principal_cache
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    """principal_cache with both tiers empty; its Redis tier shares a server with the blocking client"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis_client, "redis_client", fakeredis.FakeRedis(server=server, decode_responses=True))
+    async_client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    monkeypatch.setattr(principal_cache_module, "get_async_redis_client", lambda: async_client)
+    monkeypatch.setattr(principal_cache, "_local", OrderedDict())
+    return principal_cache
+
+
+def cached(cache, user):
+    """(in the local tier, in Redis) for a user"""
+    return user.id in cache._local, bool(redis_client.redis_client.exists(PrincipalCache.KEY.format(user_id=user.id)))
+
+
+def test_get_serves_the_cached_identity(db, user, cache):
+    async def round_trip():
+        await cache.set(user)
+        cache._local.clear()
+        return await cache.get(user.id)
+    
+    principal = asyncio.run(round_trip())
+    assert (principal.id, principal.email) == (user.id, user.email)
+    assert cached(cache, user) == (True, True)
+
+
+def test_updating_a_cached_column_invalidates_after_commit(db, user, cache):
+    asyncio.run(cache.set(user))
+    
+    user.email = "renamed@example.com"
+    db.flush()
+    # Not before the change is visible
+    assert cached(cache, user) == (True, True)
+    db.commit()
+    assert cached(cache, user) == (False, False)
+
+
+def test_updating_other_columns_keeps_the_entry(db, user, cache):
+    asyncio.run(cache.set(user))
+    
+    user.total_xp = (user.total_xp or 0) + 10
+    db.commit()
+    assert cached(cache, user) == (True, True)
+
+
+def test_deleting_a_user_invalidates(db, user, cache):
+    asyncio.run(cache.set(user))
+    
+    db.delete(user)
+    db.commit()
+    assert cached(cache, user) == (False, False)
+
+
+def test_rollback_discards_the_invalidation(db, user, cache):
+    asyncio.run(cache.set(user))
+    
+    user.is_active = False
+    db.flush()
+    db.rollback()
+    db.commit()
+    assert cached(cache, user) == (True, True)
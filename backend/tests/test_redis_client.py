@@ -0,0 +1,101 @@
+import asyncio
+import json
+import threading
+import fakeredis
+import redis as redis_lib
+from app.core import redis_client
+from app.core.redis_client import cache_delete, cache_get, cache_read_through, publish_events, redis_call
+from app.database import AsyncSessionLocal
+
+
+class BlockingClientUsed:
+    def __getattr__(self, name):
+        raise AssertionError("blocking Redis client used on the event loop")
+
+
+def test_reads_inside_run_sync_are_awaited_on_the_async_client(monkeypatch):
+    async_client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(redis_client, "get_async_redis_client", lambda: async_client)
+    monkeypatch.setattr(redis_client, "redis_client", BlockingClientUsed())
+    
+    async def read():
+        await async_client.set("report", json.dumps({"done": 3}))
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(lambda session: cache_get("report"))
+    
+    assert asyncio.run(read()) == {"done": 3}
+
+
+def test_reads_outside_the_event_loop_use_the_blocking_client(redis):
+    redis.set("report", json.dumps({"done": 3}))
+    assert cache_get("report") == {"done": 3}
+
+
+def test_read_through_computes_once_then_serves_the_cache(redis):
+    counters = {"hits": 0, "misses": 0, "errors": 0}
+    loads = []
+    
+    def loader():
+        loads.append(1)
+        return {"done": 3}
+    
+    def track(pipe):
+        pipe.sadd("report:keys", "report")
+    
+    assert cache_read_through("report", loader, expire=60, counters=counters, on_store=track) == {"done": 3}
+    assert cache_read_through("report", loader, expire=60, counters=counters, on_store=track) == {"done": 3}
+    assert len(loads) == 1
+    assert counters == {"hits": 1, "misses": 1, "errors": 0}
+    assert 0 < redis.ttl("report") <= 60
+    assert redis.smembers("report:keys") == {"report"}
+
+
+def test_read_through_falls_back_to_the_loader_when_redis_is_down(monkeypatch):
+    def unavailable(op):
+        raise redis_lib.ConnectionError("down")
+    monkeypatch.setattr(redis_client, "redis_call", unavailable)
+    counters = {"hits": 0, "misses": 0, "errors": 0}
+    
+    assert cache_read_through("report", lambda: {"done": 3}, counters=counters) == {"done": 3}
+    assert counters["errors"] == 1
+
+
+def test_redis_call_from_a_coroutine_raises_instead_of_blocking(monkeypatch):
+    monkeypatch.setattr(redis_client, "redis_client", BlockingClientUsed())
+    
+    async def read():
+        return redis_call(lambda client: client.get("report"))
+    
+    try:
+        asyncio.run(read())
+    except RuntimeError as e:
+        assert "block the event loop" in str(e)
+    else:
+        raise AssertionError("redis_call ran on the event loop")
+
+
+def test_writes_from_a_coroutine_run_on_the_async_client(monkeypatch):
+    async_client = fakeredis.aioredis.FakeRedis(server=fakeredis.FakeServer(), decode_responses=True)
+    monkeypatch.setattr(redis_client, "get_async_redis_client", lambda: async_client)
+    monkeypatch.setattr(redis_client, "redis_client", BlockingClientUsed())
+    
+    async def delete():
+        await async_client.set("report", "{}")
+        cache_delete("report")
+        await asyncio.gather(*redis_client._tasks)
+        return await async_client.exists("report")
+    
+    assert asyncio.run(delete()) == 0
+
+
+def test_publish_inside_run_sync_leaves_the_event_loop(monkeypatch):
+    threads = []
+    monkeypatch.setattr(redis_client, "stream_and_publish", lambda client, messages: threads.append(threading.get_ident()))
+    
+    async def publish():
+        async with AsyncSessionLocal() as db:
+            await db.run_sync(lambda session: publish_events([{"channel": "user:1", "event_type": "nudge", "data": {}}]))
+        return threading.get_ident()
+    
+    loop_thread = asyncio.run(publish())
+    assert len(threads) == 1 and threads[0] != loop_thread
@@ -0,0 +1,39 @@
+import json
+from datetime import date, timedelta
+from app.models import Habit, OutboxEvent, User
+from app.models.habit import HabitStatus
+from app.models.habit_log import LogStatus
+from app.schemas.habit import HabitCreate
+from app.services.analytics_service import AnalyticsService
+from app.services.habit_service import HabitService
+from app.services.risk_detection_service import RiskDetectionService
+
+
+def test_batch_detection_flags_habits_missed_two_days_running(db, user, habit, log, redis):
+    other = User(email="other@example.com", hashed_password="x")
+    inactive = User(email="inactive@example.com", hashed_password="x", is_active=False)
+    db.add_all([other, inactive])
+    db.commit()
+    create = lambda owner, name: HabitService.create_habit(db, owner.id, HabitCreate(name=name))
+    done_yesterday = create(user, "Read")
+    done_day_before = create(other, "Write")
+    idle = create(other, "Stretch")
+    paused = create(other, "Swim")
+    paused.status = HabitStatus.PAUSED
+    db.commit()
+    create(inactive, "Sleep")
+    log(done_yesterday, 1)
+    HabitService.log_habit(db, done_day_before.id, other.id, date.today() - timedelta(days=2), LogStatus.DONE)
+    redis.set(AnalyticsService._dashboard_key(other.id), "{}")
+    
+    at_risk = RiskDetectionService.detect_all_at_risk_habits(db)
+    
+    assert sorted((item["user_id"], item["id"]) for item in at_risk) == [(user.id, habit.id), (other.id, idle.id)]
+    db.expire_all()
+    assert {row.id for row in db.query(Habit).filter(Habit.status == HabitStatus.AT_RISK)} == {habit.id, idle.id}
+    alerts = [json.loads(event.payload) for event in db.query(OutboxEvent).all()]
+    assert sorted(alert["data"]["habit_id"] for alert in alerts if alert["type"] == "habit_at_risk") == sorted([habit.id, idle.id])
+    assert not redis.exists(AnalyticsService._dashboard_key(other.id))
+    
+    # Flagged habits are no longer ACTIVE, so the next run has nothing to do
+    assert RiskDetectionService.detect_all_at_risk_habits(db) == []
@@ -0,0 +1,56 @@
+from datetime import date, timedelta
+import pytest
+from app.models.habit import HabitStatus
+from app.models.habit_log import LogStatus
+from app.models.user_daily_rollup import UserDailyRollup
+from app.schemas.habit import HabitCreate, HabitUpdate
+from app.services.habit_service import HabitService
+from app.services.rollup_service import RollupService
+
+
+SNAPSHOT = RollupService.SNAPSHOT_COLUMNS
+
+
+def snapshot(db, user_id):
+    rollup = db.get(UserDailyRollup, (user_id, date.today()), populate_existing=True)
+    return {column: getattr(rollup, column) for column in SNAPSHOT}
+
+
+def test_write_path_deltas_match_a_full_snapshot(db, user, habit, log, monkeypatch):
+    log(habit, 1)
+    # Today's snapshot exists now; later writes must not re-aggregate
+    def refresh(*args, **kwargs):
+        raise AssertionError("aggregate snapshot on the write path")
+    monkeypatch.setattr(RollupService, "refresh_snapshots", refresh)
+    
+    log(habit, 0)
+    other = HabitService.create_habit(db, user.id, HabitCreate(name="Read"))
+    log(other, 0, LogStatus.SKIPPED)
+    HabitService.update_habit(db, other.id, user.id, HabitUpdate(status=HabitStatus.AT_RISK))
+    third = HabitService.create_habit(db, user.id, HabitCreate(name="Stretch"))
+    log(third, 0)
+    HabitService.delete_habit(db, third.id, user.id)
+    incremental = snapshot(db, user.id)
+    
+    monkeypatch.undo()
+    RollupService.refresh_snapshots(db, [user.id])
+    db.commit()
+    assert snapshot(db, user.id) == pytest.approx(incremental)
+    assert incremental["total_habits"] == 2
+    assert incremental["at_risk_habits"] == 1
+    assert incremental["total_streak"] == 2
+
+
+def test_get_day_does_not_write(db, user, habit, log):
+    log(habit, 0)
+    yesterday = date.today() - timedelta(days=1)
+    db.query(UserDailyRollup).update({UserDailyRollup.day: yesterday})
+    db.commit()
+    
+    rollup = RollupService.get_day(db, user.id)
+    assert not db.new and not db.dirty
+    assert db.get(UserDailyRollup, (user.id, date.today())) is None
+    # Habit totals carry over from the latest snapshot, log counts start at zero
+    assert rollup.total_habits == 1
+    assert rollup.total_streak == 1
+    assert rollup.done_count == 0
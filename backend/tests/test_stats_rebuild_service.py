@@ -0,0 +1,64 @@
+from datetime import date
+from sqlalchemy import update
+from app.models import Habit
+from app.models.habit_log import LogStatus
+from app.services.analytics_service import AnalyticsService
+from app.services.habit_service import HabitService
+from app.services.stats_rebuild_service import StatsRebuildService
+from app.services.sync_service import SyncService
+
+
+def test_rebuild_finds_current_and_longest_runs(db, habit, log):
+    for days_ago in (7, 6, 5, 1, 0):
+        log(habit, days_ago)
+    log(habit, 3, LogStatus.SKIPPED)
+    db.execute(update(Habit).values(current_streak=0, longest_streak=0, total_completions=0))
+    db.commit()
+    
+    assert StatsRebuildService.rebuild_habits(db, [habit.id]) == 1
+    db.refresh(habit)
+    assert habit.current_streak == 2
+    assert habit.longest_streak == 3
+    assert habit.total_completions == 5
+    assert habit.total_skips == 1
+    assert habit.last_completed_date.date() == date.today()
+
+
+def test_rebuild_run_crosses_year_boundary(db, habit, user):
+    for day in (date(2025, 12, 29), date(2025, 12, 31), date(2026, 1, 1), date(2026, 1, 2)):
+        HabitService.log_habit(db, habit.id, user.id, day, LogStatus.DONE)
+    
+    StatsRebuildService.rebuild_habits(db, [habit.id], today=date(2026, 1, 2))
+    db.refresh(habit)
+    assert habit.current_streak == 3
+
+
+def test_rebuild_only_writes_and_stamps_changed_habits(db, habit, user, log):
+    log(habit, 1)
+    log(habit, 0)
+    cursor = SyncService.get_changes(db, user.id, None)["cursor"]
+    
+    assert StatsRebuildService.rebuild_habits(db, [habit.id]) == 0
+    changes = SyncService.get_changes(db, user.id, cursor)
+    assert changes["cursor"] == cursor
+    assert changes["habits"] == []
+    
+    db.execute(update(Habit).values(current_streak=0))
+    db.commit()
+    assert StatsRebuildService.rebuild_habits(db, [habit.id]) == 1
+    changes = SyncService.get_changes(db, user.id, cursor)
+    assert [changed.id for changed in changes["habits"]] == [habit.id]
+    assert changes["habits"][0].current_streak == 2
+
+
+def test_rebuild_drops_cached_dashboard_and_today(db, habit, user, log):
+    log(habit, 1)
+    log(habit, 0)
+    db.execute(update(Habit).values(current_streak=0))
+    db.commit()
+    assert HabitService.get_today(db, user.id)["habits"][0]["current_streak"] == 0
+    AnalyticsService.get_user_dashboard_stats(db, user.id)
+    
+    StatsRebuildService.rebuild_habits(db, [habit.id])
+    assert HabitService.get_today(db, user.id)["habits"][0]["current_streak"] == 2
+    assert AnalyticsService.get_user_dashboard_stats(db, user.id)["total_streak"] == 2
@@ -0,0 +1,71 @@
+from datetime import datetime
+from sqlalchemy import update
+from app.models import SyncTombstone, User
+from app.models.habit_log import LogStatus
+from app.schemas.habit import HabitCreate
+from app.services.habit_service import HabitService
+from app.services.sync_service import SyncService
+
+
+def test_first_sync_is_a_full_snapshot(db, habit, user, log):
+    log(habit, 0)
+    
+    changes = SyncService.get_changes(db, user.id)
+    assert changes["full"]
+    assert changes["cursor"] == db.get(User, user.id).change_seq
+    assert [changed.id for changed in changes["habits"]] == [habit.id]
+    assert len(changes["habit_logs"]) == 1
+    assert changes["user"]["total_xp"] > 0
+
+
+def test_sync_at_cursor_returns_nothing(db, habit, user):
+    cursor = SyncService.get_changes(db, user.id)["cursor"]
+    
+    changes = SyncService.get_changes(db, user.id, cursor)
+    assert not changes["full"]
+    assert changes["cursor"] == cursor
+    assert changes["user"] is None
+    assert changes["habits"] == [] and changes["habit_logs"] == []
+
+
+def test_delta_returns_only_rows_written_after_the_cursor(db, habit, user, log):
+    other = HabitService.create_habit(db, user.id, HabitCreate(name="Read"))
+    log(other, 1)
+    cursor = SyncService.get_changes(db, user.id)["cursor"]
+    
+    log(habit, 0, LogStatus.SKIPPED)
+    changes = SyncService.get_changes(db, user.id, cursor)
+    assert not changes["full"]
+    assert changes["cursor"] > cursor
+    assert [changed.id for changed in changes["habits"]] == [habit.id]
+    assert [(changed.habit_id, changed.status) for changed in changes["habit_logs"]] == [(habit.id, LogStatus.SKIPPED)]
+
+
+def test_deleted_habit_leaves_a_tombstone(db, habit, user, log):
+    log(habit, 0)
+    cursor = SyncService.get_changes(db, user.id)["cursor"]
+    
+    HabitService.delete_habit(db, habit.id, user.id)
+    changes = SyncService.get_changes(db, user.id, cursor)
+    assert changes["deleted"]["habits"] == [habit.id]
+    # The habit's logs go with it on the client
+    assert changes["deleted"]["habit_logs"] == []
+    assert changes["habits"] == []
+
+
+def test_cursor_below_the_sync_floor_gets_a_full_snapshot(db, habit, user):
+    cursor = SyncService.get_changes(db, user.id)["cursor"]
+    HabitService.delete_habit(db, habit.id, user.id)
+    db.execute(update(SyncTombstone).values(deleted_at=datetime(2020, 1, 1)))
+    db.commit()
+    
+    assert SyncService.purge_tombstones(db) == 1
+    assert db.get(User, user.id).sync_floor > cursor
+    changes = SyncService.get_changes(db, user.id, cursor)
+    assert changes["full"]
+    assert changes["deleted"]["habits"] == []
+
+
+def test_cursor_ahead_of_the_server_gets_a_full_snapshot(db, habit, user):
+    cursor = SyncService.get_changes(db, user.id)["cursor"]
+    assert SyncService.get_changes(db, user.id, cursor + 10)["full"]
@@ -0,0 +1,26 @@
+import json
+import redis as redis_lib
+from app.models import OutboxEvent
+from celery_app.tasks import send_daily_nudges
+
+
+def test_nudges_go_through_the_outbox(db, habit, user, redis):
+    assert send_daily_nudges() == {"nudged_users": 1}
+    
+    events = db.query(OutboxEvent).all()
+    assert len(events) == 1
+    assert events[0].published_at is not None
+    message = json.loads(events[0].payload)
+    assert message["type"] == "nudge"
+    assert message["data"]["habits"] == [{"id": habit.id, "name": habit.name}]
+    assert redis.xlen(f"stream:user:{user.id}") == 1
+
+
+def test_nudges_stay_pending_when_redis_is_down(db, habit, user, monkeypatch):
+    def unavailable(client, messages):
+        raise redis_lib.ConnectionError("down")
+    monkeypatch.setattr("app.services.outbox_service.stream_and_publish", unavailable)
+    
+    assert send_daily_nudges() == {"nudged_users": 1}
+    events = db.query(OutboxEvent).all()
+    assert len(events) == 1 and events[0].published_at is None
@@ -0,0 +1,67 @@
+import asyncio
+from collections import OrderedDict
+import fakeredis
+import pytest
+from sqlalchemy import event
+from app.core import principal_cache as principal_cache_module
+from app.core.principal_cache import principal_cache
+from app.core.security import create_access_token
+from app.database import async_engine
+from app.models import User
+from app.websocket.handlers import verify_token
+
+
+@pytest.fixture
+def checkouts(redis, monkeypatch):
+    """Async pool connections currently checked out, and how many were ever checked out"""
+    server = redis.connection_pool.connection_kwargs["server"]
+    monkeypatch.setattr(principal_cache_module, "get_async_redis_client", lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    monkeypatch.setattr(principal_cache, "_local", OrderedDict())
+    
+    counts = {"open": 0, "total": 0}
+    
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        counts["open"] += 1
+        counts["total"] += 1
+    
+    def checkin(dbapi_connection, connection_record):
+        counts["open"] -= 1
+    pool = async_engine.sync_engine.pool
+    event.listen(pool, "checkout", checkout)
+    event.listen(pool, "checkin", checkin)
+    yield counts
+    event.remove(pool, "checkout", checkout)
+    event.remove(pool, "checkin", checkin)
+
+
+def token_for(user):
+    return create_access_token({"sub": user.email, "uid": user.id})
+
+
+def verify(*tokens):
+    async def main():
+        try:
+            return [await verify_token(token) for token in tokens]
+        finally:
+            await async_engine.dispose()
+    return asyncio.run(main())
+
+
+def test_verify_token_releases_its_connection(db, user, checkouts):
+    token = token_for(user)
+    
+    assert verify(token) == [user.id]
+    assert checkouts == {"open": 0, "total": 1}
+    # Then the principal cache answers without a connection
+    assert verify(token) == [user.id]
+    assert checkouts == {"open": 0, "total": 1}
+
+
+def test_verify_token_rejects_inactive_users_and_bad_tokens(db, user, checkouts):
+    inactive = User(email="inactive@example.com", hashed_password="x", is_active=False)
+    db.add(inactive)
+    db.commit()
+    renamed = create_access_token({"sub": "old@example.com", "uid": user.id})
+    
+    assert verify(token_for(inactive), renamed, "not-a-token") == [None, None, None]
+    assert checkouts["open"] == 0
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import fakeredis
+import pytest
+from fastapi import status
+from app.config import settings
+from app.core.redis_client import stream_and_publish
+from app.websocket import manager as manager_module
+from app.websocket.manager import ConnectionManager
+
+USER_ID = 1
+
+
+class FakeSocket:
+    """Records the frames sent to it; `delay` makes it a slow consumer"""
+    
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.frames = []
+        self.closed = None
+    
+    async def send_json(self, frame):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(frame)
+    
+    async def close(self, code=None):
+        self.closed = code
+    
+    @property
+    def messages(self):
+        """Sent messages with batch frames unpacked"""
+        return [message for frame in self.frames for message in (frame["data"] if frame["type"] == "batch" else [frame])]
+
+
+@pytest.fixture
+def manager(redis, monkeypatch):
+    """A fresh ConnectionManager on the same fake Redis server as the blocking client"""
+    server = redis.connection_pool.connection_kwargs["server"]
+    monkeypatch.setattr(manager_module, "get_async_redis_client", lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+    return ConnectionManager()
+
+
+def run(manager, scenario):
+    """Run a coroutine, then unregister the manager's worker"""
+    async def main():
+        try:
+            return await scenario()
+        finally:
+            await manager.shutdown()
+    return asyncio.run(main())
+
+
+async def drained():
+    """Give the sender tasks time to flush their queues"""
+    await asyncio.sleep(0.2)
+
+
+def event(n):
+    return json.dumps({"id": f"event-{n}", "type": "tick", "data": {"n": n}})
+
+
+def test_redelivered_events_are_dropped(manager):
+    socket = FakeSocket()
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID)
+        await manager._dispatch(f"user:{USER_ID}", event(1))
+        await manager._dispatch(f"user:{USER_ID}", event(2))
+        # The outbox relay published event 1 again
+        await manager._dispatch(f"user:{USER_ID}", event(1))
+        await drained()
+    run(manager, scenario)
+    
+    assert [message["data"]["n"] for message in socket.messages] == [1, 2]
+    assert [message["id"] for message in socket.messages] == ["event-1", "event-2"]
+    assert manager.duplicates == 1
+
+
+def test_connections_are_subscribed_and_registered_per_user(manager, redis):
+    first, second = FakeSocket(), FakeSocket()
+    worker_key = manager.REGISTRY_WORKER_KEY.format(worker_id=manager.worker_id)
+    seen = {}
+    
+    async def scenario():
+        await manager.connect(first, USER_ID)
+        await manager.connect(second, USER_ID)
+        seen["connected"] = (set(manager.subscribed_users), redis.hgetall(worker_key), redis.hget(manager.REGISTRY_CONNECTIONS_KEY, manager.worker_id))
+        await manager.disconnect(first, USER_ID)
+        seen["one left"] = (set(manager.subscribed_users), redis.hgetall(worker_key))
+        await manager.disconnect(second, USER_ID)
+        seen["none left"] = (set(manager.subscribed_users), redis.hgetall(worker_key), redis.hget(manager.REGISTRY_CONNECTIONS_KEY, manager.worker_id))
+    run(manager, scenario)
+    
+    assert seen["connected"] == ({USER_ID}, {str(USER_ID): "2"}, "2")
+    assert seen["one left"] == ({USER_ID}, {str(USER_ID): "1"})
+    assert seen["none left"] == (set(), {}, "0")
+    # Shutting down removes the worker from the registry
+    assert redis.hget(manager.REGISTRY_CONNECTIONS_KEY, manager.worker_id) is None
+
+
+def test_published_events_reach_the_subscribed_user(manager, redis):
+    socket = FakeSocket()
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID)
+        redis.publish(f"user:{USER_ID + 1}", event(1))
+        redis.publish(f"user:{USER_ID}", event(2))
+        await asyncio.sleep(0.5)
+    run(manager, scenario)
+    
+    assert [message["data"]["n"] for message in socket.messages] == [2]
+
+
+def test_a_full_send_queue_drops_its_oldest_messages(manager):
+    socket = FakeSocket()
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID)
+        # Queued faster than the sender gets to run
+        for n in range(manager.SEND_QUEUE_SIZE + 5):
+            manager.send_to(socket, {"type": "tick", "data": {"n": n}})
+        await drained()
+    run(manager, scenario)
+    
+    assert [message["data"]["n"] for message in socket.messages] == list(range(5, manager.SEND_QUEUE_SIZE + 5))
+    assert manager.dropped == 5
+
+
+def test_events_for_users_connected_elsewhere_are_ignored(manager):
+    socket = FakeSocket()
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID)
+        await manager._dispatch(f"user:{USER_ID + 1}", event(1))
+        await manager._dispatch("user:not-a-user", event(2))
+        await manager._dispatch(f"user:{USER_ID}", event(3))
+        await drained()
+    run(manager, scenario)
+    
+    assert [message["data"]["n"] for message in socket.messages] == [3]
+
+
+def test_messages_queued_together_go_out_as_one_batch_frame(manager):
+    socket = FakeSocket()
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID)
+        for n in range(3):
+            manager.send_to(socket, {"type": "tick", "data": {"n": n}})
+        await drained()
+        manager.send_to(socket, {"type": "tick", "data": {"n": 3}})
+        await drained()
+    run(manager, scenario)
+    
+    assert [frame["type"] for frame in socket.frames] == ["batch", "tick"]
+    assert [message["data"]["n"] for message in socket.messages] == [0, 1, 2, 3]
+    assert (manager.frames, manager.delivered) == (2, 4)
+
+
+def test_a_send_timeout_drops_only_that_connection(manager, monkeypatch):
+    monkeypatch.setattr(settings, "WS_SEND_TIMEOUT_SECONDS", 0.05)
+    slow, fast = FakeSocket(delay=1), FakeSocket()
+    
+    async def scenario():
+        await manager.connect(slow, USER_ID)
+        await manager.connect(fast, USER_ID)
+        await manager._dispatch(f"user:{USER_ID}", event(1))
+        await drained()
+    run(manager, scenario)
+    
+    assert slow.closed == status.WS_1011_INTERNAL_ERROR and slow.frames == []
+    assert [message["data"]["n"] for message in fast.messages] == [1]
+    assert manager.active_connections == {USER_ID: {fast}}
+    assert manager.send_timeouts == 1
+
+
+def test_silent_connections_are_reaped(manager, monkeypatch):
+    monkeypatch.setattr(settings, "WS_PING_INTERVAL_SECONDS", 0.05)
+    monkeypatch.setattr(settings, "WS_IDLE_TIMEOUT_SECONDS", 0.2)
+    silent, chatty = FakeSocket(), FakeSocket()
+    
+    async def scenario():
+        await manager.connect(silent, USER_ID)
+        await manager.connect(chatty, USER_ID)
+        for _ in range(10):
+            await asyncio.sleep(0.05)
+            manager.touch(chatty)
+    run(manager, scenario)
+    
+    assert silent.closed == status.WS_1001_GOING_AWAY
+    assert chatty.closed is None and "ping" in [message["type"] for message in chatty.messages]
+    assert manager.active_connections == {USER_ID: {chatty}}
+    assert manager.reaped == 1
+
+
+def stream(redis, *ns):
+    """Append tick events to the user's stream; returns their cursors"""
+    return stream_and_publish(redis, [(f"user:{USER_ID}", {"id": f"event-{n}", "type": "tick", "data": {"n": n}}) for n in ns])
+
+
+def test_reconnecting_replays_missed_events_before_live_ones(manager, redis, monkeypatch):
+    cursors = stream(redis, 1, 2, 3)
+    socket = FakeSocket()
+    read_stream = manager.read_stream
+    
+    async def read_while_live(channel, cursor):
+        result = await read_stream(channel, cursor)
+        # Live events arriving while the stream is read: one it already covered, one newer
+        manager.send_to(socket, {"type": "tick", "data": {"n": 3}, "cursor": cursors[2]})
+        live = {"type": "tick", "data": {"n": 4}}
+        live_cursor = redis.xadd(f"stream:user:{USER_ID}", {"event": json.dumps(live)})
+        manager.send_to(socket, {**live, "cursor": live_cursor})
+        return result
+    monkeypatch.setattr(manager, "read_stream", read_while_live)
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID, last_event_id=cursors[0])
+        await drained()
+    run(manager, scenario)
+    
+    assert [message["data"]["n"] for message in socket.messages] == [2, 3, 4]
+    assert [message["cursor"] for message in socket.messages][:2] == cursors[1:]
+    assert manager.replayed == 2 and manager.resyncs == 0
+
+
+def test_reconnecting_at_the_latest_cursor_replays_nothing(manager, redis):
+    cursors = stream(redis, 1, 2)
+    socket = FakeSocket()
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID, last_event_id=cursors[-1])
+        await manager._dispatch(f"user:{USER_ID}", event(3))
+        await drained()
+    run(manager, scenario)
+    
+    assert [message["data"]["n"] for message in socket.messages] == [3]
+    assert manager.replayed == 0
+
+
+@pytest.mark.parametrize("case", ["trimmed", "expired", "malformed"])
+def test_a_cursor_that_cannot_be_replayed_gets_a_resync(manager, redis, case):
+    cursors = stream(redis, 1, 2, 3)
+    cursor = "not-a-cursor" if case == "malformed" else cursors[0]
+    if case == "trimmed":
+        redis.xtrim(f"stream:user:{USER_ID}", maxlen=1, approximate=False)
+    elif case == "expired":
+        redis.delete(f"stream:user:{USER_ID}")
+    socket = FakeSocket()
+    
+    async def scenario():
+        await manager.connect(socket, USER_ID, last_event_id=cursor)
+        await drained()
+    run(manager, scenario)
+    
+    assert [message["type"] for message in socket.messages] == ["resync"]
+    # The client resumes from the newest event after reloading its state
+    assert socket.messages[0].get("cursor") == (None if case == "expired" else cursors[-1])
+    assert manager.resyncs == 1 and manager.replayed == 0
@@ -1,4 +1,5 @@
 import React, { createContext, useContext, useEffect, useState, useRef } from 'react'
+import { useQueryClient } from '@tanstack/react-query'
 import { useAuth } from './AuthContext'
 
 const WebSocketContext = createContext()
@@ -16,13 +17,17 @@ export function WebSocketProvider({ children }) {
   const [events, setEvents] = useState([])
   const wsRef = useRef(null)
   const reconnectTimeoutRef = useRef(null)
+  // Stream position of the last event received, sent on reconnect to replay missed events
+  const cursorRef = useRef(null)
+  const queryClient = useQueryClient()
 
   useEffect(() => {
     if (!user) return
 
     const connect = () => {
       const token = localStorage.getItem('token')
-      const wsUrl = `${import.meta.env.VITE_WS_URL || 'ws://localhost:8000'}/ws?token=${token}`
+      const resume = cursorRef.current ? `&last_event_id=${cursorRef.current}` : ''
+      const wsUrl = `${import.meta.env.VITE_WS_URL || 'ws://localhost:8000'}/ws?token=${token}${resume}`
       
       const ws = new WebSocket(wsUrl)
       wsRef.current = ws
@@ -38,19 +43,40 @@ export function WebSocketProvider({ children }) {
       ws.onmessage = (event) => {
         try {
           const data = JSON.parse(event.data)
-          setEvents(prev => [...prev, data])
+          // Events queued close together arrive as one "batch" frame
+          const messages = data.type === 'batch' ? data.data : [data]
           
-          // Handle different event types
-          if (data.type === 'habit_at_risk') {
-            // Show notification
-            console.warn('Habit at risk:', data.data)
-          } else if (data.type === 'nudge') {
-            // Show nudge notification
-            console.info('Nudge:', data.data)
-          } else if (data.type === 'habit_logged') {
-            // Update UI with new streak
-            console.info('Habit logged:', data.data)
+          // Answer the server's keepalive ping so the socket is not reaped as idle
+          if (messages.some(message => message.type === 'ping')) {
+            ws.send(JSON.stringify({ type: 'pong' }))
+          }
+          
+          messages.forEach(message => {
+            if (message.cursor) cursorRef.current = message.cursor
+          })
+          
+          // Missed events are no longer available: reload everything instead
+          if (messages.some(message => message.type === 'resync')) {
+            queryClient.invalidateQueries()
           }
+          
+          const updates = messages.filter(message => !['ping', 'pong', 'resync'].includes(message.type))
+          if (updates.length === 0) return
+          setEvents(prev => [...prev, ...updates])
+          
+          // Handle different event types
+          updates.forEach(data => {
+            if (data.type === 'habit_at_risk') {
+              // Show notification
+              console.warn('Habit at risk:', data.data)
+            } else if (data.type === 'nudge') {
+              // Show nudge notification
+              console.info('Nudge:', data.data)
+            } else if (data.type === 'habit_logged') {
+              // Update UI with new streak
+              console.info('Habit logged:', data.data)
+            }
+          })
         } catch (error) {
           console.error('Error parsing WebSocket message:', error)
         }